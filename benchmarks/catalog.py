@@ -0,0 +1,58 @@
+import random
+from decimal import Decimal
+from django.db import transaction
+from cart.cache import bump_scope, category_scope, subcategory_scope, HOMEPAGE_SCOPE, TREE_SCOPE
+from cart.catalog_import import batches, suffixed_names
+from cart.models import CartObject, FinalProduct, ProductVariant, Sub1, final_product_search_vector
+
+# product names and specifications are built from these, search scenarios query them too
+WORDS = ('steel', 'brass', 'wood', 'screw', 'bolt', 'nut', 'washer', 'hinge', 'drill', 'blade',
+         'hammer', 'clamp', 'polish', 'glue', 'tape', 'chisel', 'file', 'saw', 'rivet', 'anchor')
+VARIANT_NAMES = ('small', 'medium', 'large', 'xl', 'pack of 10', 'pack of 50')
+
+
+def spread(total, over):
+    # parent index of every child, children are dealt round robin so every parent gets a share
+    return [i % over for i in range(total)]
+
+
+def generate_catalog(categories=10, subcategories=100, products=5000, variants=3, seed=0, batch_size=1000):
+    """
+    Insert `categories` CartObjects, `subcategories` Sub1s and `products` FinalProducts with up to
+    `variants` variants each. The same arguments and seed always give the same catalog.
+
+    Signals are bypassed like in CatalogImporter: names are suffixed here and search vectors
+    are updated per batch.
+    """
+    rng = random.Random(seed)
+    categories = max(categories, 1)
+    subcategories = max(subcategories, 1)
+
+    category_names = ['cat%04d' % i for i in range(categories)]
+    sub_names = suffixed_names(['sub%05d' % i for i in range(subcategories)],
+                               [category_names[i] for i in spread(subcategories, categories)])
+    with transaction.atomic():
+        CartObject.objects.bulk_create([CartObject(name=name) for name in category_names])
+        Sub1.objects.bulk_create([Sub1(name=name, link_id=category_names[parent])
+                                  for name, parent in zip(sub_names, spread(subcategories, categories))])
+
+    for batch in batches(enumerate(spread(products, subcategories)), batch_size):
+        links = [sub_names[parent] for _, parent in batch]
+        names = suffixed_names(['%s %s %d' % (rng.choice(WORDS), rng.choice(WORDS), i) for i, _ in batch], links)
+        with transaction.atomic():
+            created = FinalProduct.objects.bulk_create([
+                FinalProduct(name=name, link_id=link, model_no='BM-%d' % i,
+                             specification=rng.sample(WORDS, 3), photo='final_product/%s.png' % name)
+                for (i, _), name, link in zip(batch, names, links)])
+            ProductVariant.objects.bulk_create([
+                ProductVariant(product_id=product.pk, sub_category_id=product.link_id, name=name,
+                               price=Decimal(rng.randint(100, 500000)) / 100, stock=rng.choice((0, 5, 20, 100)),
+                               position=position)
+                for product in created for position, name in enumerate(VARIANT_NAMES[:rng.randint(1, variants) if variants else 0])])
+            FinalProduct.objects.filter(pk__in=[product.pk for product in created]) \
+                .update(search_vector=final_product_search_vector())
+
+    for scope in [HOMEPAGE_SCOPE, TREE_SCOPE] + [category_scope(name) for name in category_names] + \
+            [subcategory_scope(name) for name in sub_names]:
+        bump_scope(scope)
+    return {'categories': categories, 'subcategories': subcategories, 'products': products}
@@ -0,0 +1,73 @@
+import gzip
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client
+from django.test.utils import override_settings
+from rest_framework.renderers import JSONRenderer
+from cart.models import Sub1
+from medhistory.middleware import brotli
+from medhistory.renderers import MessagePackRenderer, ORJSONRenderer, msgpack
+from benchmarks.catalog import WORDS, generate_catalog
+
+
+def best_of(repeat, func):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        timings.append(time.perf_counter() - start)
+    return min(timings), result
+
+
+def catalog_urls():
+    sub1 = Sub1.objects.select_related('link').order_by('pk').first()
+    return (
+        ('homepage', '/cart/homepage/'),
+        ('category', '/cart/homepage/%s/' % sub1.link_id),
+        ('products', '/cart/homepage/%s/%s/?page_size=100' % (sub1.link_id, sub1.name)),
+        ('tree', '/cart/tree/?depth=3'),
+        ('search', '/cart/search/?q=%s&page_size=100' % WORDS[0]),
+    )
+
+
+class Command(BaseCommand):
+    help = ('Encode the data of every catalog endpoint with DRF\'s JSONRenderer, orjson and msgpack, '
+            'and report the encode times and the bytes sent plain, gzipped and with brotli')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--categories', type=int, default=20)
+        parser.add_argument('--subcategories', type=int, default=200)
+        parser.add_argument('--products', type=int, default=5000)
+        parser.add_argument('--repeat', type=int, default=20, help='the best of this many runs is reported')
+
+    def handle(self, *args, **options):
+        encoders = [('json', JSONRenderer()), ('orjson', ORJSONRenderer())]
+        if msgpack is not None:
+            encoders.append(('msgpack', MessagePackRenderer()))
+        else:
+            self.stderr.write('msgpack is not installed, skipping it')
+        if brotli is None:
+            self.stderr.write('brotli is not installed, skipping it')
+
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            with override_settings(ALLOWED_HOSTS=['testserver']):
+                generate_catalog(options['categories'], options['subcategories'], options['products'])
+                self.stdout.write('%-9s %-8s %9s %9s %9s %9s' % ('endpoint', 'format', 'encode ms', 'bytes',
+                                                               'gzip', 'br'))
+                for name, url in catalog_urls():
+                    data = Client().get(url).data
+                    expected = JSONRenderer().render(data)
+                    for format, renderer in encoders:
+                        encode, content = best_of(options['repeat'], lambda: renderer.render(data))
+                        if format == 'orjson' and content != expected:
+                            self.stderr.write('%s: orjson differs from the json renderer' % name)
+                        gzipped = len(gzip.compress(content, compresslevel=settings.COMPRESSION_GZIP_LEVEL))
+                        brotlied = len(brotli.compress(content, quality=settings.COMPRESSION_BROTLI_QUALITY)) \
+                            if brotli is not None else '-'
+                        self.stdout.write('%-9s %-8s %9.3f %9d %9d %9s' % (name, format, encode * 1000, len(content),
+                                                                           gzipped, brotlied))
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
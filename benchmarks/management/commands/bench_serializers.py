@@ -0,0 +1,62 @@
+import time
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import override_settings
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIRequestFactory
+from cart.models import CartObject, FinalProduct, Sub1
+from cart.serializers import CartObjectSerializer, Sub1Serializer, FinalProductSerializer, \
+    CartObjectValuesSerializer, Sub1ValuesSerializer, FinalProductValuesSerializer
+from benchmarks.catalog import generate_catalog
+
+CASES = (
+    ('CartObject', lambda: CartObject.objects.order_by('pk'), CartObjectSerializer, CartObjectValuesSerializer),
+    ('Sub1', lambda: Sub1.objects.order_by('pk'), Sub1Serializer, Sub1ValuesSerializer),
+    ('FinalProduct', lambda: FinalProduct.objects.order_by('pk').prefetch_related('variants'),
+     FinalProductSerializer, FinalProductValuesSerializer),
+)
+
+
+def best_of(repeat, func):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        timings.append(time.perf_counter() - start)
+    return min(timings), result
+
+
+class Command(BaseCommand):
+    help = ('Fetch and serialize N rows of every catalog list with the ModelSerializers and with the '
+            '.values() read path of the list views, and check both give the same json')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, nargs='+', default=[1000, 10000])
+        parser.add_argument('--repeat', type=int, default=3, help='the best of this many runs is reported')
+
+    def handle(self, *args, **options):
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            with override_settings(ALLOWED_HOSTS=['testserver']):
+                request = APIRequestFactory().get('/')
+                context = {'request': request}
+                self.stdout.write('%-13s %7s %14s %10s %8s' % ('list', 'rows', 'serializer ms', 'values ms',
+                                                                'speedup'))
+                for rows in options['rows']:
+                    CartObject.objects.all().delete()
+                    generate_catalog(categories=rows, subcategories=rows, products=rows)
+                    for name, queryset, serializer_class, values_serializer_class in CASES:
+                        before, expected = best_of(options['repeat'], lambda: serializer_class(
+                            list(queryset()), many=True, context=context).data)
+
+                        def lean():
+                            serializer = values_serializer_class(context=context)
+                            return serializer.represent(serializer.rows(queryset()))
+                        after, data = best_of(options['repeat'], lean)
+
+                        if JSONRenderer().render(data) != JSONRenderer().render(expected):
+                            self.stderr.write('%s: the json differs' % name)
+                        self.stdout.write('%-13s %7d %14.1f %10.1f %7.1fx' % (
+                            name, rows, before * 1000, after * 1000, before / after))
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
@@ -0,0 +1,118 @@
+import json
+import random
+import subprocess
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import override_settings
+from django.utils import timezone
+from braodcaster import backends
+from benchmarks.catalog import generate_catalog
+from benchmarks.runner import compare, run, summarize
+from benchmarks.scenarios import SCENARIOS
+
+
+def git_revision():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=settings.BASE_DIR, capture_output=True,
+                                text=True, check=True).stdout.strip()
+        dirty = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=settings.BASE_DIR,
+                               capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+    return commit, bool(dirty)
+
+
+class Command(BaseCommand):
+    help = ('Scripted browse, signup, otp verify and login requests against a generated catalog, '
+            'with stubbed sms/email providers. Reports requests/s, latency percentiles and sql '
+            'queries per endpoint and can save them as json to compare commits.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scenario', action='append', choices=list(SCENARIOS),
+                            help='run only these scenarios, can be repeated')
+        parser.add_argument('--requests', type=int, default=100, help='requests per endpoint')
+        parser.add_argument('--categories', type=int, default=10)
+        parser.add_argument('--subcategories', type=int, default=100)
+        parser.add_argument('--products', type=int, default=5000)
+        parser.add_argument('--variants', type=int, default=3, help='at most this many variants per product')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--cache', choices=('warm', 'cold'), default='warm',
+                            help='warm sends every catalog request once before measuring, cold never hits the cache')
+        parser.add_argument('--output', help='write the results to this json file')
+        parser.add_argument('--compare', help='json file of an earlier run to compare against')
+        parser.add_argument('--use-existing-db', action='store_true',
+                            help='run in the configured database instead of a throwaway one, it must be empty')
+
+    def handle(self, *args, **options):
+        old_name = None
+        if not options['use_existing_db']:
+            # a throwaway database, the benchmark creates a catalog and users
+            old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            # celery reads the django settings lazily, tasks run inline against the stub providers
+            with override_settings(ALLOWED_HOSTS=['testserver'], CELERY_TASK_ALWAYS_EAGER=True,
+                                   MAIL_BACKEND='braodcaster.backends.LocMemEmailBackend',
+                                   SMS_BACKEND='braodcaster.backends.LocMemSmsBackend'):
+                catalog = generate_catalog(options['categories'], options['subcategories'], options['products'],
+                                           options['variants'], seed=options['seed'])
+                results = self.run_scenarios(options)
+        finally:
+            backends.mail_outbox.clear()
+            backends.sms_outbox.clear()
+            if old_name is not None:
+                connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        commit, dirty = git_revision()
+        report = {
+            'commit': commit,
+            'dirty': dirty,
+            'created': timezone.now().isoformat(),
+            'config': dict(catalog, variants=options['variants'], seed=options['seed'],
+                           requests=options['requests'], cache=options['cache']),
+            'results': results,
+        }
+        self.print_results(results)
+        if options['compare']:
+            with open(options['compare']) as f:
+                self.print_comparison(json.load(f), report)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(report, f, indent=2)
+
+    def run_scenarios(self, options):
+        if options['cache'] == 'cold':
+            caches = dict(settings.CACHES, benchmark_cold={'BACKEND': 'django.core.cache.backends.dummy.DummyCache'})
+            with override_settings(CACHES=caches, CATALOG_CACHE_ALIAS='benchmark_cold'):
+                return self._run_scenarios(options)
+        return self._run_scenarios(options)
+
+    def _run_scenarios(self, options):
+        results = {}
+        for name in options['scenario'] or list(SCENARIOS):
+            scenario = SCENARIOS[name]
+            # every scenario gets its own random sequence so running a subset picks the same requests
+            rng = random.Random('%s:%s' % (options['seed'], name))
+            requests = scenario.setup(options['requests'], rng, cold=options['cache'] == 'cold')
+            samples = run(requests, warmup=scenario.replayable and options['cache'] == 'warm')
+            results[name] = {endpoint: summarize(endpoint_samples) for endpoint, endpoint_samples in samples.items()}
+        return results
+
+    def print_results(self, results):
+        self.stdout.write('%-28s %8s %8s %9s %9s %9s %8s %7s' % (
+            'endpoint', 'requests', 'rps', 'p50 ms', 'p95 ms', 'p99 ms', 'queries', 'errors'))
+        for scenario, endpoints in results.items():
+            for endpoint, stats in endpoints.items():
+                self.stdout.write('%-28s %8d %8s %9.2f %9.2f %9.2f %8.2f %7d' % (
+                    scenario + '/' + endpoint, stats['requests'], stats['rps'], stats['p50_ms'],
+                    stats['p95_ms'], stats['p99_ms'], stats['queries'], stats['errors']))
+
+    def print_comparison(self, baseline, report):
+        if baseline.get('config') != report['config']:
+            self.stdout.write(self.style.WARNING('the baseline was run with a different config: %s' %
+                                                 baseline.get('config')))
+        self.stdout.write('compared to %s' % (baseline.get('commit') or 'baseline'))
+        for scenario, endpoint, metric, before, after in compare(baseline['results'], report['results']):
+            change = '%+.1f%%' % ((after - before) / before * 100) if before else ''
+            self.stdout.write('%-28s %-8s %10s -> %-10s %8s' % (
+                scenario + '/' + endpoint, metric, before, after, change))
@@ -0,0 +1,41 @@
+import json
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from medhistory.slow_queries import plan_summary, read_samples, top_offenders
+
+
+class Command(BaseCommand):
+    help = 'Slowest queries sampled by medhistory/slow_queries.py, grouped by fingerprint, most total time first'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--log', default=None, help='defaults to settings.SLOW_QUERY_LOG')
+        parser.add_argument('--top', type=int, default=10)
+        parser.add_argument('--hours', type=float, default=None, help='only samples of the last hours')
+        parser.add_argument('--plans', action='store_true', help='print the latest plan of every query')
+        parser.add_argument('--json', action='store_true', help='print the groups as json')
+
+    def handle(self, *args, **options):
+        since = time.time() - options['hours'] * 3600 if options['hours'] else None
+        groups = top_offenders(read_samples(options['log'] or settings.SLOW_QUERY_LOG, since), options['top'])
+        if options['json']:
+            self.stdout.write(json.dumps(groups, indent=2))
+            return
+        if not groups:
+            self.stdout.write('no slow queries sampled')
+            return
+
+        for group in groups:
+            self.stdout.write('%s  %d samples, total %.0fms, mean %.1fms, max %.1fms' % (
+                group['fingerprint'], group['count'], group['total_ms'], group['mean_ms'], group['max_ms']))
+            self.stdout.write('  routes: %s' % (', '.join(group['routes']) or '-'))
+            self.stdout.write('  ' + group['sql'][:300])
+            if group['plan']:
+                summary = plan_summary(group['plan'])
+                self.stdout.write('  plan: %s, %s rows, %sms, buffers hit %s read %s%s' % (
+                    summary['node'], summary['rows'], summary['execution_ms'], summary['shared_hit'],
+                    summary['shared_read'],
+                    ', seq scan on ' + ', '.join(summary['seq_scans']) if summary['seq_scans'] else ''))
+                if options['plans']:
+                    self.stdout.write(json.dumps(group['plan'], indent=2))
+            self.stdout.write('')
@@ -0,0 +1,75 @@
+import statistics
+import time
+from collections import namedtuple, OrderedDict
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+
+# one scripted request, `endpoint` is the name results are grouped under
+Request = namedtuple('Request', 'endpoint method path data extra expect')
+
+
+def get(endpoint, path, data=None, expect=200, **extra):
+    return Request(endpoint, 'get', path, data, extra, expect)
+
+
+def post(endpoint, path, data, expect=200, **extra):
+    return Request(endpoint, 'post', path, data, extra, expect)
+
+
+def perform(client, request):
+    if request.method == 'get':
+        return client.get(request.path, request.data, **request.extra)
+    return client.post(request.path, request.data, content_type='application/json', **request.extra)
+
+
+def run(requests, warmup=False):
+    """
+    Send `requests` one after the other and return {endpoint: [(seconds, queries, ok), ...]}.
+    With `warmup` every request is sent once unmeasured first, only for requests that can be replayed.
+    """
+    client = Client()
+    if warmup:
+        for request in requests:
+            perform(client, request)
+    samples = OrderedDict()
+    for request in requests:
+        with CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            response = perform(client, request)
+            elapsed = time.perf_counter() - start
+        samples.setdefault(request.endpoint, []).append(
+            (elapsed, len(queries), response.status_code == request.expect))
+    return samples
+
+
+def summarize(samples):
+    latencies = sorted(seconds for seconds, _, _ in samples)
+    queries = [count for _, count, _ in samples]
+    quantiles = statistics.quantiles(latencies, n=100, method='inclusive') if len(latencies) > 1 else latencies * 99
+    return {
+        'requests': len(samples),
+        'errors': sum(1 for _, _, ok in samples if not ok),
+        # requests are sent one at a time, so this is the throughput of a single client
+        'rps': round(len(samples) / sum(latencies), 1) if sum(latencies) else None,
+        'mean_ms': round(statistics.mean(latencies) * 1000, 2),
+        'p50_ms': round(quantiles[49] * 1000, 2),
+        'p95_ms': round(quantiles[94] * 1000, 2),
+        'p99_ms': round(quantiles[98] * 1000, 2),
+        'queries': round(statistics.mean(queries), 2),
+        'queries_max': max(queries),
+    }
+
+
+def compare(baseline, results):
+    """
+    (scenario, endpoint, metric, before, after) for every figure found in both result files.
+    """
+    for scenario, endpoints in results.items():
+        for endpoint, stats in endpoints.items():
+            before = baseline.get(scenario, {}).get(endpoint)
+            if not before:
+                continue
+            for metric in ('rps', 'p50_ms', 'p95_ms', 'p99_ms', 'queries'):
+                if before.get(metric) is not None and stats.get(metric) is not None:
+                    yield scenario, endpoint, metric, before[metric], stats[metric]
@@ -0,0 +1,82 @@
+from collections import namedtuple, OrderedDict
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from cart.models import Sub1
+from user_signup import otp
+from user_signup.identity import user_identifiers
+from user_signup.models import LoginIdentifier, TempUser
+from .catalog import WORDS
+from .runner import get, post
+
+# `setup(count, rng, cold)` creates what the scenario needs and returns its requests,
+# only replayable scenarios can be sent once more to warm the caches
+Scenario = namedtuple('Scenario', 'setup replayable')
+
+PASSWORD = 'bench-password'
+
+
+def remote_addr(i):
+    # every request from its own address so the per ip otp throttle never kicks in
+    return '10.%d.%d.%d' % (i // 65536 % 256, i // 256 % 256, i % 256)
+
+
+def browse(count, rng, cold=False):
+    # cold runs against a catalog cache that never keeps anything, see run_benchmarks
+    subcategories = list(Sub1.objects.values_list('pk', 'link_id'))
+    requests = []
+    for i in range(count):
+        sub, category = rng.choice(subcategories)
+        requests += [
+            get('homepage', '/cart/homepage/'),
+            get('category', '/cart/homepage/%s/' % category),
+            get('products', '/cart/homepage/%s/%s/' % (category, sub)),
+            get('products_filtered', '/cart/homepage/%s/%s/' % (category, sub),
+                {'max_price': rng.choice((50, 500, 2500)), 'in_stock': 1}),
+            get('tree', '/cart/tree/', {'depth': 2}),
+            get('search', '/cart/search/', {'q': rng.choice(WORDS)}),
+        ]
+    return requests
+
+
+def signup(count, rng, cold=False):
+    requests = []
+    for i in range(count):
+        phone_number = '7' + str(i).zfill(9)
+        requests.append(post('signup', '/signup/signup/', {
+            'first_name': 'bench', 'last_name': 'user', 'phone_number': phone_number,
+            'email': phone_number + '@example.com', 'password': PASSWORD,
+        }, expect=201, REMOTE_ADDR=remote_addr(i)))
+    return requests
+
+
+def otp_verify(count, rng, cold=False):
+    phone_numbers = ['8' + str(i).zfill(9) for i in range(count)]
+    TempUser.objects.bulk_create([TempUser(first_name='bench', last_name='user', phone_number=phone_number,
+                                           email=phone_number + '@example.com', password=PASSWORD)
+                                  for phone_number in phone_numbers])
+    return [post('otp_verify', '/signup/phone_number/verify/',
+                 {'phone_number': phone_number, 'otp': otp.issue(otp.SIGNUP, phone_number)}, expect=202)
+            for phone_number in phone_numbers]
+
+
+def login(count, rng, cold=False):
+    # hashed once, the login requests still pay for checking it
+    password = make_password(PASSWORD)
+    users = User.objects.bulk_create([User(username='6' + str(i).zfill(9), password=password)
+                                      for i in range(count)])
+    LoginIdentifier.objects.bulk_create([LoginIdentifier(value=value, kind=kind, user=user)
+                                         for user in users for value, kind in user_identifiers(user).items()])
+    requests = []
+    for user in users:
+        requests.append(post('token', '/api/token/', {'username': user.username, 'password': PASSWORD}))
+        requests.append(post('otp_login', '/signup/otp/login/',
+                             {'username': user.username, 'otp': otp.issue(otp.ACCOUNT, user.pk)}, expect=202))
+    return requests
+
+
+SCENARIOS = OrderedDict([
+    ('browse', Scenario(browse, True)),
+    ('signup', Scenario(signup, False)),
+    ('otp_verify', Scenario(otp_verify, False)),
+    ('login', Scenario(login, False)),
+])
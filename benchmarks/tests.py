@@ -0,0 +1,128 @@
+import json
+import os
+import shutil
+import tempfile
+from io import StringIO
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db.models import F
+from django.test import Client, TransactionTestCase, override_settings
+from cart.models import CartObject, FinalProduct, ProductVariant, Sub1
+from cart.tests import create_catalog
+from medhistory import slow_queries
+from .catalog import generate_catalog
+
+
+class GenerateCatalogTest(TransactionTestCase):
+
+    def setUp(self):
+        cache.clear()
+
+    def test_counts_and_names(self):
+        generate_catalog(categories=3, subcategories=7, products=50, variants=2)
+        self.assertEqual(CartObject.objects.count(), 3)
+        self.assertEqual(Sub1.objects.count(), 7)
+        self.assertEqual(FinalProduct.objects.count(), 50)
+        # every parent gets children and names follow the suffix rule of the pre_save signals
+        self.assertFalse(CartObject.objects.filter(sub1__isnull=True).exists())
+        for sub in Sub1.objects.all():
+            self.assertTrue(sub.name.endswith('_' + sub.link_id))
+        for product in FinalProduct.objects.all():
+            self.assertTrue(product.name.endswith('_' + product.link_id))
+            self.assertIsNotNone(product.search_vector)
+        self.assertFalse(FinalProduct.objects.filter(variants__isnull=True).exists())
+        self.assertFalse(ProductVariant.objects.filter(position__gte=2).exists())
+
+    def test_same_seed_same_catalog(self):
+        def snapshot():
+            return list(FinalProduct.objects.order_by('model_no').values_list('name', 'link_id', 'specification')), \
+                list(ProductVariant.objects.order_by('product__model_no', 'position')
+                     .values_list('name', 'price', 'stock'))
+        generate_catalog(categories=2, subcategories=4, products=20, seed=3)
+        first = snapshot()
+        CartObject.objects.all().delete()
+        generate_catalog(categories=2, subcategories=4, products=20, seed=3)
+        self.assertEqual(snapshot(), first)
+
+
+class RunBenchmarksTest(TransactionTestCase):
+
+    def setUp(self):
+        cache.clear()
+
+    def test_results_are_saved_as_json(self):
+        fd, path = tempfile.mkstemp(suffix='.json')
+        os.close(fd)
+        self.addCleanup(os.remove, path)
+        out = StringIO()
+        call_command('run_benchmarks', use_existing_db=True, requests=3, categories=2, subcategories=4,
+                     products=20, output=path, stdout=out)
+
+        with open(path) as f:
+            report = json.load(f)
+        self.assertEqual(report['config']['products'], 20)
+        self.assertEqual(set(report['results']), {'browse', 'signup', 'otp_verify', 'login'})
+        self.assertEqual(set(report['results']['login']), {'token', 'otp_login'})
+        for endpoints in report['results'].values():
+            for stats in endpoints.values():
+                self.assertEqual(stats['errors'], 0)
+                self.assertEqual(stats['requests'], 3)
+                self.assertLessEqual(stats['p50_ms'], stats['p99_ms'])
+        # warmed lists are served from the cache
+        self.assertEqual(report['results']['browse']['homepage']['queries'], 0)
+        self.assertIn('browse/homepage', out.getvalue())
+
+        CartObject.objects.all().delete()
+        call_command('run_benchmarks', use_existing_db=True, requests=3, scenario=['browse'], categories=2,
+                     subcategories=4, products=20, compare=path, stdout=out)
+        self.assertIn('compared to', out.getvalue())
+
+
+class SlowQueryTest(TransactionTestCase):
+
+    def setUp(self):
+        cache.clear()
+        create_catalog()
+        self.dir = tempfile.mkdtemp()
+        self.log = os.path.join(self.dir, 'slow.jsonl')
+        self.addCleanup(shutil.rmtree, self.dir)
+
+    def samples(self):
+        slow_queries.wait()
+        return list(slow_queries.read_samples(self.log))
+
+    def test_normalize(self):
+        self.assertEqual(slow_queries.normalize("SELECT *  FROM t WHERE a = 'it''s' AND b IN (%s, %s, %s)\n"
+                                                "AND c > 10.5 LIMIT 21"),
+                         'SELECT * FROM t WHERE a = ? AND b IN (?) AND c > ? LIMIT ?')
+
+    def test_queries_over_the_threshold_are_explained_once(self):
+        route = 'cart/homepage/<str:prod_cat>/<str:product>/'
+        with override_settings(SLOW_QUERY_THRESHOLD=0, SLOW_QUERY_LOG=self.log):
+            Client().get('/cart/homepage/screw/wood_screw/?max_price=100')
+            samples = [sample for sample in self.samples() if sample['route'] == route]
+            self.assertTrue(samples)
+            plan = samples[0]['plan']
+            self.assertIn('Execution Time', plan)
+            self.assertIn('Shared Hit Blocks', plan['Plan'])
+
+            Client().get('/cart/homepage/screw/wood_screw/?max_price=200')
+            again = [sample for sample in self.samples() if sample['route'] == route][len(samples):]
+
+        # same fingerprints, no second explain
+        self.assertEqual([sample['fingerprint'] for sample in again], [sample['fingerprint'] for sample in samples])
+        self.assertEqual([sample['plan'] for sample in again], [None] * len(again))
+
+        out = StringIO()
+        call_command('slow_queries', log=self.log, stdout=out)
+        self.assertIn(samples[0]['fingerprint'], out.getvalue())
+        self.assertIn('plan: ', out.getvalue())
+        self.assertIn(route, out.getvalue())
+
+    def test_writes_are_not_executed(self):
+        with override_settings(SLOW_QUERY_THRESHOLD=0, SLOW_QUERY_LOG=self.log):
+            ProductVariant.objects.update(stock=F('stock') + 1)
+            samples = self.samples()
+        update = [sample for sample in samples if sample['sql'].startswith('UPDATE')][0]
+        self.assertNotIn('Execution Time', update['plan'])
+        self.assertEqual(ProductVariant.objects.get().stock, 6)
@@ -1,3 +1,27 @@
 from django.contrib import admin
+from . import campaigns
+from .models import Campaign
 
-# Register your models here.
+
+@admin.register(Campaign)
+class CampaignAdmin(admin.ModelAdmin):
+    list_display = ("name", "channel", "status", "recipients_total", "sent_count", "failed_count", "created",)
+    list_filter = ("status", "channel",)
+    readonly_fields = ("status", "created_by", "started", "finished", "recipients_total", "sent_count",
+                       "failed_count", "chunks_total", "chunks_done",)
+    actions = ("start_campaigns", "resume_campaigns",)
+
+    def save_model(self, request, obj, form, change):
+        if not change:
+            obj.created_by = request.user
+        super().save_model(request, obj, form, change)
+
+    def start_campaigns(self, request, queryset):
+        started = sum(campaigns.queue(campaign) for campaign in queryset)
+        self.message_user(request, '%d campaign(s) queued' % started)
+    start_campaigns.short_description = 'Send selected campaigns'
+
+    def resume_campaigns(self, request, queryset):
+        chunks = sum(campaigns.dispatch_pending(campaign.pk) for campaign in queryset.filter(status=Campaign.SENDING))
+        self.message_user(request, '%d chunk(s) queued again' % chunks)
+    resume_campaigns.short_description = 'Resume selected campaigns'
@@ -0,0 +1,253 @@
+import json
+import os
+import sys
+import threading
+from collections import namedtuple
+import requests
+from django.conf import settings
+from django.utils.module_loading import import_string
+from sendgrid.helpers.mail import Mail
+from twilio.rest import Client
+from medhistory.secrets import EmailToken, SmsToken
+from .ratelimit import get_bucket
+
+# one client per provider and worker process, created on first use and
+# re-created after a fork so processes never share a socket
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def pooled_client(name, factory):
+    key = (name, os.getpid())
+    client = _clients.get(key)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(key)
+            if client is None:
+                client = _clients[key] = factory()
+    return client
+
+
+def chunks(items, size):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def _recipients(value):
+    return [value] if isinstance(value, str) else list(value)
+
+
+# `failed` holds the recipients the provider refused for good, see is_refused
+Sent = namedtuple('Sent', 'calls failed')
+
+# statuses that blame the content of the request, that is its recipients. Any other error,
+# a bad api key (401), a suspended sender (403) or a too large payload (413) included, is
+# about the whole send and never narrowed down to recipients.
+REFUSED_STATUSES = (400, 422)
+
+
+def is_refused(error):
+    """
+    True when the provider refuses a recipient of the request (an invalid number, a rejected
+    address): sending it again can only fail again.
+    """
+    # requests' HTTPError carries the response, twilio's TwilioRestException the status
+    status = getattr(getattr(error, 'response', None), 'status_code', None)
+    if status is None:
+        status = getattr(error, 'status', None)
+    return status in REFUSED_STATUSES
+
+
+class SendInterrupted(Exception):
+    """
+    A send stopped half way, `remaining` holds the recipients that did not get the message yet
+    so a retry never sends twice to the others. `failed` are those refused for good before it stopped.
+    """
+
+    def __init__(self, message, remaining, failed=()):
+        super().__init__(message)
+        self.remaining = remaining
+        self.failed = list(failed)
+
+
+class Throttled(SendInterrupted):
+    def __init__(self, remaining, wait, failed=()):
+        super().__init__('rate limited, %d recipients left, retry in %.1fs' % (len(remaining), wait), remaining,
+                         failed)
+        self.wait = wait
+
+
+class SendFailed(SendInterrupted):
+    def __init__(self, remaining, error, failed=()):
+        super().__init__('%s, %d recipients left' % (error, len(remaining)), remaining, failed)
+        self.error = error
+
+
+class RateLimitMixin:
+    # key of settings.NOTIFICATION_RATE_LIMITS, None for backends that never leave the process
+    provider = None
+
+    def throttle(self, reserve):
+        """
+        Take a token for the next provider call, returns 0 or the seconds to wait for one.
+        `reserve` tokens are kept back in the bucket, bulk sends use it to leave room for otps.
+        """
+        bucket = get_bucket(self.provider) if self.provider else None
+        if bucket is None:
+            return 0
+        return bucket.take(reserve=reserve)
+
+
+class BaseBackend(RateLimitMixin):
+    # how many recipients one provider call can take
+    max_recipients = 1000
+
+    def deliver(self, recipients, send_batch, reserve):
+        """
+        Call `send_batch(batch)` for the recipients in batches of max_recipients, in order.
+
+        A batch the provider refuses for good is split in halves until the recipients it refuses
+        are found, those end up in the returned `failed` and the others still get the message.
+        Any other error, a rejected api key too, raises SendFailed, and an empty bucket Throttled,
+        with the recipients not handled yet.
+        """
+        calls, failed = 0, []
+        done = 0
+        pending = list(chunks(recipients, self.max_recipients))[::-1]
+        while pending:
+            batch = pending.pop()
+            wait = self.throttle(reserve)
+            if wait:
+                raise Throttled(recipients[done:], wait, failed)
+            calls += 1
+            try:
+                send_batch(batch)
+            except Exception as e:
+                if not is_refused(e):
+                    raise SendFailed(recipients[done:], e, failed)
+                if len(batch) > 1:
+                    middle = len(batch) // 2
+                    pending += [batch[middle:], batch[:middle]]
+                    continue
+                failed += batch
+            done += len(batch)
+        return Sent(calls, failed)
+
+
+# ----email----
+class BaseEmailBackend(BaseBackend):
+
+    def send(self, subject, content, recipients, reserve=0):
+        """
+        Send the same html mail to every recipient, each one only sees their own address.
+        Returns the number of provider calls made and the recipients refused for good.
+        """
+        return self.deliver(_recipients(recipients), lambda batch: self.send_batch(subject, content, batch),
+                            reserve)
+
+    def send_batch(self, subject, content, recipients):
+        raise NotImplementedError
+
+
+class SendGridEmailBackend(BaseEmailBackend):
+    provider = 'sendgrid'
+    # v3 mail/send takes up to 1000 personalizations per request
+    max_recipients = 1000
+
+    def session(self):
+        def create():
+            session = requests.Session()
+            session.headers['Authorization'] = 'Bearer ' + EmailToken.sendgrid_token
+            adapter = requests.adapters.HTTPAdapter(pool_maxsize=settings.NOTIFICATION_POOL_SIZE)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            return session
+        return pooled_client('sendgrid', create)
+
+    def send_batch(self, subject, content, recipients):
+        message = Mail(from_email=EmailToken.from_email, to_emails=recipients, subject=subject,
+                       html_content=content, is_multiple=True)
+        response = self.session().post(settings.SENDGRID_API_HOST + '/v3/mail/send', json=message.get(),
+                                       timeout=settings.NOTIFICATION_TIMEOUT)
+        response.raise_for_status()
+
+
+class ConsoleEmailBackend(BaseEmailBackend):
+    def send_batch(self, subject, content, recipients):
+        sys.stdout.write('mail to %s\nsubject: %s\n%s\n\n' % (', '.join(recipients), subject, content))
+
+
+# like django.core.mail.outbox, for tests
+mail_outbox = []
+
+
+class LocMemEmailBackend(BaseEmailBackend):
+    def send_batch(self, subject, content, recipients):
+        mail_outbox.append({'subject': subject, 'content': content, 'recipients': recipients})
+
+
+class FileEmailBackend(BaseEmailBackend):
+    def send_batch(self, subject, content, recipients):
+        with open(settings.NOTIFICATION_FILE_PATH, 'a') as f:
+            f.write(json.dumps({'type': 'email', 'subject': subject, 'content': content,
+                                'recipients': recipients}) + '\n')
+
+
+# ----sms----
+class BaseSmsBackend(BaseBackend):
+
+    def send(self, phone_numbers, content, reserve=0):
+        return self.deliver(_recipients(phone_numbers), lambda batch: self.send_batch(batch, content), reserve)
+
+    def send_batch(self, phone_numbers, content):
+        raise NotImplementedError
+
+
+class TwilioSmsBackend(BaseSmsBackend):
+    """
+    Twilio's messages api takes a single recipient, so every number is its own request
+    and rate limit token, but all of them go over the kept alive connections of one shared client.
+    """
+    provider = 'twilio'
+    max_recipients = 1
+
+    def client(self):
+        def create():
+            client = Client(SmsToken.sid_key, SmsToken.secret_key)
+            if settings.TWILIO_API_BASE_URL:
+                client.api.base_url = settings.TWILIO_API_BASE_URL
+            return client
+        return pooled_client('twilio', create)
+
+    def send_batch(self, phone_numbers, content):
+        client = self.client()
+        for phone_number in phone_numbers:
+            client.messages.create(to="+91" + phone_number, from_=SmsToken.phone_number, body=content)
+
+
+class ConsoleSmsBackend(BaseSmsBackend):
+    def send_batch(self, phone_numbers, content):
+        sys.stdout.write('sms to %s\n%s\n\n' % (', '.join(phone_numbers), content))
+
+
+sms_outbox = []
+
+
+class LocMemSmsBackend(BaseSmsBackend):
+    def send_batch(self, phone_numbers, content):
+        for phone_number in phone_numbers:
+            sms_outbox.append({'phone_number': phone_number, 'content': content})
+
+
+class FileSmsBackend(BaseSmsBackend):
+    def send_batch(self, phone_numbers, content):
+        with open(settings.NOTIFICATION_FILE_PATH, 'a') as f:
+            f.write(json.dumps({'type': 'sms', 'phone_numbers': phone_numbers, 'content': content}) + '\n')
+
+
+def get_mail_backend():
+    return import_string(settings.MAIL_BACKEND)()
+
+
+def get_sms_backend():
+    return import_string(settings.SMS_BACKEND)()
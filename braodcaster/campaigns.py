@@ -0,0 +1,200 @@
+from datetime import timedelta
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from .backends import get_mail_backend, get_sms_backend, SendInterrupted
+from .models import Campaign, CampaignChunk
+
+# usernames of phone signups are the 10 digit number, see user_signup.views.VerifyOtpView
+PHONE_USERNAME_REGEX = r'^[0-9]{10}$'
+
+
+class ChunkBusy(Exception):
+    def __init__(self, wait):
+        super().__init__('chunk is leased by another worker for %.1fs' % wait)
+        self.wait = wait
+
+
+def recipients(campaign):
+    users = User.objects.filter(is_active=True)
+    if campaign.channel == Campaign.EMAIL:
+        users = users.exclude(email='')
+    else:
+        users = users.filter(username__regex=PHONE_USERNAME_REGEX)
+    if campaign.audience == Campaign.EMAIL_VERIFIED:
+        users = users.filter(profile__email_verified=True)
+    return users
+
+
+def _address_field(campaign):
+    return 'email' if campaign.channel == Campaign.EMAIL else 'username'
+
+
+def _sender(campaign):
+    if campaign.channel == Campaign.EMAIL:
+        backend = get_mail_backend()
+        return backend.max_recipients, \
+            lambda addresses, reserve: backend.send(campaign.subject, campaign.content, addresses, reserve=reserve)
+    backend = get_sms_backend()
+    return backend.max_recipients, \
+        lambda addresses, reserve: backend.send(addresses, campaign.content, reserve=reserve)
+
+
+def queue(campaign):
+    """
+    Mark a draft campaign as queued and start its fan-out once that is committed.
+    Returns False when the campaign was already started.
+    """
+    from .tasks import start_campaign
+    if not Campaign.objects.filter(pk=campaign.pk, status=Campaign.DRAFT).update(status=Campaign.QUEUED):
+        return False
+    transaction.on_commit(lambda: start_campaign.delay(campaign.pk))
+    return True
+
+
+def fan_out(campaign_id, chunk_size=None):
+    """
+    Split the recipients into chunks of user primary key ranges and queue a task per chunk.
+
+    Only primary keys are streamed from a server side cursor and only one page of chunk rows
+    is held at a time, so memory does not grow with the number of users. The chunks are
+    created in one transaction with the campaign row locked: a crash rolls all of them back
+    and the redelivered task starts clean, a second fan-out waits and then finds it done.
+    """
+    chunk_size = chunk_size or settings.CAMPAIGN_CHUNK_SIZE
+    with transaction.atomic():
+        campaign = Campaign.objects.select_for_update().get(pk=campaign_id)
+        if campaign.status != Campaign.QUEUED:
+            return 0
+
+        pending, pks = [], []
+        chunks_total = recipients_total = 0
+        users = recipients(campaign).order_by('pk').values_list('pk', flat=True)
+        for pk in users.iterator(chunk_size=chunk_size):
+            pks.append(pk)
+            recipients_total += 1
+            if len(pks) == chunk_size:
+                pending.append(CampaignChunk(campaign=campaign, start_pk=pks[0], end_pk=pks[-1], size=len(pks)))
+                pks = []
+            if len(pending) == 100:
+                CampaignChunk.objects.bulk_create(pending)
+                chunks_total += len(pending)
+                pending = []
+        if pks:
+            pending.append(CampaignChunk(campaign=campaign, start_pk=pks[0], end_pk=pks[-1], size=len(pks)))
+        CampaignChunk.objects.bulk_create(pending)
+        chunks_total += len(pending)
+
+        campaign.status = Campaign.SENDING if chunks_total else Campaign.DONE
+        campaign.started = timezone.now()
+        campaign.finished = None if chunks_total else campaign.started
+        campaign.chunks_total = chunks_total
+        campaign.recipients_total = recipients_total
+        campaign.save(update_fields=['status', 'started', 'finished', 'chunks_total', 'recipients_total'])
+        transaction.on_commit(lambda: dispatch_pending(campaign_id))
+    return chunks_total
+
+
+def dispatch_pending(campaign_id):
+    """
+    Queue a task for every chunk not sent yet, used after the fan-out and to resume a campaign
+    whose tasks were lost. A chunk queued twice is sent once, see claim_chunk.
+    """
+    from .tasks import send_campaign_chunk
+    chunk_ids = CampaignChunk.objects.filter(campaign_id=campaign_id,
+                                             status__in=[CampaignChunk.PENDING, CampaignChunk.SENDING]) \
+        .values_list('pk', flat=True)
+    count = 0
+    for chunk_id in chunk_ids.iterator():
+        send_campaign_chunk.delay(chunk_id)
+        count += 1
+    return count
+
+
+def _lease():
+    return timezone.now() + timedelta(seconds=settings.CAMPAIGN_CHUNK_LEASE)
+
+
+def claim_chunk(chunk_id):
+    now = timezone.now()
+    return CampaignChunk.objects.filter(
+        Q(leased_until__isnull=True) | Q(leased_until__lt=now), pk=chunk_id,
+        status__in=[CampaignChunk.PENDING, CampaignChunk.SENDING],
+    ).update(status=CampaignChunk.SENDING, leased_until=_lease())
+
+
+def send_chunk(chunk_id, reserve=0):
+    """
+    Send a chunk one provider call at a time, saving progress after each call.
+
+    Recipients the provider refuses for good are counted as failed and passed over. Raises
+    ChunkBusy when another worker holds the chunk and lets the backend's Throttled / SendFailed
+    through with the lease released and the progress up to them saved, the caller decides when
+    to try again. Returns the number of recipients sent by this call.
+    """
+    if not claim_chunk(chunk_id):
+        chunk = CampaignChunk.objects.get(pk=chunk_id)
+        if chunk.status in (CampaignChunk.SENT, CampaignChunk.FAILED):
+            return 0
+        # the other worker may have released its lease since the claim, then try again in a second
+        leased_until = chunk.leased_until or timezone.now()
+        raise ChunkBusy(max((leased_until - timezone.now()).total_seconds(), 1))
+
+    chunk = CampaignChunk.objects.select_related('campaign').get(pk=chunk_id)
+    campaign = chunk.campaign
+    batch_size, send = _sender(campaign)
+    rows = list(recipients(campaign).filter(pk__gte=chunk.start_pk, pk__lte=chunk.end_pk,
+                                            pk__gt=chunk.last_sent_pk)
+                .order_by('pk').values_list('pk', _address_field(campaign)))
+
+    sent = 0
+    for i in range(0, len(rows), batch_size):
+        batch = rows[i:i + batch_size]
+        try:
+            failed = send([address for _, address in batch], reserve).failed
+        except SendInterrupted as e:
+            # the backend sends in order, what is not remaining was handled
+            handled = batch[:len(batch) - len(e.remaining)]
+            if handled:
+                _progress(chunk, handled[-1][0], len(handled) - len(e.failed), len(e.failed))
+            CampaignChunk.objects.filter(pk=chunk_id).update(leased_until=None)
+            raise
+        _progress(chunk, batch[-1][0], len(batch) - len(failed), len(failed))
+        sent += len(batch) - len(failed)
+    _finish(chunk, CampaignChunk.SENT)
+    return sent
+
+
+def fail_chunk(chunk_id):
+    """
+    Give up on the unsent rest of a chunk, it counts as failed and the campaign can finish.
+    """
+    chunk = CampaignChunk.objects.select_related('campaign').get(pk=chunk_id)
+    if chunk.status in (CampaignChunk.SENT, CampaignChunk.FAILED):
+        return
+    _finish(chunk, CampaignChunk.FAILED, failed=max(chunk.size - chunk.sent_count - chunk.failed_count, 0))
+
+
+def _progress(chunk, last_pk, count, failed=0):
+    with transaction.atomic():
+        CampaignChunk.objects.filter(pk=chunk.pk).update(last_sent_pk=last_pk, sent_count=F('sent_count') + count,
+                                                         failed_count=F('failed_count') + failed,
+                                                         leased_until=_lease())
+        Campaign.objects.filter(pk=chunk.campaign_id).update(sent_count=F('sent_count') + count,
+                                                             failed_count=F('failed_count') + failed)
+    chunk.sent_count += count
+    chunk.failed_count += failed
+
+
+def _finish(chunk, status, failed=0):
+    with transaction.atomic():
+        # only the worker that moves the chunk out of pending/sending counts it as done
+        if not CampaignChunk.objects.filter(pk=chunk.pk, status__in=[CampaignChunk.PENDING, CampaignChunk.SENDING]) \
+                .update(status=status, leased_until=None):
+            return
+        Campaign.objects.filter(pk=chunk.campaign_id).update(chunks_done=F('chunks_done') + 1,
+                                                             failed_count=F('failed_count') + failed)
+        Campaign.objects.filter(pk=chunk.campaign_id, status=Campaign.SENDING, chunks_done=F('chunks_total')) \
+            .update(status=Campaign.DONE, finished=timezone.now())
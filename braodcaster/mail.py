@@ -1,30 +1,9 @@
-from sendgrid import SendGridAPIClient
-from sendgrid.helpers.mail import Mail
 from django.utils.encoding import force_bytes
 from django.utils.http import urlsafe_base64_encode
 from user_signup.token import account_activation_token
-from medhistory.secrets import EmailToken
-import asyncio
+from .backends import get_mail_backend
 from .tasks import send_parallel_mail
 
-#async but not parallel
-async def sendmail(subject, content, to_email):
-    message = Mail(
-        from_email=EmailToken.from_email,
-        to_emails=to_email,
-        subject=subject,
-        html_content=content
-    )
-
-    try:
-
-        sg = SendGridAPIClient(EmailToken.sendgrid_token)
-        response = sg.send(message)
-        #print("mail send")
-    except Exception as e:
-        print("mail not send")
-        print(e)
-
 
 def MailVerification(user, current_site):
     domain = current_site.domain
@@ -41,7 +20,8 @@ def MailVerification(user, current_site):
 
 
 def PrepareEmail(subject, content, to_email):
-    loop = asyncio.new_event_loop()
-    asyncio.set_event_loop(loop)
-    loop.run_until_complete(sendmail(subject, content, to_email))
-    loop.close()
+    try:
+        get_mail_backend().send(subject, content, to_email)
+    except Exception as e:
+        print("mail not send")
+        print(e)
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+from braodcaster import queue_metrics
+
+
+def _fmt(seconds):
+    return '-' if seconds is None else '<=%gs' % seconds
+
+
+class Command(BaseCommand):
+    help = 'Enqueue to start latency of the celery queues, recorded by braodcaster.queue_metrics'
+
+    def add_arguments(self, parser):
+        parser.add_argument('queues', nargs='*', default=['otp', 'default', 'bulk'])
+        parser.add_argument('--reset', action='store_true', help='clear the histograms after printing')
+
+    def handle(self, *args, **options):
+        self.stdout.write('%-10s %10s %10s %10s %10s %10s' % ('queue', 'tasks', 'mean', 'p50', 'p95', 'p99'))
+        for queue in options['queues']:
+            summary = queue_metrics.latency_summary(queue)
+            mean = '-' if summary['mean'] is None else '%.3fs' % summary['mean']
+            self.stdout.write('%-10s %10d %10s %10s %10s %10s' % (
+                queue, summary['count'], mean, _fmt(summary['p50']), _fmt(summary['p95']), _fmt(summary['p99'])))
+            if options['reset']:
+                queue_metrics.reset(queue)
@@ -0,0 +1,42 @@
+import json
+from django.core.management.base import BaseCommand
+from medhistory import metrics
+from braodcaster import queue_metrics
+
+
+def _seconds(value, upper_bound=True):
+    if value is None:
+        return '-'
+    return '<=%gs' % value if upper_bound else '%.3fs' % value
+
+
+def _rate(value):
+    return '-' if value is None else '%.1f%%' % (value * 100)
+
+
+class Command(BaseCommand):
+    help = ('Runs, outcomes, queue wait and run time of every celery task per queue, '
+            'recorded by braodcaster.queue_metrics. --json prints the rows for dashboards.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--json', action='store_true')
+        parser.add_argument('--reset', action='store_true', help='clear the task metrics after printing')
+
+    def handle(self, *args, **options):
+        rows = queue_metrics.task_summary()
+        if options['json']:
+            self.stdout.write(json.dumps(rows, indent=2))
+        else:
+            self.stdout.write('%-44s %-8s %7s %8s %8s %9s %9s %9s %9s %9s %8s' % (
+                'task', 'queue', 'runs', 'failed', 'retried', 'wait p50', 'wait p95', 'run mean', 'run p95',
+                'run p99', 'attempts'))
+            for row in rows:
+                self.stdout.write('%-44s %-8s %7d %8s %8s %9s %9s %9s %9s %9s %8s' % (
+                    row['task'], row['queue'], row['runs'], _rate(row['failure_rate']), _rate(row['retry_rate']),
+                    _seconds(row['wait_p50']), _seconds(row['wait_p95']),
+                    _seconds(row['runtime_mean'], upper_bound=False), _seconds(row['runtime_p95']),
+                    _seconds(row['runtime_p99']),
+                    '-' if row['attempts_mean'] is None else '%.2f' % row['attempts_mean']))
+        if options['reset']:
+            metrics.reset([queue_metrics.QUEUE_WAIT, queue_metrics.RUNTIME, queue_metrics.ATTEMPTS,
+                           queue_metrics.RUNS])
@@ -0,0 +1,60 @@
+# Generated by Django 3.1.14 on 2026-10-18 11:21
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Campaign',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100)),
+                ('channel', models.CharField(choices=[('email', 'email'), ('sms', 'sms')], default='email', max_length=10)),
+                ('audience', models.CharField(choices=[('all', 'all active users'), ('email_verified', 'users with a verified email')], default='all', max_length=20)),
+                ('subject', models.CharField(blank=True, max_length=200)),
+                ('content', models.TextField()),
+                ('status', models.CharField(choices=[('draft', 'draft'), ('queued', 'queued'), ('sending', 'sending'), ('done', 'done')], default='draft', max_length=10)),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('started', models.DateTimeField(blank=True, editable=False, null=True)),
+                ('finished', models.DateTimeField(blank=True, editable=False, null=True)),
+                ('recipients_total', models.PositiveIntegerField(default=0, editable=False)),
+                ('sent_count', models.PositiveIntegerField(default=0, editable=False)),
+                ('failed_count', models.PositiveIntegerField(default=0, editable=False)),
+                ('chunks_total', models.PositiveIntegerField(default=0, editable=False)),
+                ('chunks_done', models.PositiveIntegerField(default=0, editable=False)),
+                ('created_by', models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='CampaignChunk',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('start_pk', models.PositiveIntegerField()),
+                ('end_pk', models.PositiveIntegerField()),
+                ('size', models.PositiveIntegerField()),
+                ('last_sent_pk', models.PositiveIntegerField(default=0)),
+                ('sent_count', models.PositiveIntegerField(default=0)),
+                ('failed_count', models.PositiveIntegerField(default=0)),
+                ('status', models.CharField(choices=[('pending', 'pending'), ('sending', 'sending'), ('sent', 'sent'), ('failed', 'failed')], default='pending', max_length=10)),
+                ('leased_until', models.DateTimeField(blank=True, null=True)),
+                ('campaign', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='chunks', to='braodcaster.campaign')),
+            ],
+            options={
+                'ordering': ['campaign', 'start_pk'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='campaignchunk',
+            constraint=models.UniqueConstraint(fields=('campaign', 'start_pk'), name='campaign_chunk_start_uniq'),
+        ),
+    ]
@@ -1,3 +1,83 @@
+from django.contrib.auth.models import User
 from django.db import models
 
-# Create your models here.
+
+class Campaign(models.Model):
+    EMAIL = 'email'
+    SMS = 'sms'
+    CHANNEL_CHOICES = (
+        (EMAIL, 'email'),
+        (SMS, 'sms'),
+    )
+    ALL_USERS = 'all'
+    EMAIL_VERIFIED = 'email_verified'
+    AUDIENCE_CHOICES = (
+        (ALL_USERS, 'all active users'),
+        (EMAIL_VERIFIED, 'users with a verified email'),
+    )
+    DRAFT = 'draft'
+    QUEUED = 'queued'
+    SENDING = 'sending'
+    DONE = 'done'
+    STATUS_CHOICES = (
+        (DRAFT, 'draft'),
+        (QUEUED, 'queued'),
+        (SENDING, 'sending'),
+        (DONE, 'done'),
+    )
+
+    name = models.CharField(max_length=100)
+    channel = models.CharField(max_length=10, choices=CHANNEL_CHOICES, default=EMAIL)
+    audience = models.CharField(max_length=20, choices=AUDIENCE_CHOICES, default=ALL_USERS)
+    subject = models.CharField(max_length=200, blank=True)
+    content = models.TextField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=DRAFT)
+    created_by = models.ForeignKey(User, null=True, blank=True, on_delete=models.SET_NULL, editable=False)
+    created = models.DateTimeField(auto_now_add=True)
+    started = models.DateTimeField(null=True, blank=True, editable=False)
+    finished = models.DateTimeField(null=True, blank=True, editable=False)
+    # progress, only ever changed with F() so concurrent chunk tasks can not lose updates
+    recipients_total = models.PositiveIntegerField(default=0, editable=False)
+    sent_count = models.PositiveIntegerField(default=0, editable=False)
+    failed_count = models.PositiveIntegerField(default=0, editable=False)
+    chunks_total = models.PositiveIntegerField(default=0, editable=False)
+    chunks_done = models.PositiveIntegerField(default=0, editable=False)
+
+    def __str__(self):
+        return self.name
+
+
+class CampaignChunk(models.Model):
+    """
+    A range of user primary keys of a campaign, sent by one task. `last_sent_pk` moves
+    forward after every provider call so a chunk picked up again after a crash goes on
+    where it stopped instead of starting over.
+    """
+    PENDING = 'pending'
+    SENDING = 'sending'
+    SENT = 'sent'
+    FAILED = 'failed'
+    STATUS_CHOICES = (
+        (PENDING, 'pending'),
+        (SENDING, 'sending'),
+        (SENT, 'sent'),
+        (FAILED, 'failed'),
+    )
+
+    campaign = models.ForeignKey(Campaign, on_delete=models.CASCADE, related_name='chunks')
+    start_pk = models.PositiveIntegerField()
+    end_pk = models.PositiveIntegerField()
+    size = models.PositiveIntegerField()
+    last_sent_pk = models.PositiveIntegerField(default=0)
+    sent_count = models.PositiveIntegerField(default=0)
+    # recipients the provider refused for good, they are not retried
+    failed_count = models.PositiveIntegerField(default=0)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    # a worker owns the chunk until then, so a resumed task can not send alongside a live one
+    leased_until = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['campaign', 'start_pk']
+        constraints = [
+            models.UniqueConstraint(fields=['campaign', 'start_pk'], name='campaign_chunk_start_uniq'),
+        ]
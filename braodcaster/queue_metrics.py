@@ -0,0 +1,122 @@
+import time
+from datetime import datetime
+from celery.signals import before_task_publish, task_prerun, task_postrun, worker_process_shutdown, worker_shutdown
+from medhistory import metrics
+
+# Every task run is recorded per task name and queue in the metrics shared with the web tier,
+# see medhistory/metrics.py: the time it waited in the queue, how long it ran, its outcome
+# (success, failure, retry, ...) and how many runs it took.
+
+# upper bounds in seconds of the enqueue -> start latency histogram, the last bucket is +Inf
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+RUNTIME_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+ATTEMPT_BUCKETS = (1, 2, 3, 5, 9)
+
+QUEUE_WAIT = metrics.Histogram('celery_task_queue_wait_seconds', 'Time from publish until a worker starts the task.',
+                               ('task', 'queue'), buckets=LATENCY_BUCKETS)
+RUNTIME = metrics.Histogram('celery_task_runtime_seconds', 'Time a worker spends running the task.',
+                            ('task', 'queue'), buckets=RUNTIME_BUCKETS)
+ATTEMPTS = metrics.Histogram('celery_task_attempts', 'Runs a task took until it succeeded or gave up.',
+                             ('task', 'queue'), buckets=ATTEMPT_BUCKETS, scale=1)
+RUNS = metrics.Counter('celery_task_runs', 'Task runs by outcome.', ('task', 'queue', 'outcome'))
+
+
+def _queue(request):
+    return (request.delivery_info or {}).get('routing_key') or 'default'
+
+
+def record_latency(queue, seconds, task='unknown'):
+    QUEUE_WAIT.observe(seconds, task, queue)
+
+
+def _merge(histogram, series):
+    merged = dict.fromkeys(histogram.fields(), 0)
+    for values in series:
+        for field, value in values.items():
+            merged[field] += value
+    return merged
+
+
+def latency_summary(queue):
+    metrics.flush()
+    values = _merge(QUEUE_WAIT, [values for (_, series_queue), values in QUEUE_WAIT.read().items()
+                                 if series_queue == queue])
+    total = QUEUE_WAIT.count(values)
+    summary = {'queue': queue, 'count': total,
+               'mean': values['sum'] / QUEUE_WAIT.scale / total if total else None}
+    for name, quantile in (('p50', 0.5), ('p95', 0.95), ('p99', 0.99)):
+        summary[name] = QUEUE_WAIT.quantile(values, quantile)
+    return summary
+
+
+def reset(queue):
+    metrics.reset([QUEUE_WAIT], where=lambda labels: labels['queue'] == queue)
+
+
+def task_summary():
+    """
+    One row per task name and queue, for the task_metrics command and dashboards.
+    """
+    metrics.flush()
+    wait, runtime, attempts = QUEUE_WAIT.read(), RUNTIME.read(), ATTEMPTS.read()
+    outcomes = {}
+    for (task, queue, outcome), values in RUNS.read().items():
+        outcomes.setdefault((task, queue), {})[outcome] = values['value']
+
+    rows = []
+    for key in sorted(set(wait) | set(runtime) | set(outcomes)):
+        runs = outcomes.get(key, {})
+        total = sum(runs.values())
+        row = {'task': key[0], 'queue': key[1], 'runs': total, 'outcomes': runs,
+               'failure_rate': runs.get('failure', 0) / total if total else None,
+               'retry_rate': runs.get('retry', 0) / total if total else None}
+        for prefix, histogram, series in (('wait', QUEUE_WAIT, wait), ('runtime', RUNTIME, runtime)):
+            values = series.get(key)
+            count = histogram.count(values) if values else 0
+            row[prefix + '_mean'] = values['sum'] / histogram.scale / count if count else None
+            for name, quantile in (('p50', 0.5), ('p95', 0.95), ('p99', 0.99)):
+                row['%s_%s' % (prefix, name)] = histogram.quantile(values, quantile) if count else None
+        values = attempts.get(key)
+        count = ATTEMPTS.count(values) if values else 0
+        row['attempts_mean'] = values['sum'] / count if count else None
+        rows.append(row)
+    return rows
+
+
+@before_task_publish.connect
+def stamp_enqueue_time(headers=None, **kwargs):
+    if headers is not None:
+        headers.setdefault('enqueued_at', time.time())
+
+
+@task_prerun.connect
+def task_started(task=None, **kwargs):
+    request = task.request
+    request.started_at = time.perf_counter()
+    enqueued_at = getattr(request, 'enqueued_at', None)
+    if enqueued_at is None or request.is_eager:
+        return
+    # a countdown is wanted delay, not queue time
+    if request.eta:
+        eta = datetime.fromisoformat(request.eta) if isinstance(request.eta, str) else request.eta
+        enqueued_at = max(enqueued_at, eta.timestamp())
+    record_latency(_queue(request), max(0.0, time.time() - enqueued_at), task.name)
+
+
+@task_postrun.connect
+def task_finished(task=None, state=None, **kwargs):
+    request = task.request
+    queue = _queue(request)
+    started_at = getattr(request, 'started_at', None)
+    if started_at is not None:
+        RUNTIME.observe(time.perf_counter() - started_at, task.name, queue)
+    outcome = (state or 'unknown').lower()
+    RUNS.inc(task.name, queue, outcome)
+    if outcome != 'retry':
+        ATTEMPTS.observe(request.retries + 1, task.name, queue)
+
+
+@worker_process_shutdown.connect
+@worker_shutdown.connect
+def flush_metrics(**kwargs):
+    metrics.flush()
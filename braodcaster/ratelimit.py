@@ -0,0 +1,54 @@
+import time
+from django.conf import settings
+from django.core.cache import caches
+
+
+def get_ratelimit_cache():
+    return caches[settings.NOTIFICATION_RATE_LIMIT_CACHE_ALIAS]
+
+
+class TokenBucket:
+    """
+    Token bucket shared by every worker through the cache, built on incr/decr only
+    so it stays atomic on redis without a lua script.
+
+    The cache holds how many tokens were ever taken, the clock says how many were
+    minted since the epoch, the difference is what is left in the bucket. Races
+    between workers can only make it stricter, never let more calls through.
+    """
+
+    def __init__(self, name, rate, capacity):
+        self.key = 'ratelimit:' + name
+        self.rate = rate
+        self.capacity = capacity
+
+    def take(self, tokens=1, reserve=0):
+        """
+        Take `tokens` if at least `reserve` tokens stay in the bucket afterwards.
+        Returns 0 on success, otherwise the seconds to wait before trying again.
+        """
+        cache = get_ratelimit_cache()
+        minted = int(time.time() * self.rate)
+        cache.add(self.key, minted - self.capacity, timeout=None)
+        try:
+            taken = cache.incr(self.key, tokens)
+        except ValueError:
+            # evicted between add and incr
+            cache.add(self.key, minted - self.capacity + tokens, timeout=None)
+            taken = minted - self.capacity + tokens
+
+        left = minted - taken
+        if left < reserve:
+            cache.decr(self.key, tokens)
+            return max(reserve - left, 1) / self.rate
+        if left > self.capacity - tokens:
+            # the bucket was idle, tokens above its size are lost
+            cache.incr(self.key, left - self.capacity + tokens)
+        return 0
+
+
+def get_bucket(provider):
+    if provider not in settings.NOTIFICATION_RATE_LIMITS:
+        return None
+    rate, capacity = settings.NOTIFICATION_RATE_LIMITS[provider]
+    return TokenBucket(provider, rate, capacity)
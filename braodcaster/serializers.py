@@ -0,0 +1,15 @@
+from rest_framework import serializers
+from .models import Campaign
+
+
+class CampaignSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Campaign
+        fields = ['id', 'name', 'channel', 'audience', 'subject', 'content', 'status', 'created', 'started',
+                  'finished', 'recipients_total', 'sent_count', 'failed_count', 'chunks_total', 'chunks_done']
+        read_only_fields = ['status']
+
+    def validate(self, attrs):
+        if attrs.get('channel', Campaign.EMAIL) == Campaign.EMAIL and not attrs.get('subject'):
+            raise serializers.ValidationError({'subject': 'An email campaign needs a subject.'})
+        return attrs
@@ -1,25 +1,95 @@
+import logging
 from celery import shared_task
-from sendgrid import SendGridAPIClient
-from sendgrid.helpers.mail import Mail
-from medhistory.secrets import EmailToken
+from celery.utils.time import get_exponential_backoff_interval
+from django.conf import settings
+from .backends import get_mail_backend, get_sms_backend, Throttled, SendFailed
+from . import campaigns
+from . import queue_metrics  # noqa: connects the queue latency signals for every task
 
+logger = logging.getLogger(__name__)
 
-@shared_task
-def send_parallel_mail(subject, content, to_email):
-    message = Mail(
-        from_email=EmailToken.from_email,
-        to_emails=to_email,
-        subject=subject,
-        html_content=content
-    )
+# otp and verification tasks are routed to the "otp" queue, the bulk ones to "bulk",
+# see CELERY_TASK_ROUTES
+RETRY_OPTIONS = {
+    'bind': True,
+    'max_retries': 8,
+    'acks_late': True,
+}
 
+
+def _backoff(task):
+    return get_exponential_backoff_interval(factor=settings.NOTIFICATION_RETRY_BACKOFF, retries=task.request.retries,
+                                            maximum=settings.NOTIFICATION_RETRY_BACKOFF_MAX, full_jitter=True)
+
+
+def _report_failed(task, failed):
+    if failed:
+        logger.warning('%s: %d recipients refused by the provider, not retried: %s', task.name, len(failed),
+                       ', '.join(failed))
+
+
+def _deliver(task, send, args, recipients_index, reserve=0):
+    """
+    Runs `send(*args)`. When the provider rate limit is hit the unsent recipients are
+    queued again once the bucket refills, that is not a failure and not a retry. Transient
+    provider errors are retried for the unsent recipients with exponential backoff, recipients
+    the provider refuses for good are logged and left out.
+    """
     try:
+        _report_failed(task, send(*args, reserve=reserve).failed)
+    except Throttled as e:
+        _report_failed(task, e.failed)
+        args = list(args)
+        args[recipients_index] = e.remaining
+        task.apply_async(args=args, countdown=e.wait)
+    except SendFailed as e:
+        _report_failed(task, e.failed)
+        if task.request.retries >= task.max_retries:
+            logger.error('%s: giving up after %d retries, %d recipients not sent: %s', task.name,
+                         task.request.retries, len(e.remaining), ', '.join(e.remaining))
+        args = list(args)
+        args[recipients_index] = e.remaining
+        raise task.retry(args=args, exc=e.error, countdown=_backoff(task))
+
+
+# to_email can be one address or a list, the backend batches the list into as few calls as it can
+@shared_task(**RETRY_OPTIONS)
+def send_parallel_mail(self, subject, content, to_email):
+    _deliver(self, get_mail_backend().send, (subject, content, to_email), 2)
+
 
-        sg = SendGridAPIClient(EmailToken.sendgrid_token)
-        response = sg.send(message)
-        #print("mail send")
-    except Exception as e:
-        #print("mail not send")
-        print(e)
+@shared_task(**RETRY_OPTIONS)
+def send_sms(self, phone_number, content):
+    _deliver(self, get_sms_backend().send, (phone_number, content), 0)
 
 
+# bulk sends leave NOTIFICATION_BULK_RESERVE tokens in the bucket for otps
+@shared_task(**RETRY_OPTIONS)
+def send_bulk_mail(self, subject, content, recipients):
+    _deliver(self, get_mail_backend().send, (subject, content, recipients), 2,
+             reserve=settings.NOTIFICATION_BULK_RESERVE)
+
+
+@shared_task(**RETRY_OPTIONS)
+def send_bulk_sms(self, phone_numbers, content):
+    _deliver(self, get_sms_backend().send, (phone_numbers, content), 0,
+             reserve=settings.NOTIFICATION_BULK_RESERVE)
+
+
+# campaigns, see braodcaster/campaigns.py
+@shared_task(acks_late=True)
+def start_campaign(campaign_id):
+    return campaigns.fan_out(campaign_id)
+
+
+@shared_task(**RETRY_OPTIONS)
+def send_campaign_chunk(self, chunk_id):
+    try:
+        return campaigns.send_chunk(chunk_id, reserve=settings.NOTIFICATION_BULK_RESERVE)
+    except (campaigns.ChunkBusy, Throttled) as e:
+        self.apply_async(args=[chunk_id], countdown=e.wait)
+    except SendFailed as e:
+        if self.request.retries >= self.max_retries:
+            campaigns.fail_chunk(chunk_id)
+            return 0
+        raise self.retry(exc=e.error, countdown=_backoff(self))
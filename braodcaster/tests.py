@@ -1,3 +1,412 @@
-from django.test import TestCase
+import json
+import re
+import threading
+import time
+from io import StringIO
+from unittest import mock
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+import requests
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import transaction
+from django.test import Client, SimpleTestCase, TransactionTestCase, override_settings
+from rest_framework.test import APIClient
+from user_signup import otp
+from user_signup.models import TempUser
+from medhistory import metrics
+from . import backends, campaigns, queue_metrics, tasks
+from .models import Campaign, CampaignChunk
+from .ratelimit import TokenBucket
 
-# Create your tests here.
+
+class OtpSmsTest(TransactionTestCase):
+
+    def setUp(self):
+        backends.sms_outbox.clear()
+        cache.clear()
+
+    def test_sms_is_queued_after_commit(self):
+        with transaction.atomic():
+            TempUser.objects.create(first_name='a', last_name='b', phone_number='9999999999', password='x')
+            self.assertEqual(backends.sms_outbox, [])
+
+        self.assertEqual(len(backends.sms_outbox), 1)
+        self.assertEqual(backends.sms_outbox[0]['phone_number'], '9999999999')
+        code = re.search(r'\d{6}', backends.sms_outbox[0]['content']).group()
+        self.assertEqual(otp.check(otp.SIGNUP, '9999999999', code), otp.VALID)
+
+    def test_nothing_is_sent_on_rollback(self):
+        try:
+            with transaction.atomic():
+                TempUser.objects.create(first_name='a', last_name='b', phone_number='9999999999', password='x')
+                raise ValueError
+        except ValueError:
+            pass
+        self.assertEqual(backends.sms_outbox, [])
+
+
+class FakeProviderHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        super().setup()
+        self.server.connections += 1
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        self.server.requests.append((self.path, body))
+        payload = b'{"sid": "SM1", "status": "queued"}'
+        status = 202 if self.path.endswith('/mail/send') else 201
+        # a request naming a refused recipient gets a 400, one naming an unlucky one a 503
+        for statuses, error in ((self.server.refused, 400), (self.server.unavailable, 503)):
+            if any(recipient.encode() in body for recipient in statuses):
+                payload = b'{"code": 21211, "message": "refused", "status": %d}' % error
+                status = error
+        if self.server.unauthorized:
+            payload = b'{"code": 20003, "message": "authenticate", "status": 401}'
+            status = 401
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+class ProviderBackendTest(SimpleTestCase):
+
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), FakeProviderHandler)
+        self.server.requests = []
+        self.server.connections = 0
+        self.server.refused = self.server.unavailable = ()
+        self.server.unauthorized = False
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.url = 'http://127.0.0.1:%d' % self.server.server_address[1]
+        backends._clients.clear()
+        self.addCleanup(backends._clients.clear)
+
+    def test_sendgrid_batches_recipients(self):
+        recipients = ['user%d@example.com' % i for i in range(2500)]
+        with override_settings(SENDGRID_API_HOST=self.url):
+            sent = backends.SendGridEmailBackend().send('hi', '<p>hello</p>', recipients)
+
+        self.assertEqual(sent, (3, []))
+        self.assertEqual(len(self.server.requests), 3)
+        sent = [p['to'][0]['email'] for _, body in self.server.requests
+                for p in json.loads(body)['personalizations']]
+        self.assertEqual(sorted(sent), sorted(recipients))
+        self.assertEqual(self.server.connections, 1)
+
+    def test_twilio_reuses_one_connection(self):
+        with override_settings(TWILIO_API_BASE_URL=self.url):
+            backends.TwilioSmsBackend().send(['9000000001', '9000000002', '9000000003'], 'hello')
+            backends.TwilioSmsBackend().send('9000000004', 'hello')
+
+        self.assertEqual(len(self.server.requests), 4)
+        self.assertEqual(parse_qs(self.server.requests[0][1].decode())['To'], ['+919000000001'])
+        self.assertEqual(self.server.connections, 1)
+
+    def sent_numbers(self):
+        return [parse_qs(body.decode())['To'][0][3:] for _, body in self.server.requests]
+
+    def test_numbers_refused_for_good_are_skipped(self):
+        self.server.refused = ['9000000002']
+        numbers = ['9000000001', '9000000002', '9000000003']
+        with override_settings(TWILIO_API_BASE_URL=self.url):
+            self.assertEqual(backends.TwilioSmsBackend().send(numbers, 'hello'), (3, ['9000000002']))
+
+            # a bulk send neither retries it nor stops at it
+            with override_settings(SMS_BACKEND='braodcaster.backends.TwilioSmsBackend'), \
+                    mock.patch.object(tasks.send_bulk_sms, 'retry') as retry, \
+                    self.assertLogs('braodcaster.tasks', 'WARNING') as logs:
+                tasks.send_bulk_sms.apply(args=[numbers + ['9000000004'], 'hello'])
+        retry.assert_not_called()
+        self.assertEqual(self.sent_numbers(), numbers + numbers + ['9000000004'])
+        self.assertIn('1 recipients refused by the provider, not retried: 9000000002', logs.output[0])
+
+    def test_transient_errors_stop_the_send(self):
+        self.server.unavailable = ['9000000002']
+        with override_settings(TWILIO_API_BASE_URL=self.url):
+            with self.assertRaises(backends.SendFailed) as e:
+                backends.TwilioSmsBackend().send(['9000000001', '9000000002', '9000000003'], 'hello')
+        self.assertEqual(e.exception.remaining, ['9000000002', '9000000003'])
+        self.assertEqual(self.sent_numbers(), ['9000000001', '9000000002'])
+
+    def test_sendgrid_batch_is_split_to_find_refused_addresses(self):
+        recipients = ['user%d@example.com' % i for i in range(20)]
+        self.server.refused = ['user13@example.com']
+        with override_settings(SENDGRID_API_HOST=self.url), \
+                mock.patch.object(backends.SendGridEmailBackend, 'max_recipients', 10):
+            sent = backends.SendGridEmailBackend().send('hi', '<p>hello</p>', recipients)
+
+        self.assertEqual(sent.failed, ['user13@example.com'])
+        delivered = [p['to'][0]['email'] for _, body in self.server.requests
+                     for p in json.loads(body)['personalizations'] if b'user13@' not in body]
+        self.assertEqual(sorted(delivered), sorted(r for r in recipients if r != 'user13@example.com'))
+        # the first 10 at once, the refused 10 -> 5 + 5, 5 -> 2 + 3, 3 -> 1 + 2, 2 -> 1 + 1
+        self.assertEqual(sent.calls, len(self.server.requests))
+        self.assertEqual(sent.calls, 10)
+
+    def test_rejected_api_key_fails_the_whole_send(self):
+        self.server.unauthorized = True
+        recipients = ['user%d@example.com' % i for i in range(20)]
+        with override_settings(SENDGRID_API_HOST=self.url), \
+                mock.patch.object(backends.SendGridEmailBackend, 'max_recipients', 10):
+            with self.assertRaises(backends.SendFailed) as e:
+                backends.SendGridEmailBackend().send('hi', '<p>hello</p>', recipients)
+
+        # no batch is split to look for refused recipients, nobody is given up on
+        self.assertEqual(len(self.server.requests), 1)
+        self.assertEqual((e.exception.remaining, e.exception.failed), (recipients, []))
+
+
+class TokenBucketTest(SimpleTestCase):
+
+    def setUp(self):
+        cache.clear()
+
+    def test_burst_then_throttle(self):
+        bucket = TokenBucket('test', rate=1, capacity=3)
+        with mock.patch('time.time', return_value=1000.0):
+            self.assertEqual([bucket.take() for _ in range(3)], [0, 0, 0])
+            self.assertEqual(bucket.take(), 1)
+        with mock.patch('time.time', return_value=1001.0):
+            self.assertEqual(bucket.take(), 0)
+            self.assertEqual(bucket.take(), 1)
+
+    def test_idle_bucket_does_not_grow_past_capacity(self):
+        bucket = TokenBucket('test', rate=1, capacity=2)
+        with mock.patch('time.time', return_value=1000.0):
+            bucket.take()
+        with mock.patch('time.time', return_value=5000.0):
+            self.assertEqual([bucket.take() for _ in range(3)], [0, 0, 1])
+
+    def test_reserve_is_left_for_others(self):
+        bucket = TokenBucket('test', rate=1, capacity=3)
+        with mock.patch('time.time', return_value=1000.0):
+            self.assertEqual(bucket.take(reserve=2), 0)
+            self.assertEqual(bucket.take(reserve=2), 1)
+            self.assertEqual(bucket.take(), 0)
+            self.assertEqual(bucket.take(), 0)
+
+
+@override_settings(NOTIFICATION_RATE_LIMITS={'twilio': (1, 2)})
+class ThrottledDeliveryTest(SimpleTestCase):
+
+    def setUp(self):
+        cache.clear()
+
+    def test_only_unsent_numbers_are_queued_again(self):
+        sent = []
+        backend = backends.TwilioSmsBackend()
+        numbers = ['1', '2', '3', '4']
+        with mock.patch.object(backends.TwilioSmsBackend, 'send_batch',
+                               side_effect=lambda batch, content: sent.extend(batch) or 1), \
+                mock.patch.object(tasks.send_bulk_sms, 'apply_async') as apply_async, \
+                mock.patch('time.time', return_value=1000.0):
+            tasks._deliver(tasks.send_bulk_sms, backend.send, (numbers, 'hi'), 0)
+
+        self.assertEqual(sent, ['1', '2'])
+        apply_async.assert_called_once_with(args=[['3', '4'], 'hi'], countdown=1)
+
+
+class QueueLatencyTest(SimpleTestCase):
+
+    def setUp(self):
+        queue_metrics.reset('test')
+
+    def test_summary(self):
+        for seconds in [0.01] * 90 + [0.3] * 8 + [400] * 2:
+            queue_metrics.record_latency('test', seconds)
+        summary = queue_metrics.latency_summary('test')
+        self.assertEqual(summary['count'], 100)
+        self.assertEqual(summary['p50'], 0.05)
+        self.assertEqual(summary['p95'], 0.5)
+        self.assertIsNone(summary['p99'])
+        self.assertAlmostEqual(summary['mean'], (0.01 * 90 + 0.3 * 8 + 800) / 100, places=2)
+
+    def test_command(self):
+        queue_metrics.record_latency('test', 0.2)
+        out = StringIO()
+        call_command('queue_latency', 'test', '--reset', stdout=out)
+        self.assertIn('test', out.getvalue())
+        self.assertEqual(queue_metrics.latency_summary('test')['count'], 0)
+
+
+class TaskMetricsTest(TransactionTestCase):
+
+    def setUp(self):
+        cache.clear()
+        metrics.reset()
+        backends.sms_outbox.clear()
+
+    def row(self, task):
+        return [row for row in queue_metrics.task_summary() if row['task'] == task.name][0]
+
+    def test_success(self):
+        tasks.send_sms.delay('9999999999', 'hi')
+        tasks.send_sms.delay('9999999998', 'hi')
+        row = self.row(tasks.send_sms)
+        self.assertEqual(row['runs'], 2)
+        self.assertEqual(row['outcomes'], {'success': 2})
+        self.assertEqual(row['failure_rate'], 0)
+        self.assertEqual(row['attempts_mean'], 1)
+        self.assertIsNotNone(row['runtime_p50'])
+        # eager runs never waited in a queue
+        self.assertIsNone(row['wait_p50'])
+
+    def test_retries_and_failure(self):
+        with mock.patch.object(backends.LocMemSmsBackend, 'send_batch', side_effect=RuntimeError('down')), \
+                mock.patch.object(tasks, '_backoff', return_value=0), \
+                self.assertLogs('braodcaster.tasks', 'ERROR') as logs:
+            tasks.send_sms.delay('9999999999', 'hi')
+        self.assertIn('giving up after 8 retries, 1 recipients not sent: 9999999999', logs.output[0])
+        row = self.row(tasks.send_sms)
+        retries = tasks.send_sms.max_retries
+        self.assertEqual(row['outcomes'], {'retry': retries, 'failure': 1})
+        self.assertEqual(row['runs'], retries + 1)
+        self.assertEqual(row['attempts_mean'], retries + 1)
+
+        body = Client().get('/metrics').content.decode()
+        self.assertIn('celery_task_runs_total{task="braodcaster.tasks.send_sms",queue="default",outcome="failure"} 1',
+                      body)
+
+        out = StringIO()
+        call_command('task_metrics', '--reset', stdout=out)
+        self.assertIn('braodcaster.tasks.send_sms', out.getvalue())
+        self.assertEqual(queue_metrics.task_summary(), [])
+
+    def test_queue_wait_of_a_worker_run(self):
+        task = mock.Mock(request=mock.Mock(is_eager=False, eta=None, enqueued_at=time.time() - 2, retries=0,
+                                           delivery_info={'routing_key': 'otp'}))
+        task.name = 'braodcaster.tasks.send_sms'
+        queue_metrics.task_started(task=task)
+        queue_metrics.task_finished(task=task, state='SUCCESS')
+        row = self.row(task)
+        self.assertEqual(row['queue'], 'otp')
+        self.assertEqual(row['wait_p50'], 2.5)
+        self.assertEqual(row['outcomes'], {'success': 1})
+
+
+@override_settings(CAMPAIGN_CHUNK_SIZE=10)
+class CampaignTest(TransactionTestCase):
+
+    def setUp(self):
+        backends.mail_outbox.clear()
+        backends.sms_outbox.clear()
+        self.users = [User.objects.create_user(username='90000000%02d' % i, email='user%d@example.com' % i)
+                      for i in range(25)]
+        User.objects.filter(pk=self.users[3].pk).update(is_active=False)
+        self.admin = User.objects.create_user(username='admin', is_staff=True)
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def sent_emails(self):
+        return sorted(email for mail in backends.mail_outbox for email in mail['recipients'])
+
+    def expected_emails(self):
+        return sorted(user.email for user in self.users if user != self.users[3])
+
+    def test_campaign_is_sent_in_chunks(self):
+        response = self.client.post('/broadcast/campaigns/', {'name': 'sale', 'subject': 'sale',
+                                                              'content': '<p>50% off</p>'}, format='json')
+        self.assertEqual(response.status_code, 201)
+        response = self.client.post('/broadcast/campaigns/%d/start/' % response.data['id'])
+        self.assertEqual(response.status_code, 202)
+
+        campaign = Campaign.objects.get()
+        self.assertEqual(campaign.status, Campaign.DONE)
+        self.assertEqual((campaign.recipients_total, campaign.sent_count, campaign.failed_count), (24, 24, 0))
+        self.assertEqual((campaign.chunks_total, campaign.chunks_done), (3, 3))
+        self.assertEqual(self.sent_emails(), self.expected_emails())
+        self.assertEqual(self.client.post('/broadcast/campaigns/%d/start/' % campaign.pk).status_code, 409)
+
+    def test_sms_campaign_skips_non_phone_usernames(self):
+        campaign = Campaign.objects.create(name='sale', channel=Campaign.SMS, content='50% off')
+        campaigns.queue(campaign)
+        self.assertEqual(len(backends.sms_outbox), 24)
+        self.assertNotIn('admin', [sms['phone_number'] for sms in backends.sms_outbox])
+
+    def test_campaigns_are_listed_newest_first(self):
+        for name in ('old', 'new'):
+            Campaign.objects.create(name=name, subject=name, content='50% off')
+        self.assertEqual([c['name'] for c in self.client.get('/broadcast/campaigns/').data], ['new', 'old'])
+
+    def test_only_staff_can_manage_campaigns(self):
+        self.client.force_authenticate(self.users[0])
+        self.assertEqual(self.client.get('/broadcast/campaigns/').status_code, 403)
+
+    def test_resume_after_failure_does_not_send_twice(self):
+        campaign = Campaign.objects.create(name='sale', subject='sale', content='50% off', status=Campaign.QUEUED)
+        with mock.patch.object(campaigns, 'dispatch_pending'):
+            self.assertEqual(campaigns.fan_out(campaign.pk), 3)
+        chunk = campaign.chunks.first()
+
+        calls = []
+
+        def fail_third(subject, content, recipients):
+            calls.append(recipients)
+            if len(calls) == 3:
+                raise RuntimeError('provider down')
+            backends.mail_outbox.append({'recipients': recipients})
+
+        with mock.patch.object(backends.LocMemEmailBackend, 'max_recipients', 3), \
+                mock.patch.object(backends.LocMemEmailBackend, 'send_batch', side_effect=fail_third):
+            with self.assertRaises(backends.SendFailed):
+                campaigns.send_chunk(chunk.pk)
+        chunk.refresh_from_db()
+        self.assertEqual((chunk.status, chunk.sent_count, chunk.leased_until), (CampaignChunk.SENDING, 6, None))
+
+        self.assertEqual(campaigns.dispatch_pending(campaign.pk), 3)
+        campaign.refresh_from_db()
+        self.assertEqual(campaign.status, Campaign.DONE)
+        self.assertEqual(campaign.sent_count, 24)
+        self.assertEqual(self.sent_emails(), self.expected_emails())
+
+    def test_refused_recipient_in_the_middle_of_a_chunk(self):
+        campaign = Campaign.objects.create(name='sale', subject='sale', content='50% off')
+        refused = self.users[5].email
+        response = requests.Response()
+        response.status_code = 400
+
+        def send_batch(subject, content, recipients):
+            if refused in recipients:
+                raise requests.HTTPError('400 invalid email', response=response)
+            backends.mail_outbox.append({'recipients': recipients})
+
+        with mock.patch.object(backends.LocMemEmailBackend, 'max_recipients', 4), \
+                mock.patch.object(backends.LocMemEmailBackend, 'send_batch', side_effect=send_batch), \
+                mock.patch.object(tasks.send_campaign_chunk, 'retry') as retry:
+            campaigns.queue(campaign)
+
+        retry.assert_not_called()
+        campaign.refresh_from_db()
+        self.assertEqual(campaign.status, Campaign.DONE)
+        self.assertEqual((campaign.sent_count, campaign.failed_count), (23, 1))
+        self.assertEqual(self.sent_emails(), [email for email in self.expected_emails() if email != refused])
+        chunk = campaign.chunks.get(start_pk__lte=self.users[5].pk, end_pk__gte=self.users[5].pk)
+        self.assertEqual((chunk.status, chunk.sent_count, chunk.failed_count), (CampaignChunk.SENT, 9, 1))
+
+    def test_leased_chunk_is_not_sent_twice(self):
+        campaign = Campaign.objects.create(name='sale', subject='sale', content='50% off', status=Campaign.QUEUED)
+        with mock.patch.object(campaigns, 'dispatch_pending'):
+            campaigns.fan_out(campaign.pk)
+        chunk = campaign.chunks.first()
+        self.assertTrue(campaigns.claim_chunk(chunk.pk))
+        with self.assertRaises(campaigns.ChunkBusy):
+            campaigns.send_chunk(chunk.pk)
+        self.assertEqual(backends.mail_outbox, [])
+
+        # the lease is released between the failed claim and the look at the chunk
+        CampaignChunk.objects.filter(pk=chunk.pk).update(leased_until=None)
+        with mock.patch.object(campaigns, 'claim_chunk', return_value=0), \
+                self.assertRaises(campaigns.ChunkBusy) as e:
+            campaigns.send_chunk(chunk.pk)
+        self.assertEqual(e.exception.wait, 1)
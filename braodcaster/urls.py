@@ -0,0 +1,11 @@
+from django.urls import path
+from .views import CampaignListView, CampaignDetailView, CampaignStartView, CampaignResumeView
+
+app_name = 'braodcaster'
+
+urlpatterns = [
+    path('campaigns/', CampaignListView.as_view(), name='campaigns'),
+    path('campaigns/<int:pk>/', CampaignDetailView.as_view(), name='campaign'),
+    path('campaigns/<int:pk>/start/', CampaignStartView.as_view(), name='campaign_start'),
+    path('campaigns/<int:pk>/resume/', CampaignResumeView.as_view(), name='campaign_resume'),
+]
@@ -1,3 +1,45 @@
-from django.shortcuts import render
+from django.shortcuts import get_object_or_404
+from rest_framework import generics, status
+from rest_framework.permissions import IsAdminUser
+from rest_framework.response import Response
+from rest_framework.views import APIView
+from . import campaigns
+from .models import Campaign
+from .serializers import CampaignSerializer
 
-# Create your views here.
+
+class CampaignListView(generics.ListCreateAPIView):
+    queryset = Campaign.objects.order_by('-created')
+    serializer_class = CampaignSerializer
+    permission_classes = (IsAdminUser,)
+
+    def perform_create(self, serializer):
+        serializer.save(created_by=self.request.user)
+
+
+class CampaignDetailView(generics.RetrieveAPIView):
+    queryset = Campaign.objects.all()
+    serializer_class = CampaignSerializer
+    permission_classes = (IsAdminUser,)
+
+
+class CampaignStartView(APIView):
+    permission_classes = (IsAdminUser,)
+
+    def post(self, request, pk):
+        campaign = get_object_or_404(Campaign, pk=pk)
+        if not campaigns.queue(campaign):
+            return Response('campaign already started', status=status.HTTP_409_CONFLICT)
+        campaign.refresh_from_db()
+        return Response(CampaignSerializer(campaign).data, status=status.HTTP_202_ACCEPTED)
+
+
+# queues the unsent chunks again, for tasks lost with their broker message
+class CampaignResumeView(APIView):
+    permission_classes = (IsAdminUser,)
+
+    def post(self, request, pk):
+        campaign = get_object_or_404(Campaign, pk=pk)
+        if campaign.status != Campaign.SENDING:
+            return Response('campaign is not sending', status=status.HTTP_409_CONFLICT)
+        return Response({'queued_chunks': campaigns.dispatch_pending(campaign.pk)}, status=status.HTTP_202_ACCEPTED)
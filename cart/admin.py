@@ -12,7 +12,19 @@ class Sub1Admin(admin.ModelAdmin):
 admin.site.register(CartObject)
 
 
+class ProductVariantInline(admin.TabularInline):
+    model = ProductVariant
+    extra = 1
+
+
 @admin.register(FinalProduct)
 class MyModelAdmin(admin.ModelAdmin, DynamicArrayMixin):
     list_display = ("name", "link", "model_no",)
     list_filter = ("link",)
+    inlines = (ProductVariantInline,)
+
+
+@admin.register(StockReservation)
+class StockReservationAdmin(admin.ModelAdmin):
+    list_display = ("variant", "quantity", "status", "expires_at",)
+    list_filter = ("status",)
@@ -0,0 +1,44 @@
+from django.http import HttpResponseNotAllowed
+from medhistory.async_support import negotiated_response, run_blocking
+from .cache import CachedListMixin, get_catalog_cache, response_cache_key
+from .views import HomePageView, Sub1View, FinalProductView, CatalogTreeView, ProductSearchView
+
+# async fronts of the catalog list views for the asgi urls (medhistory/urls_async.py). A cache
+# hit is answered without a thread hop for the view, a miss (or a request for the browsable api)
+# runs the sync view on the bounded I/O pool of medhistory.async_support, where it fills the
+# cache like it does under wsgi.
+
+
+def _render(view, request, kwargs):
+    response = view(request, **kwargs)
+    response.render()
+    return response
+
+
+def _cached_data(scope, request, query):
+    return get_catalog_cache().get(response_cache_key(scope, request, query))
+
+
+def async_list_view(view_class):
+    sync_view = view_class.as_view()
+    cached = issubclass(view_class, CachedListMixin)
+
+    async def view(request, **kwargs):
+        if request.method not in ('GET', 'HEAD'):
+            return HttpResponseNotAllowed(['GET', 'HEAD'])
+        scope = view_class(kwargs=kwargs).get_cache_scope() if cached else None
+        if scope is not None:
+            data = await run_blocking(_cached_data, scope, request, view_class.get_cache_query(request))
+            response = negotiated_response(request, data) if data is not None else None
+            if response is not None:
+                response['X-Cache'] = 'HIT'
+                return response
+        return await run_blocking(_render, sync_view, request, kwargs)
+    return view
+
+
+homepage = async_list_view(HomePageView)
+product_category = async_list_view(Sub1View)
+individual_product = async_list_view(FinalProductView)
+catalog_tree = async_list_view(CatalogTreeView)
+product_search = async_list_view(ProductSearchView)
@@ -0,0 +1,112 @@
+import hashlib
+import time
+from urllib.parse import urlencode
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from rest_framework.response import Response
+
+# every cached list belongs to a scope, a scope is invalidated by bumping its
+# version so stale entries are simply never read again and expire on their own
+HOMEPAGE_SCOPE = 'homepage'
+TREE_SCOPE = 'tree'
+
+
+def category_scope(cart_object_pk):
+    return 'category:' + str(cart_object_pk)
+
+
+def subcategory_scope(sub1_pk):
+    return 'subcategory:' + str(sub1_pk)
+
+
+def get_catalog_cache():
+    return caches[settings.CATALOG_CACHE_ALIAS]
+
+
+def _digest(value):
+    return hashlib.md5(value.encode('utf-8')).hexdigest()
+
+
+def _version_key(scope):
+    return 'catalog:version:' + _digest(scope)
+
+
+def get_scope_version(scope):
+    cache = get_catalog_cache()
+    key = _version_key(scope)
+    version = cache.get(key)
+    if version is None:
+        # start from the clock so a lost version key can never bring back an older version
+        cache.add(key, int(time.time() * 1000), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def bump_scope(scope):
+    cache = get_catalog_cache()
+    key = _version_key(scope)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, int(time.time() * 1000), timeout=None)
+
+
+def invalidate_on_commit(*scopes):
+    # bump only after the write is visible, otherwise a concurrent request could
+    # cache the old rows under the new version
+    def bump():
+        for scope in scopes:
+            bump_scope(scope)
+    transaction.on_commit(bump)
+
+
+def cache_url(request, query):
+    """
+    The url with only the (name, value) pairs of `query`, so sending parameters the view ignores
+    can not fill the cache with copies of the same response.
+    """
+    query = urlencode(sorted(query))
+    return request.build_absolute_uri(request.path) + ('?' + query if query else '')
+
+
+def response_cache_key(scope, request, query):
+    version = get_scope_version(scope)
+    return 'catalog:response:%s:%s:%s' % (_digest(scope), version, _digest(cache_url(request, query)))
+
+
+class CachedListMixin:
+    """
+    Caches the data of a list view per scope, host, path and the `cache_query_params` it reads.
+    A response to a url with other parameters is served from the cache but never stored, the
+    pagination links in it would carry them.
+    """
+    cache_scope = None
+    cache_query_params = ('cursor', 'page_size')
+
+    def get_cache_scope(self):
+        return self.cache_scope
+
+    @classmethod
+    def get_cache_query(cls, request):
+        # (name, value) pairs the response is cached under, views map spellings of a value to one
+        return [(name, request.GET[name]) for name in cls.cache_query_params if name in request.GET]
+
+    def list(self, request, *args, **kwargs):
+        scope = self.get_cache_scope()
+        if scope is None:
+            return super().list(request, *args, **kwargs)
+
+        cache = get_catalog_cache()
+        key = response_cache_key(scope, request, self.get_cache_query(request))
+        data = cache.get(key)
+        if data is not None:
+            response = Response(data)
+            response['X-Cache'] = 'HIT'
+            return response
+
+        response = super().list(request, *args, **kwargs)
+        if response.status_code == 200 and set(request.GET) <= set(self.cache_query_params):
+            cache.set(key, response.data, timeout=settings.CATALOG_CACHE_TIMEOUT)
+        response['X-Cache'] = 'MISS'
+        return response
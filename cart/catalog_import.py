@@ -0,0 +1,202 @@
+import csv
+import json
+import re
+from decimal import Decimal
+from itertools import islice, zip_longest
+from django.db import connection, transaction
+from psycopg2.extras import execute_values
+from .cache import bump_scope, subcategory_scope, TREE_SCOPE
+from .models import FinalProduct, ProductVariant, Sub1, final_product_search_vector
+
+# csv columns, list values are separated by "|" like the old array fields:
+# subcategory,name,model_no,specification,photo,types,prices,stock
+LIST_SEPARATOR = '|'
+
+
+def _split(value):
+    return [item.strip() for item in value.split(LIST_SEPARATOR)] if value else []
+
+
+class InvalidRow(ValueError):
+    pass
+
+
+def parse_price(value):
+    # "₹1,299.50" is 1299.50, None when there is no number or more than one ("12.5.0", "N/A")
+    numbers = re.findall(r'[0-9]+(?:\.[0-9]+)?', str(value if value is not None else '').replace(',', ''))
+    if len(numbers) != 1:
+        return None
+    return Decimal(numbers[0]).quantize(Decimal('0.01'))
+
+
+def parse_stock(value):
+    value = re.sub(r'[^0-9]', '', str(value or ''))
+    return int(value) if value else 0
+
+
+def parse_variants(variants):
+    parsed = []
+    for position, variant in enumerate(variants or []):
+        price = parse_price(variant.get('price'))
+        if price is None:
+            raise InvalidRow('price %r of variant %d is not a number' % (variant.get('price'), position))
+        parsed.append({'name': variant.get('name') or 'NULL', 'price': price,
+                       'stock': parse_stock(variant.get('stock'))})
+    return parsed
+
+
+def read_csv(f):
+    for row in csv.DictReader(f):
+        variants = zip_longest(_split(row.get('types')), _split(row.get('prices')), _split(row.get('stock')))
+        yield {
+            'subcategory': row.get('subcategory'),
+            'name': row.get('name'),
+            'model_no': row.get('model_no'),
+            'specification': _split(row.get('specification')),
+            'photo': row.get('photo'),
+            'variants': [{'name': name, 'price': price, 'stock': stock} for name, price, stock in variants],
+        }
+
+
+def read_jsonl(f):
+    for line in f:
+        if line.strip():
+            yield json.loads(line)
+
+
+def batches(rows, size):
+    rows = iter(rows)
+    while True:
+        batch = list(islice(rows, size))
+        if not batch:
+            return
+        yield batch
+
+
+def suffixed_names(names, subcategories):
+    # same rule as the create_final_product pre_save signal, for a whole batch at once
+    return [name if name.find(sub) != -1 else name + "_" + sub for name, sub in zip(names, subcategories)]
+
+
+def update_rows(model, fields, objs):
+    """
+    One UPDATE ... FROM (VALUES ...) per page instead of bulk_update, whose CASE per
+    row and column gets slower with every row added to the batch.
+    """
+    if not objs:
+        return
+    table = connection.ops.quote_name(model._meta.db_table)
+    columns = [model._meta.get_field(name) for name in fields]
+    quoted = [connection.ops.quote_name(f.column) for f in columns]
+    assignments = ', '.join('%s = v.%s::%s' % (name, name, f.db_type(connection)) for name, f in zip(quoted, columns))
+    names = ', '.join(quoted)
+    sql = 'UPDATE %s AS t SET %s FROM (VALUES %%s) AS v(id, %s) WHERE t.id = v.id' % (table, assignments, names)
+    rows = [[obj.pk] + [f.get_db_prep_save(getattr(obj, f.attname), connection) for f in columns] for obj in objs]
+    with connection.cursor() as cursor:
+        execute_values(cursor, sql, rows, page_size=1000)
+
+
+# the FinalProduct columns a row can set, and what a new product gets for those it leaves empty
+UPDATED_FIELDS = ['model_no', 'specification', 'photo']
+NEW_PRODUCT = {'pk': None, 'model_no': 'no model found', 'specification': [], 'photo': ''}
+
+
+class CatalogImporter:
+    """
+    Upserts FinalProducts and their variants batch by batch, a product is matched on (subcategory, name).
+    Rows that are not an object or have a variant price that can not be read are left out, import_rows
+    yields them with the reason per batch and only their count is kept in `invalid`.
+
+    Signals are bypassed: names are suffixed here, search vectors are updated per batch and
+    the catalog cache is invalidated once at the end. Image derivatives are not generated,
+    run generate_image_derivatives afterwards.
+    """
+
+    def __init__(self, batch_size=1000):
+        self.batch_size = batch_size
+        self.known_subcategories = set(Sub1.objects.values_list('pk', flat=True))
+        self.touched_subcategories = set()
+        self.created = self.updated = self.skipped = self.invalid = 0
+
+    def import_rows(self, rows):
+        """
+        Yields the number of rows of every batch done and the (row, reason) of those left out as invalid.
+        """
+        for batch in batches(rows, self.batch_size):
+            yield len(batch), self.import_batch(batch)
+        self.invalidate()
+
+    def import_batch(self, batch):
+        invalid, rows = [], []
+        for row in batch:
+            if not isinstance(row, dict):
+                invalid.append((repr(row)[:50], 'not an object'))
+            elif row.get('name') and row.get('subcategory') in self.known_subcategories:
+                try:
+                    row['variants'] = parse_variants(row.get('variants'))
+                except InvalidRow as e:
+                    invalid.append(('%s/%s' % (row['subcategory'], row['name']), str(e)))
+                    continue
+                rows.append(row)
+        self.invalid += len(invalid)
+        self.skipped += len(batch) - len(rows) - len(invalid)
+        if not rows:
+            return invalid
+
+        names = suffixed_names([row['name'] for row in rows], [row['subcategory'] for row in rows])
+        # the last row wins when the same product shows up twice in one batch
+        by_key = {}
+        for name, row in zip(names, rows):
+            by_key[(row['subcategory'], name)] = row
+
+        with transaction.atomic():
+            existing = {}
+            for values in FinalProduct.objects.filter(
+                    link_id__in={key[0] for key in by_key}, name__in={key[1] for key in by_key}) \
+                    .values('pk', 'link_id', 'name', *UPDATED_FIELDS):
+                existing.setdefault((values.pop('link_id'), values.pop('name')), values)
+
+            to_create, to_update = [], []
+            for (subcategory, name), row in by_key.items():
+                # an empty column keeps what an existing product has
+                values = dict(existing.get((subcategory, name), NEW_PRODUCT))
+                values.update((field, row[field]) for field in UPDATED_FIELDS if row.get(field))
+                product = FinalProduct(name=name, link_id=subcategory, **values)
+                (to_update if product.pk else to_create).append(product)
+
+            update_rows(FinalProduct, UPDATED_FIELDS, to_update)
+            FinalProduct.objects.bulk_create(to_create)
+            products = to_update + to_create
+
+            # variants are matched on their position so reservations pointing at them survive a re-import
+            existing_variants = {}
+            for pk, product_id, position in ProductVariant.objects.filter(product__in=to_update) \
+                    .values_list('pk', 'product_id', 'position'):
+                existing_variants[(product_id, position)] = pk
+
+            new_variants, changed_variants = [], []
+            for product in products:
+                row = by_key[(product.link_id, product.name)]
+                for position, variant in enumerate(row['variants']):
+                    variant = ProductVariant(pk=existing_variants.pop((product.pk, position), None),
+                                             product_id=product.pk, sub_category_id=product.link_id,
+                                             position=position, **variant)
+                    (changed_variants if variant.pk else new_variants).append(variant)
+            update_rows(ProductVariant, ['sub_category', 'name', 'price', 'stock'], changed_variants)
+            ProductVariant.objects.bulk_create(new_variants)
+            if existing_variants:
+                ProductVariant.objects.filter(pk__in=existing_variants.values()).delete()
+
+            FinalProduct.objects.filter(pk__in=[product.pk for product in products]) \
+                .update(search_vector=final_product_search_vector())
+
+        self.created += len(to_create)
+        self.updated += len(to_update)
+        self.touched_subcategories.update(key[0] for key in by_key)
+        return invalid
+
+    def invalidate(self):
+        for subcategory in self.touched_subcategories:
+            bump_scope(subcategory_scope(subcategory))
+        if self.touched_subcategories:
+            bump_scope(TREE_SCOPE)
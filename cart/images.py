@@ -0,0 +1,71 @@
+import os
+from io import BytesIO
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image
+
+# extension and pillow format of every derivative, each width is written in all of them
+DERIVATIVE_FORMATS = {
+    'webp': 'WEBP',
+    'jpeg': 'JPEG',
+}
+DERIVATIVE_QUALITY = 80
+
+
+def derivative_dir(name):
+    root, _ = os.path.splitext(name)
+    return 'derivatives/%s/' % root
+
+
+def derivative_file(width, fmt):
+    return '%dw.%s' % (width, fmt)
+
+
+def derivative_name(name, width, fmt):
+    return derivative_dir(name) + derivative_file(width, fmt)
+
+
+def derivative_names(name):
+    return {
+        '%dw' % width: {fmt: derivative_name(name, width, fmt) for fmt in DERIVATIVE_FORMATS}
+        for width in settings.CATALOG_IMAGE_WIDTHS
+    }
+
+
+def _encode(image, width, fmt):
+    if image.width > width:
+        height = max(1, round(image.height * width / image.width))
+        image = image.resize((width, height), Image.LANCZOS)
+    if fmt == 'jpeg' and image.mode != 'RGB':
+        # jpeg has no alpha channel, flatten on white like the app background
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask=image.convert('RGBA').split()[-1])
+        image = background
+    buffer = BytesIO()
+    image.save(buffer, DERIVATIVE_FORMATS[fmt], quality=DERIVATIVE_QUALITY, optimize=True)
+    return buffer.getvalue()
+
+
+def build_derivatives(name, storage=None, force=False):
+    """
+    Write every width/format derivative of the stored image `name`, returns how many were written.
+    """
+    storage = storage or default_storage
+    with storage.open(name) as f:
+        image = Image.open(f)
+        image.load()
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA')
+
+    written = 0
+    for width in settings.CATALOG_IMAGE_WIDTHS:
+        for fmt in DERIVATIVE_FORMATS:
+            target = derivative_name(name, width, fmt)
+            if storage.exists(target):
+                if not force:
+                    continue
+                storage.delete(target)
+            storage.save(target, ContentFile(_encode(image, width, fmt)))
+            written += 1
+    return written
@@ -0,0 +1,57 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.db import connections
+from cart.images import build_derivatives
+
+IMAGE_DIRECTORIES = ('cart_object', 'sub_1', 'final_product')
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.webp', '.gif')
+
+
+def walk(storage, path):
+    directories, files = storage.listdir(path)
+    for name in files:
+        if name.lower().endswith(IMAGE_EXTENSIONS):
+            yield path + '/' + name
+    for directory in directories:
+        yield from walk(storage, path + '/' + directory)
+
+
+def _build(args):
+    name, force = args
+    try:
+        return name, build_derivatives(name, force=force), None
+    except Exception as e:
+        return name, 0, str(e)
+
+
+class Command(BaseCommand):
+    help = 'Create the resized webp/jpeg copies of every catalog image already in the media storage'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count(), help='size of the process pool')
+        parser.add_argument('--force', action='store_true', help='rebuild derivatives that already exist')
+
+    def handle(self, *args, **options):
+        names = []
+        for directory in IMAGE_DIRECTORIES:
+            if default_storage.exists(directory):
+                names.extend(walk(default_storage, directory))
+
+        # the workers are forked, they must not share our database connections
+        connections.close_all()
+
+        start = time.time()
+        written = failed = 0
+        with ProcessPoolExecutor(max_workers=options['workers']) as pool:
+            jobs = ((name, options['force']) for name in names)
+            for name, count, error in pool.map(_build, jobs, chunksize=8):
+                if error:
+                    failed += 1
+                    self.stderr.write('%s: %s' % (name, error))
+                written += count
+
+        self.stdout.write(self.style.SUCCESS('%d images, %d derivatives written, %d failed in %.1fs' % (
+            len(names), written, failed, time.time() - start)))
@@ -0,0 +1,40 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from cart.catalog_import import CatalogImporter, read_csv, read_jsonl
+
+READERS = {
+    'csv': read_csv,
+    'jsonl': read_jsonl,
+}
+
+
+class Command(BaseCommand):
+    help = 'Stream FinalProducts and their variants from a csv or jsonl file into the catalog'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=sorted(READERS), help='defaults to the file extension')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or path.rsplit('.', 1)[-1].lower()
+        if fmt not in READERS:
+            raise CommandError('unknown format %r, use --format' % fmt)
+
+        importer = CatalogImporter(batch_size=options['batch_size'])
+        start = time.time()
+        done = 0
+        with open(path, newline='', encoding='utf-8') as f:
+            for count, invalid in importer.import_rows(READERS[fmt](f)):
+                done += count
+                for row, reason in invalid:
+                    self.stderr.write('invalid row %s: %s' % (row, reason))
+                if done % (options['batch_size'] * 50) < count:
+                    self.stdout.write('%d rows, %.0f rows/sec' % (done, done / (time.time() - start)))
+
+        elapsed = time.time() - start
+        self.stdout.write(self.style.SUCCESS(
+            '%d rows in %.1fs (%.0f rows/sec): %d created, %d updated, %d skipped, %d invalid' % (
+                done, elapsed, done / elapsed if elapsed else 0,
+                importer.created, importer.updated, importer.skipped, importer.invalid)))
@@ -0,0 +1,43 @@
+from urllib.parse import urlsplit
+from django.core.management.base import BaseCommand
+from django.test import RequestFactory
+from django.urls import reverse
+from cart.models import CartObject, Sub1
+from cart.views import HomePageView, Sub1View, FinalProductView, CatalogTreeView
+
+
+class Command(BaseCommand):
+    help = 'Fill the catalog cache for the cart list endpoints, run it after a deploy'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--base-url', default='http://localhost:8000',
+                            help='scheme and host the clients use, image urls are absolute')
+
+    def handle(self, *args, **options):
+        base = urlsplit(options['base_url'])
+        secure = base.scheme == 'https'
+        factory = RequestFactory(
+            SERVER_NAME=base.hostname,
+            SERVER_PORT=str(base.port or (443 if secure else 80)),
+        )
+
+        def warm(view, url, **kwargs):
+            response = view(factory.get(url, secure=secure), **kwargs)
+            if response.status_code != 200:
+                self.stderr.write('failed to warm %s (%s)' % (url, response.status_code))
+            return 1
+
+        home_view = HomePageView.as_view()
+        sub1_view = Sub1View.as_view()
+        final_product_view = FinalProductView.as_view()
+
+        count = warm(home_view, reverse('cart:homepage'))
+        count += warm(CatalogTreeView.as_view(), reverse('cart:tree'))
+        for cart_object in CartObject.objects.values_list('pk', flat=True).iterator():
+            count += warm(sub1_view, reverse('cart:productcategory', args=[cart_object]),
+                          prod_cat=cart_object)
+        for sub1, cart_object in Sub1.objects.values_list('pk', 'link_id').iterator():
+            count += warm(final_product_view, reverse('cart:individualproduct', args=[cart_object, sub1]),
+                          prod_cat=cart_object, product=sub1)
+
+        self.stdout.write(self.style.SUCCESS('warmed %d catalog pages' % count))
@@ -0,0 +1,21 @@
+# Generated by Django 3.1.14 on 2026-10-18 11:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cart', '0002_finalproduct_model_no'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='finalproduct',
+            index=models.Index(fields=['link', 'id'], name='cart_finalp_link_id_8b229c_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='sub1',
+            index=models.Index(fields=['link', 'name'], name='cart_sub1_link_id_be0180_idx'),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 3.1.14 on 2026-10-18 11:04
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cart', '0003_catalog_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductVariant',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(blank=True, default='NULL', max_length=20)),
+                ('price', models.DecimalField(decimal_places=2, default=0, max_digits=10)),
+                ('stock', models.PositiveIntegerField(default=0)),
+                ('position', models.PositiveSmallIntegerField(default=0)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='variants', to='cart.finalproduct')),
+                ('sub_category', models.ForeignKey(editable=False, on_delete=django.db.models.deletion.CASCADE, to='cart.sub1')),
+            ],
+            options={
+                'ordering': ['position', 'id'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='productvariant',
+            index=models.Index(fields=['product', 'position'], name='cart_produc_product_04d087_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='productvariant',
+            index=models.Index(condition=models.Q(stock__gt=0), fields=['sub_category', 'price'], name='variant_in_stock_price_idx'),
+        ),
+    ]
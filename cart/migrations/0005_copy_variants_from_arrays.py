@@ -0,0 +1,63 @@
+import re
+from decimal import Decimal
+from itertools import zip_longest
+from django.db import migrations
+
+
+def parse_price(value):
+    # "Rs. 1,299.50" is 1299.50, None when there is no number or more than one ("12.5.0", "N/A")
+    numbers = re.findall(r'[0-9]+(?:\.[0-9]+)?', (value or '').replace(',', ''))
+    if len(numbers) != 1:
+        return None
+    return Decimal(numbers[0]).quantize(Decimal('0.01'))
+
+
+def parse_stock(value):
+    value = re.sub(r'[^0-9]', '', value or '')
+    return int(value) if value else 0
+
+
+def arrays_to_variants(apps, schema_editor):
+    FinalProduct = apps.get_model('cart', 'FinalProduct')
+    ProductVariant = apps.get_model('cart', 'ProductVariant')
+
+    batch = []
+    products = FinalProduct.objects.values_list('id', 'link_id', 'diffrent_type', 'prize', 'item_left')
+    for product_id, link_id, types, prizes, items_left in products.iterator():
+        rows = zip_longest(types or [], prizes or [], items_left or [])
+        for position, (name, prize, item_left) in enumerate(rows):
+            price = parse_price(prize)
+            # a variant without a price is kept but not sold: out of stock it is left out of the
+            # listings and can not be reserved until someone prices it
+            batch.append(ProductVariant(product_id=product_id, sub_category_id=link_id, name=name or 'NULL',
+                                        price=price if price is not None else Decimal(0),
+                                        stock=parse_stock(item_left) if price is not None else 0,
+                                        position=position))
+        if len(batch) >= 1000:
+            ProductVariant.objects.bulk_create(batch)
+            batch = []
+    ProductVariant.objects.bulk_create(batch)
+
+
+def variants_to_arrays(apps, schema_editor):
+    FinalProduct = apps.get_model('cart', 'FinalProduct')
+    ProductVariant = apps.get_model('cart', 'ProductVariant')
+
+    for product in FinalProduct.objects.iterator():
+        variants = ProductVariant.objects.filter(product_id=product.id).order_by('position', 'id')
+        product.diffrent_type = [v.name for v in variants]
+        product.prize = ['{:f}'.format(v.price.normalize()) for v in variants]
+        product.item_left = [str(v.stock) for v in variants]
+        product.save(update_fields=['diffrent_type', 'prize', 'item_left'])
+    ProductVariant.objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cart', '0004_productvariant'),
+    ]
+
+    operations = [
+        migrations.RunPython(arrays_to_variants, variants_to_arrays),
+    ]
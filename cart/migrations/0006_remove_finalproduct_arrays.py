@@ -0,0 +1,42 @@
+# Generated by Django 3.1.14 on 2026-10-18 11:04
+
+from django.db import migrations, models
+import django_better_admin_arrayfield.models.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cart', '0005_copy_variants_from_arrays'),
+    ]
+
+    # the defaults only matter when unapplying, so the columns can be re-added to existing rows
+    operations = [
+        migrations.AlterField(
+            model_name='finalproduct',
+            name='diffrent_type',
+            field=django_better_admin_arrayfield.models.fields.ArrayField(base_field=models.CharField(blank=True, default='NULL', max_length=20), blank=True, default=list, size=None),
+        ),
+        migrations.AlterField(
+            model_name='finalproduct',
+            name='item_left',
+            field=django_better_admin_arrayfield.models.fields.ArrayField(base_field=models.CharField(blank=True, max_length=20), blank=True, default=list, size=None),
+        ),
+        migrations.AlterField(
+            model_name='finalproduct',
+            name='prize',
+            field=django_better_admin_arrayfield.models.fields.ArrayField(base_field=models.CharField(blank=True, max_length=20), blank=True, default=list, size=None),
+        ),
+        migrations.RemoveField(
+            model_name='finalproduct',
+            name='diffrent_type',
+        ),
+        migrations.RemoveField(
+            model_name='finalproduct',
+            name='item_left',
+        ),
+        migrations.RemoveField(
+            model_name='finalproduct',
+            name='prize',
+        ),
+    ]
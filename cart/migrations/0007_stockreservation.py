@@ -0,0 +1,32 @@
+# Generated by Django 3.1.14 on 2026-10-18 11:05
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('cart', '0006_remove_finalproduct_arrays'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockReservation',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.PositiveIntegerField()),
+                ('status', models.CharField(choices=[('reserved', 'reserved'), ('released', 'released'), ('confirmed', 'confirmed')], default='reserved', max_length=10)),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('expires_at', models.DateTimeField()),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+                ('variant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reservations', to='cart.productvariant')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='stockreservation',
+            index=models.Index(condition=models.Q(status='reserved'), fields=['expires_at'], name='reservation_pending_expiry_idx'),
+        ),
+    ]
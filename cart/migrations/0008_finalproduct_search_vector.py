@@ -0,0 +1,38 @@
+# Generated by Django 3.1.14 on 2026-10-18 11:06
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.contrib.postgres.search import SearchVector
+from django.db import migrations, models
+from django.db.models.functions import Replace
+
+
+def fill_search_vector(apps, schema_editor):
+    FinalProduct = apps.get_model('cart', 'FinalProduct')
+    # "BH-200" would otherwise be indexed as "bh" and "-200"
+    model_no = Replace(models.F('model_no'), models.Value('-'), models.Value(' '))
+    specification = models.Func(models.F('specification'), models.Value(' '), function='array_to_string',
+                                output_field=models.TextField())
+    FinalProduct.objects.update(search_vector=(SearchVector('name', weight='A', config='english') +
+                                               SearchVector(model_no, weight='A', config='english') +
+                                               SearchVector(specification, weight='B', config='english')))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cart', '0007_stockreservation'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='finalproduct',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='finalproduct',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='cart_finalp_search__d3c342_gin'),
+        ),
+        migrations.RunPython(fill_search_vector, migrations.RunPython.noop),
+    ]
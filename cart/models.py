@@ -1,8 +1,12 @@
-from django.db import models
+from django.db import models, transaction
 from django_better_admin_arrayfield.models.fields import ArrayField
 from django.contrib.auth.models import User
-from django.db.models.signals import pre_save
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVector, SearchVectorField
+from django.db.models.functions import Replace
+from django.db.models.signals import pre_save, post_save, post_delete
 from django.dispatch import receiver
+from .cache import invalidate_on_commit, HOMEPAGE_SCOPE, TREE_SCOPE, category_scope, subcategory_scope
 
 
 def renaming_uploaded_image1(instance, filename):
@@ -30,6 +34,11 @@ class Sub1(models.Model):
     photo = models.ImageField(blank=True, upload_to=renaming_uploaded_image2)
     link = models.ForeignKey(CartObject, on_delete=models.CASCADE)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['link', 'name']),
+        ]
+
     def __str__(self):
         return f' {self.name} '
 
@@ -39,15 +48,85 @@ class FinalProduct(models.Model):
     link = models.ForeignKey(Sub1, on_delete=models.CASCADE)
     specification = ArrayField(models.CharField(max_length=20, blank=True), blank=True)
     photo = models.ImageField(upload_to=renaming_uploaded_image3)
-    diffrent_type = ArrayField(models.CharField(max_length=20, blank=True, default="NULL"), blank=True)
-    prize = ArrayField(models.CharField(max_length=20, blank=True), blank=True)
-    item_left = ArrayField(models.CharField(max_length=20, blank=True), blank=True)
     model_no = models.CharField(max_length=20, default="no model found")
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['link', 'id']),
+            GinIndex(fields=['search_vector']),
+        ]
 
     def __str__(self):
         return f'item name: {self.name}'
 
 
+SEARCH_CONFIG = 'english'
+
+
+def final_product_search_vector():
+    # "BH-200" would otherwise be indexed as "bh" and "-200"
+    model_no = Replace(models.F('model_no'), models.Value('-'), models.Value(' '))
+    specification = models.Func(models.F('specification'), models.Value(' '), function='array_to_string',
+                                output_field=models.TextField())
+    return (SearchVector('name', weight='A', config=SEARCH_CONFIG) +
+            SearchVector(model_no, weight='A', config=SEARCH_CONFIG) +
+            SearchVector(specification, weight='B', config=SEARCH_CONFIG))
+
+
+class ProductVariant(models.Model):
+    product = models.ForeignKey(FinalProduct, on_delete=models.CASCADE, related_name='variants')
+    # copy of product.link so "in stock under X in subcategory Y" never needs a join
+    sub_category = models.ForeignKey(Sub1, on_delete=models.CASCADE, editable=False)
+    name = models.CharField(max_length=20, blank=True, default="NULL")
+    price = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    stock = models.PositiveIntegerField(default=0)
+    position = models.PositiveSmallIntegerField(default=0)
+
+    class Meta:
+        ordering = ['position', 'id']
+        indexes = [
+            models.Index(fields=['product', 'position']),
+            models.Index(fields=['sub_category', 'price'], condition=models.Q(stock__gt=0),
+                         name='variant_in_stock_price_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.product_id}: {self.name}'
+
+    @property
+    def price_text(self):
+        # the old prize array held plain strings like "250"
+        return '{:f}'.format(self.price.normalize())
+
+
+class StockReservation(models.Model):
+    RESERVED = 'reserved'
+    RELEASED = 'released'
+    CONFIRMED = 'confirmed'
+    STATUS_CHOICES = (
+        (RESERVED, 'reserved'),
+        (RELEASED, 'released'),
+        (CONFIRMED, 'confirmed'),
+    )
+
+    variant = models.ForeignKey(ProductVariant, on_delete=models.CASCADE, related_name='reservations')
+    user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
+    quantity = models.PositiveIntegerField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=RESERVED)
+    created = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['expires_at'], condition=models.Q(status='reserved'),
+                         name='reservation_pending_expiry_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.quantity} x {self.variant_id} ({self.status})'
+
+
 @receiver(pre_save, sender=Sub1)
 def create_sub1(sender, instance, **kwargs):
     if instance.name.find(instance.link.name) == -1:
@@ -58,3 +137,92 @@ def create_sub1(sender, instance, **kwargs):
 def create_final_product(sender, instance, **kwargs):
     if instance.name.find(instance.link.name) == -1:
         instance.name = instance.name + "_" + instance.link.name
+
+
+@receiver(pre_save, sender=ProductVariant)
+def create_product_variant(sender, instance, **kwargs):
+    instance.sub_category_id = instance.product.link_id
+
+
+@receiver(post_save, sender=FinalProduct)
+def update_search_vector(sender, instance, **kwargs):
+    FinalProduct.objects.filter(pk=instance.pk).update(search_vector=final_product_search_vector())
+
+
+@receiver(post_save, sender=FinalProduct)
+def move_product_variants(sender, instance, created, **kwargs):
+    if not created:
+        ProductVariant.objects.filter(product=instance).exclude(sub_category=instance.link_id) \
+            .update(sub_category=instance.link_id)
+
+
+# ----catalog cache invalidation----
+def _remember_old_link(sender, instance):
+    # the old parent list has to be invalidated too when an item is moved
+    instance._old_link_id = sender.objects.filter(pk=instance.pk).values_list('link_id', flat=True).first()
+
+
+@receiver(pre_save, sender=Sub1)
+def remember_sub1_link(sender, instance, **kwargs):
+    _remember_old_link(sender, instance)
+
+
+@receiver(pre_save, sender=FinalProduct)
+def remember_final_product_link(sender, instance, **kwargs):
+    if instance.pk is not None:
+        _remember_old_link(sender, instance)
+
+
+@receiver([post_save, post_delete], sender=CartObject)
+def invalidate_cart_object(sender, instance, **kwargs):
+    invalidate_on_commit(HOMEPAGE_SCOPE, TREE_SCOPE)
+
+
+@receiver([post_save, post_delete], sender=Sub1)
+def invalidate_sub1(sender, instance, **kwargs):
+    scopes = {category_scope(instance.link_id), TREE_SCOPE}
+    old_link_id = getattr(instance, '_old_link_id', None)
+    if old_link_id is not None:
+        scopes.add(category_scope(old_link_id))
+    invalidate_on_commit(*scopes)
+
+
+@receiver([post_save, post_delete], sender=FinalProduct)
+def invalidate_final_product(sender, instance, **kwargs):
+    scopes = {subcategory_scope(instance.link_id), TREE_SCOPE}
+    old_link_id = getattr(instance, '_old_link_id', None)
+    if old_link_id is not None:
+        scopes.add(subcategory_scope(old_link_id))
+    invalidate_on_commit(*scopes)
+
+
+@receiver([post_save, post_delete], sender=ProductVariant)
+def invalidate_product_variant(sender, instance, **kwargs):
+    invalidate_on_commit(subcategory_scope(instance.sub_category_id))
+
+
+# ----resized image derivatives----
+IMAGE_FIELDS = {
+    CartObject: 'image',
+    Sub1: 'photo',
+    FinalProduct: 'photo',
+}
+
+
+@receiver(pre_save, sender=CartObject)
+@receiver(pre_save, sender=Sub1)
+@receiver(pre_save, sender=FinalProduct)
+def detect_image_upload(sender, instance, **kwargs):
+    image = getattr(instance, IMAGE_FIELDS[sender])
+    # an uploaded file is only committed to the storage after pre_save
+    instance._image_uploaded = bool(image) and not getattr(image, '_committed', True)
+
+
+@receiver(post_save, sender=CartObject)
+@receiver(post_save, sender=Sub1)
+@receiver(post_save, sender=FinalProduct)
+def queue_image_derivatives(sender, instance, **kwargs):
+    if getattr(instance, '_image_uploaded', False):
+        from .tasks import generate_image_derivatives
+        name = getattr(instance, IMAGE_FIELDS[sender]).name
+        transaction.on_commit(lambda: generate_image_derivatives.delay(name))
@@ -0,0 +1,10 @@
+from rest_framework.pagination import CursorPagination
+
+
+class CatalogCursorPagination(CursorPagination):
+    # keyset pagination on the primary key: every page is a single index range scan
+    # and rows added while a client is paging never shift the pages it already has
+    ordering = 'pk'
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
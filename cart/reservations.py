@@ -0,0 +1,102 @@
+from collections import Counter
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from .cache import invalidate_on_commit, subcategory_scope
+from .models import ProductVariant, StockReservation
+
+
+class InsufficientStock(Exception):
+    def __init__(self, variant_id, quantity):
+        super().__init__('not enough stock of variant %s to reserve %s' % (variant_id, quantity))
+        self.variant_id = variant_id
+        self.quantity = quantity
+
+
+def _invalidate_variants(variant_ids):
+    sub_categories = ProductVariant.objects.filter(pk__in=variant_ids) \
+        .values_list('sub_category_id', flat=True).distinct()
+    invalidate_on_commit(*[subcategory_scope(pk) for pk in sub_categories])
+
+
+def reserve(items, user=None, ttl=None):
+    """
+    Reserve stock for several (variant_id, quantity) pairs, all or nothing.
+
+    Each variant is decremented with a conditional UPDATE so concurrent buyers can
+    never oversell, and rows are always locked in primary key order so two baskets
+    holding the same variants can not deadlock each other.
+    """
+    quantities = Counter()
+    for variant_id, quantity in items:
+        if quantity <= 0:
+            raise ValueError('quantity must be positive')
+        quantities[int(variant_id)] += quantity
+
+    ttl = ttl if ttl is not None else settings.STOCK_RESERVATION_TTL
+    expires_at = timezone.now() + timedelta(seconds=ttl)
+
+    with transaction.atomic():
+        for variant_id in sorted(quantities):
+            quantity = quantities[variant_id]
+            updated = ProductVariant.objects.filter(pk=variant_id, stock__gte=quantity) \
+                .update(stock=F('stock') - quantity)
+            if not updated:
+                raise InsufficientStock(variant_id, quantity)
+
+        reservations = StockReservation.objects.bulk_create([
+            StockReservation(variant_id=variant_id, user=user, quantity=quantities[variant_id],
+                             expires_at=expires_at)
+            for variant_id in sorted(quantities)
+        ])
+        _invalidate_variants(list(quantities))
+    return reservations
+
+
+def _close(reservation_ids, status, user=None):
+    with transaction.atomic():
+        reservations = StockReservation.objects.select_for_update(skip_locked=True) \
+            .filter(pk__in=reservation_ids, status=StockReservation.RESERVED)
+        if user is not None:
+            reservations = reservations.filter(user=user)
+        reservations = list(reservations.order_by('variant_id', 'pk'))
+        if not reservations:
+            return 0
+
+        if status == StockReservation.RELEASED:
+            quantities = Counter()
+            for reservation in reservations:
+                quantities[reservation.variant_id] += reservation.quantity
+            for variant_id in sorted(quantities):
+                ProductVariant.objects.filter(pk=variant_id).update(stock=F('stock') + quantities[variant_id])
+            _invalidate_variants(list(quantities))
+
+        StockReservation.objects.filter(pk__in=[r.pk for r in reservations]).update(status=status)
+    return len(reservations)
+
+
+def release(reservation_ids, user=None):
+    # gives the stock back, already closed reservations are skipped
+    return _close(reservation_ids, StockReservation.RELEASED, user=user)
+
+
+def confirm(reservation_ids, user=None):
+    # the order went through, the stock stays taken
+    return _close(reservation_ids, StockReservation.CONFIRMED, user=user)
+
+
+def release_expired(batch_size=500):
+    released = 0
+    while True:
+        expired = list(StockReservation.objects.filter(status=StockReservation.RESERVED,
+                                                       expires_at__lte=timezone.now())
+                       .values_list('pk', flat=True)[:batch_size])
+        if not expired:
+            return released
+        count = release(expired)
+        released += count
+        if count == 0:
+            # everything left is being handled by another worker right now
+            return released
@@ -0,0 +1,37 @@
+import re
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db import connection
+from django.db.models import F, Q
+from .models import FinalProduct, SEARCH_CONFIG
+
+
+def _prefix_query(text):
+    # every word must match, the last ones as a prefix so partial input still finds something
+    words = re.findall(r'\w+', text)
+    return ' & '.join(word + ':*' for word in words)
+
+
+def search_products(text):
+    """
+    FinalProducts matching the text, best match first.
+
+    On postgres this is answered by the GIN index on FinalProduct.search_vector,
+    other databases get a plain icontains scan over name and model_no.
+    """
+    queryset = FinalProduct.objects.all()
+    if connection.vendor == 'postgresql':
+        raw = _prefix_query(text)
+        if not raw:
+            return queryset.none()
+        query = SearchQuery(raw, config=SEARCH_CONFIG, search_type='raw')
+        return queryset.filter(search_vector=query) \
+            .annotate(rank=SearchRank(F('search_vector'), query)) \
+            .order_by('-rank', 'pk')
+
+    words = re.findall(r'\w+', text)
+    if not words:
+        return queryset.none()
+    condition = Q()
+    for word in words:
+        condition &= Q(name__icontains=word) | Q(model_no__icontains=word)
+    return queryset.filter(condition).order_by('name', 'pk')
@@ -1,20 +1,254 @@
+import re
+from urllib.parse import urljoin
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage
+from django.utils.encoding import filepath_to_uri
 from rest_framework import serializers
-from .models import FinalProduct, CartObject, Sub1
+from .models import FinalProduct, CartObject, Sub1, ProductVariant, StockReservation
+from .images import derivative_dir, derivative_file, derivative_names, DERIVATIVE_FORMATS
+
+
+class ImageSrcsetField(serializers.Field):
+    """
+    {"160w": {"webp": url, "jpeg": url}, ...} for the resized copies of an image field.
+    """
+
+    def __init__(self, **kwargs):
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, value):
+        if not value:
+            return {}
+        request = self.context.get('request')
+        srcset = {}
+        for width, names in derivative_names(value.name).items():
+            urls = {fmt: value.storage.url(name) for fmt, name in names.items()}
+            if request is not None:
+                urls = {fmt: request.build_absolute_uri(url) for fmt, url in urls.items()}
+            srcset[width] = urls
+        return srcset
+
+
+class ProductVariantSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ProductVariant
+        fields = ['id', 'name', 'price', 'stock']
 
 
 class FinalProductSerializer(serializers.ModelSerializer):
+    # diffrent_type, prize and item_left keep the shape of the old parallel string arrays
+    diffrent_type = serializers.SerializerMethodField()
+    prize = serializers.SerializerMethodField()
+    item_left = serializers.SerializerMethodField()
+    variants = ProductVariantSerializer(many=True, read_only=True)
+    photo_srcset = ImageSrcsetField(source='photo')
+
     class Meta:
         model = FinalProduct
-        fields = '__all__'
+        fields = ['id', 'name', 'specification', 'photo', 'diffrent_type', 'prize', 'item_left', 'model_no',
+                  'link', 'variants', 'photo_srcset']
+
+    def get_diffrent_type(self, obj):
+        return [variant.name for variant in obj.variants.all()]
+
+    def get_prize(self, obj):
+        return [variant.price_text for variant in obj.variants.all()]
+
+    def get_item_left(self, obj):
+        return [str(variant.stock) for variant in obj.variants.all()]
 
 
 class CartObjectSerializer(serializers.ModelSerializer):
+    image_srcset = ImageSrcsetField(source='image')
+
     class Meta:
         model = CartObject
         fields = '__all__'
 
 
 class Sub1Serializer(serializers.ModelSerializer):
+    photo_srcset = ImageSrcsetField(source='photo')
+
     class Meta:
         model = Sub1
         fields = '__all__'
+
+
+class ReservationItemSerializer(serializers.Serializer):
+    variant = serializers.IntegerField()
+    quantity = serializers.IntegerField(min_value=1)
+
+
+class ReserveSerializer(serializers.Serializer):
+    items = ReservationItemSerializer(many=True, allow_empty=False)
+
+
+class ReleaseSerializer(serializers.Serializer):
+    reservations = serializers.ListField(child=serializers.IntegerField(), allow_empty=False)
+
+
+class StockReservationSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = StockReservation
+        fields = ['id', 'variant', 'quantity', 'status', 'expires_at']
+
+
+# ----nested catalog tree, summary fields only----
+class TreeProductSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = FinalProduct
+        fields = ['id', 'name', 'model_no', 'photo']
+
+
+class TreeSub1Serializer(serializers.ModelSerializer):
+    products = TreeProductSerializer(many=True, read_only=True, source='tree_products')
+
+    class Meta:
+        model = Sub1
+        fields = ['name', 'photo', 'products']
+
+    def get_fields(self):
+        fields = super().get_fields()
+        if self.context['depth'] < 3:
+            del fields['products']
+        return fields
+
+
+class TreeCartObjectSerializer(serializers.ModelSerializer):
+    subcategories = TreeSub1Serializer(many=True, read_only=True, source='tree_subcategories')
+
+    class Meta:
+        model = CartObject
+        fields = ['name', 'image', 'subcategories']
+
+    def get_fields(self):
+        fields = super().get_fields()
+        if self.context['depth'] < 2:
+            del fields['subcategories']
+        return fields
+
+
+# ----lean read path of the list views----
+# names made only of characters filepath_to_uri leaves alone
+_URI_SAFE_NAME = re.compile(r"[A-Za-z0-9_.\-/~!*()']*")
+
+
+class ImageUrls:
+    """
+    The urls ImageField and ImageSrcsetField give for stored image names, with the storage
+    prefix made absolute once per response instead of once per image.
+    """
+
+    def __init__(self, storage, request=None):
+        self.storage = storage
+        self.request = request
+        self.prefix = None
+        if isinstance(storage, FileSystemStorage):
+            self.prefix = request.build_absolute_uri(storage.base_url) if request is not None else storage.base_url
+
+    def url(self, name):
+        if self.prefix is not None:
+            path = (name if _URI_SAFE_NAME.fullmatch(name) else filepath_to_uri(name)).lstrip('/')
+            # what urljoin gives too, it only has to be asked for empty and dot segments
+            if '//' in path or '/.' in '/' + path:
+                return urljoin(self.prefix, path)
+            return self.prefix + path
+        url = self.storage.url(name)
+        return self.request.build_absolute_uri(url) if self.request is not None else url
+
+    def image(self, name):
+        return self.url(name) if name else None
+
+    def srcset(self, name):
+        if not name:
+            return {}
+        if self.prefix is None:
+            return {width: {fmt: self.url(derivative) for fmt, derivative in names.items()}
+                    for width, names in derivative_names(name).items()}
+        # the file names need no quoting, the directory is quoted once for all of them
+        directory = self.url(derivative_dir(name))
+        return {'%dw' % width: {fmt: directory + derivative_file(width, fmt) for fmt in DERIVATIVE_FORMATS}
+                for width in settings.CATALOG_IMAGE_WIDTHS}
+
+
+class ValuesSerializer:
+    """
+    Read only stand-in for a ModelSerializer(many=True) on the list views. Rows are fetched
+    with .values(`fields`) and turned into the same json as `serializer_class` by hand,
+    without a model instance or a serializer field per value.
+    """
+    model = None
+    fields = ()
+    image_field = None
+
+    def __init__(self, context=None):
+        self.context = context or {}
+        if self.image_field:
+            storage = self.model._meta.get_field(self.image_field).storage
+            self.images = ImageUrls(storage, self.context.get('request'))
+
+    def rows(self, queryset):
+        # the pagination orders on pk, so it is always fetched under that name
+        return queryset.prefetch_related(None).values('pk', *self.fields)
+
+    def represent(self, rows):
+        raise NotImplementedError
+
+
+class CartObjectValuesSerializer(ValuesSerializer):
+    # CartObjectSerializer
+    model = CartObject
+    fields = ('image',)
+    image_field = 'image'
+
+    def represent(self, rows):
+        images = self.images
+        return [{'name': row['pk'], 'image_srcset': images.srcset(row['image']), 'image': images.image(row['image'])}
+                for row in rows]
+
+
+class Sub1ValuesSerializer(ValuesSerializer):
+    # Sub1Serializer
+    model = Sub1
+    fields = ('photo', 'link')
+    image_field = 'photo'
+
+    def represent(self, rows):
+        images = self.images
+        return [{'name': row['pk'], 'photo_srcset': images.srcset(row['photo']), 'photo': images.image(row['photo']),
+                 'link': row['link']} for row in rows]
+
+
+class FinalProductValuesSerializer(ValuesSerializer):
+    # FinalProductSerializer, the variants of a page come with one more query
+    model = FinalProduct
+    fields = ('name', 'specification', 'photo', 'model_no', 'link')
+    image_field = 'photo'
+
+    def represent(self, rows):
+        rows = list(rows)
+        variants = {}
+        for variant in ProductVariant.objects.filter(product_id__in=[row['pk'] for row in rows]) \
+                .order_by('position', 'id').values('product_id', 'id', 'name', 'price', 'stock'):
+            variants.setdefault(variant.pop('product_id'), []).append(variant)
+
+        images = self.images
+        data = []
+        for row in rows:
+            product_variants = variants.get(row['pk'], [])
+            data.append({
+                'id': row['pk'],
+                'name': row['name'],
+                'specification': [None if item is None else str(item) for item in row['specification']],
+                'photo': images.image(row['photo']),
+                'diffrent_type': [variant['name'] for variant in product_variants],
+                'prize': ['{:f}'.format(variant['price'].normalize()) for variant in product_variants],
+                'item_left': [str(variant['stock']) for variant in product_variants],
+                'model_no': row['model_no'],
+                'link': row['link'],
+                'variants': [{'id': variant['id'], 'name': variant['name'], 'price': '{:f}'.format(variant['price']),
+                              'stock': variant['stock']} for variant in product_variants],
+                'photo_srcset': images.srcset(row['photo']),
+            })
+        return data
@@ -0,0 +1,13 @@
+from celery import shared_task
+from .images import build_derivatives
+from .reservations import release_expired
+
+
+@shared_task
+def release_expired_reservations():
+    return release_expired()
+
+
+@shared_task
+def generate_image_derivatives(name):
+    return build_derivatives(name)
@@ -1,3 +1,599 @@
-from django.test import TestCase
+from datetime import date, datetime, timezone
+from decimal import Decimal
+import gzip
+import json
+import os
+import shutil
+import tempfile
+import threading
+from io import StringIO
+from unittest import mock, skipUnless
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.core.files.uploadedfile import SimpleUploadedFile
+from asgiref.sync import async_to_sync
+from django.test import AsyncClient, Client, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework import mixins
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient, APIRequestFactory
+from medhistory import metrics
+from medhistory.middleware import brotli
+from medhistory.renderers import ORJSONRenderer, msgpack
+from .models import CartObject, Sub1, FinalProduct, ProductVariant, StockReservation
+from . import reservations
+from .pagination import CatalogCursorPagination
+from .views import HomePageView, Sub1View, FinalProductView, ProductSearchView
 
-# Create your tests here.
+
+def create_catalog():
+    cart_object = CartObject.objects.create(name='screw')
+    sub1 = Sub1.objects.create(name='wood', link=cart_object)
+    product = FinalProduct.objects.create(name='polish', link=sub1, specification=['steel'],
+                                          photo='final_product/polish_wood_screw.png')
+    ProductVariant.objects.create(product=product, name='small', price=Decimal('20'), stock=5)
+    return cart_object, sub1, product
+
+
+# on_commit invalidation needs real commits, hence TransactionTestCase
+class CatalogCacheTest(TransactionTestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.cart_object, self.sub1, self.product = create_catalog()
+        self.url = reverse('cart:individualproduct', args=[self.cart_object.name, self.sub1.name])
+
+    def test_second_request_is_served_from_cache(self):
+        self.assertEqual(self.client.get(self.url)['X-Cache'], 'MISS')
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url)
+        self.assertEqual(response['X-Cache'], 'HIT')
+
+    def test_ignored_parameters_do_not_make_new_entries(self):
+        self.assertEqual(self.client.get(self.url + '?utm=1')['X-Cache'], 'MISS')
+        self.assertEqual(self.client.get(self.url + '?utm=2')['X-Cache'], 'MISS')
+        self.assertEqual(self.client.get(self.url)['X-Cache'], 'MISS')
+        response = self.client.get(self.url + '?utm=3&_=4')
+        self.assertEqual(response['X-Cache'], 'HIT')
+        self.assertEqual(self.client.get(self.url + '?in_stock=1&page_size=5')['X-Cache'], 'MISS')
+        self.assertEqual(self.client.get(self.url + '?page_size=5&in_stock=1&utm=5')['X-Cache'], 'HIT')
+        self.assertEqual(self.client.get(self.url + '?page_size=5&in_stock=true')['X-Cache'], 'HIT')
+
+    def test_save_invalidates_only_its_subcategory(self):
+        home_url = reverse('cart:homepage')
+        self.client.get(self.url)
+        self.client.get(home_url)
+
+        self.product.model_no = 'x-1'
+        self.product.save()
+
+        response = self.client.get(self.url)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.json()['results'][0]['model_no'], 'x-1')
+        self.assertEqual(self.client.get(home_url)['X-Cache'], 'HIT')
+
+    def test_delete_invalidates(self):
+        self.client.get(self.url)
+        self.product.delete()
+        self.assertEqual(self.client.get(self.url).json()['results'], [])
+
+    def test_warm_command_fills_cache(self):
+        call_command('warm_catalog_cache', '--base-url', 'http://testserver', stdout=StringIO())
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(reverse('cart:homepage'))['X-Cache'], 'HIT')
+            self.assertEqual(self.client.get(self.url)['X-Cache'], 'HIT')
+
+
+class CatalogPaginationTest(TransactionTestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.cart_object, self.sub1, _ = create_catalog()
+        for i in range(4):
+            FinalProduct.objects.create(name='item%d' % i, link=self.sub1, specification=[],
+                                        photo='final_product/x.png')
+        self.url = reverse('cart:individualproduct', args=[self.cart_object.name, self.sub1.name])
+
+    def test_pages_are_stable_while_products_are_added(self):
+        first = self.client.get(self.url, {'page_size': 2}).json()
+        self.assertEqual(len(first['results']), 2)
+
+        FinalProduct.objects.create(name='late', link=self.sub1, specification=[],
+                                    photo='final_product/x.png')
+
+        ids = [p['id'] for p in first['results']]
+        url = first['next']
+        while url:
+            page = self.client.get(url).json()
+            ids += [p['id'] for p in page['results']]
+            url = page['next']
+        self.assertEqual(ids, sorted(FinalProduct.objects.values_list('id', flat=True)))
+
+    def test_page_size_is_capped(self):
+        with mock.patch.object(CatalogCursorPagination, 'max_page_size', 3):
+            response = self.client.get(self.url, {'page_size': 10000})
+        self.assertEqual(len(response.json()['results']), 3)
+
+
+class ProductVariantTest(TransactionTestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.cart_object, self.sub1, self.product = create_catalog()
+        ProductVariant.objects.create(product=self.product, name='large', price=Decimal('99.50'), stock=0,
+                                      position=1)
+        self.url = reverse('cart:individualproduct', args=[self.cart_object.name, self.sub1.name])
+
+    def test_old_array_fields_are_still_served(self):
+        product = self.client.get(self.url).json()['results'][0]
+        self.assertEqual(product['diffrent_type'], ['small', 'large'])
+        self.assertEqual(product['prize'], ['20', '99.5'])
+        self.assertEqual(product['item_left'], ['5', '0'])
+
+    def test_price_and_stock_filters(self):
+        cheap = FinalProduct.objects.create(name='cheap', link=self.sub1, specification=[], photo='x.png')
+        ProductVariant.objects.create(product=cheap, name='one', price=Decimal('10'), stock=3)
+
+        def names(params):
+            return [p['name'] for p in self.client.get(self.url, params).json()['results']]
+
+        self.assertEqual(names({'max_price': '15'}), [cheap.name])
+        self.assertEqual(names({'max_price': '50', 'in_stock': '1'}), [self.product.name, cheap.name])
+        sold_out = FinalProduct.objects.create(name='sold_out', link=self.sub1, specification=[], photo='x.png')
+        ProductVariant.objects.create(product=sold_out, name='one', price=Decimal('10'), stock=0)
+        self.assertEqual(names({'max_price': '15', 'in_stock': 'false'}), [cheap.name, sold_out.name])
+        self.assertEqual(names({'max_price': '15', 'in_stock': 'true'}), [cheap.name])
+        self.assertEqual(self.client.get(self.url, {'max_price': 'abc'}).status_code, 400)
+        self.assertEqual(self.client.get(self.url, {'in_stock': 'maybe'}).status_code, 400)
+
+    def test_variant_follows_product_subcategory(self):
+        other = Sub1.objects.create(name='metal', link=self.cart_object)
+        self.product.link = other
+        self.product.save()
+        self.assertEqual(set(self.product.variants.values_list('sub_category', flat=True)), {other.pk})
+
+
+class StockReservationTest(TransactionTestCase):
+
+    def setUp(self):
+        cache.clear()
+        _, self.sub1, self.product = create_catalog()
+        self.hot = self.product.variants.get()
+        self.hot.stock = 50
+        self.hot.save()
+        self.other = ProductVariant.objects.create(product=self.product, name='large', price=Decimal('30'),
+                                                   stock=1000, position=1)
+
+    def run_threads(self, target, count):
+        errors = []
+
+        def run(i):
+            try:
+                target(i)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=run, args=(i,)) for i in range(count)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return errors
+
+    def test_hot_sku_is_never_oversold(self):
+        succeeded = []
+
+        def buy(i):
+            # half of the baskets lock the variants in the opposite order
+            items = [(self.hot.pk, 1), (self.other.pk, 1)]
+            if i % 2:
+                items.reverse()
+            for _ in range(5):
+                try:
+                    succeeded.append(reservations.reserve(items))
+                except reservations.InsufficientStock:
+                    pass
+
+        errors = self.run_threads(buy, 20)
+        self.assertEqual(errors, [])
+        self.assertEqual(len(succeeded), 50)
+        self.hot.refresh_from_db()
+        self.other.refresh_from_db()
+        self.assertEqual(self.hot.stock, 0)
+        self.assertEqual(self.other.stock, 950)
+
+    def test_batch_is_all_or_nothing(self):
+        with self.assertRaises(reservations.InsufficientStock):
+            reservations.reserve([(self.other.pk, 1), (self.hot.pk, 51)])
+        self.other.refresh_from_db()
+        self.assertEqual(self.other.stock, 1000)
+        self.assertFalse(StockReservation.objects.exists())
+
+    def test_release_is_idempotent(self):
+        reserved = reservations.reserve([(self.hot.pk, 10)])
+        ids = [r.pk for r in reserved]
+        errors = self.run_threads(lambda i: reservations.release(ids), 8)
+        self.assertEqual(errors, [])
+        self.hot.refresh_from_db()
+        self.assertEqual(self.hot.stock, 50)
+
+    def test_expired_reservations_are_released(self):
+        reservations.reserve([(self.hot.pk, 10)], ttl=-1)
+        kept = reservations.reserve([(self.hot.pk, 5)])
+        self.assertEqual(reservations.release_expired(), 1)
+        self.hot.refresh_from_db()
+        self.assertEqual(self.hot.stock, 45)
+        self.assertEqual(StockReservation.objects.get(pk=kept[0].pk).status, StockReservation.RESERVED)
+
+
+class ProductSearchTest(TransactionTestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        _, self.sub1, self.product = create_catalog()
+        self.other = FinalProduct.objects.create(name='brass hinge', link=self.sub1, specification=['polish'],
+                                                 photo='x.png', model_no='BH-200')
+
+    def search(self, text, **params):
+        params['q'] = text
+        return [p['id'] for p in self.client.get(reverse('cart:search'), params).json()]
+
+    def test_ranked_by_field_weight(self):
+        # the name match ranks above the specification match
+        self.assertEqual(self.search('polish'), [self.product.pk, self.other.pk])
+
+    def test_prefix_and_model_number(self):
+        self.assertEqual(self.search('bras'), [self.other.pk])
+        self.assertEqual(self.search('bh-200'), [self.other.pk])
+
+    def test_vector_follows_updates(self):
+        self.other.name = 'steel hinge'
+        self.other.save()
+        self.assertEqual(self.search('brass'), [])
+        self.assertEqual(self.search('steel'), [self.other.pk, self.product.pk])
+
+    def test_fallback_without_postgres(self):
+        with mock.patch('cart.search.connection') as fake_connection:
+            fake_connection.vendor = 'sqlite'
+            self.assertEqual(self.search('hinge'), [self.other.pk])
+            self.assertEqual(self.search('!!'), [])
+
+
+class ImageDerivativeTest(TransactionTestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+
+    def test_upload_creates_derivatives_and_srcset(self):
+        with open(os.path.join(settings.BASE_DIR, 'media', 'cart_object', 'screw.png'), 'rb') as f:
+            upload = SimpleUploadedFile('screw.png', f.read(), content_type='image/png')
+        with override_settings(MEDIA_ROOT=self.media_root, CATALOG_IMAGE_WIDTHS=(32, 64)):
+            CartObject.objects.create(name='screw', image=upload)
+            data = APIClient().get(reverse('cart:homepage')).json()['results'][0]
+            with open(self.media_root + '/derivatives/cart_object/screw/32w.webp', 'rb') as f:
+                self.assertEqual(f.read(4), b'RIFF')
+
+        self.assertEqual(sorted(data['image_srcset']), ['32w', '64w'])
+        self.assertEqual(data['image_srcset']['64w']['jpeg'],
+                         'http://testserver/media/derivatives/cart_object/screw/64w.jpeg')
+
+
+class CatalogTreeTest(TransactionTestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        cart_object, sub1, _ = create_catalog()
+        for i in range(3):
+            other = Sub1.objects.create(name='sub%d' % i, link=cart_object)
+            FinalProduct.objects.create(name='item', link=other, specification=[], photo='x.png')
+        CartObject.objects.create(name='knob')
+
+    def test_constant_number_of_queries(self):
+        with self.assertNumQueries(3):
+            tree = self.client.get(reverse('cart:tree')).json()
+        self.assertEqual([c['name'] for c in tree], ['knob', 'screw'])
+        self.assertEqual(len(tree[1]['subcategories']), 4)
+        self.assertEqual(tree[1]['subcategories'][0]['products'][0]['name'], 'item_sub0_screw')
+        self.assertEqual(sorted(tree[1]['subcategories'][0]['products'][0]),
+                         ['id', 'model_no', 'name', 'photo'])
+
+    def test_depth(self):
+        with self.assertNumQueries(1):
+            tree = self.client.get(reverse('cart:tree'), {'depth': 1}).json()
+        self.assertEqual(sorted(tree[0]), ['image', 'name'])
+        tree = self.client.get(reverse('cart:tree'), {'depth': 2}).json()
+        self.assertNotIn('products', tree[1]['subcategories'][0])
+
+    def test_cached_and_invalidated(self):
+        self.client.get(reverse('cart:tree'))
+        with self.assertNumQueries(0):
+            self.client.get(reverse('cart:tree'))
+        CartObject.objects.create(name='hinge')
+        self.assertEqual(len(self.client.get(reverse('cart:tree')).json()), 3)
+
+
+class ImportCatalogTest(TransactionTestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.cart_object, self.sub1, self.product = create_catalog()
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def write(self, name, content):
+        path = os.path.join(self.directory, name)
+        with open(path, 'w') as f:
+            f.write(content)
+        return path
+
+    def test_csv_upserts_products_and_variants(self):
+        path = self.write('catalog.csv', (
+            'subcategory,name,model_no,specification,photo,types,prices,stock\n'
+            'wood_screw,polish,P-1,steel|long,,small|large,20|₹35.5,4|2\n'
+            'wood_screw,brass,B-1,,,one,10,1\n'
+            'missing,ghost,,,,,,\n'))
+        out = StringIO()
+        call_command('import_catalog', path, '--batch-size', '2', stdout=out)
+        self.assertIn('1 created, 1 updated, 1 skipped', out.getvalue())
+
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.model_no, 'P-1')
+        self.assertEqual(self.product.specification, ['steel', 'long'])
+        # the photo column was left empty
+        self.assertEqual(self.product.photo.name, 'final_product/polish_wood_screw.png')
+        self.assertEqual([(v.name, v.price, v.stock) for v in self.product.variants.all()],
+                         [('small', Decimal('20'), 4), ('large', Decimal('35.5'), 2)])
+        self.assertEqual(FinalProduct.objects.get(model_no='B-1').name, 'brass_wood_screw')
+        self.assertEqual(FinalProduct.objects.filter(search_vector='brass').count(), 1)
+
+    def test_rows_with_unreadable_prices_are_reported(self):
+        path = self.write('catalog.csv', (
+            'subcategory,name,model_no,specification,photo,types,prices,stock\n'
+            'wood_screw,polish,P-1,,,small|large,20|N/A,4|2\n'
+            'wood_screw,brass,B-1,,,one,12.5.0,1\n'
+            'wood_screw,nut,N-1,,,one,,1\n'
+            'wood_screw,rivet,R-1,,,"one|two","Rs. 1,299.50|5",1|0\n'))
+        out, err = StringIO(), StringIO()
+        call_command('import_catalog', path, stdout=out, stderr=err)
+        self.assertIn('1 created, 0 updated, 0 skipped, 3 invalid', out.getvalue())
+        self.assertIn("invalid row wood_screw/brass: price '12.5.0' of variant 0 is not a number", err.getvalue())
+        self.assertIn('wood_screw/polish', err.getvalue())
+        self.assertIn('wood_screw/nut', err.getvalue())
+
+        # the existing product keeps its variants
+        self.assertEqual([(v.name, v.price) for v in self.product.variants.all()], [('small', Decimal('20'))])
+        self.assertFalse(FinalProduct.objects.filter(model_no__in=['B-1', 'N-1']).exists())
+        rivet = FinalProduct.objects.get(model_no='R-1')
+        self.assertEqual([v.price for v in rivet.variants.all()], [Decimal('1299.50'), Decimal('5')])
+
+    def test_jsonl(self):
+        path = self.write('catalog.jsonl', '{"subcategory": "wood_screw", "name": "hinge", "variants": '
+                                           '[{"name": "x", "price": "5", "stock": 3}]}\n'
+                                           '["wood_screw", "nut"]\n')
+        out, err = StringIO(), StringIO()
+        call_command('import_catalog', path, stdout=out, stderr=err)
+        product = FinalProduct.objects.get(name='hinge_wood_screw')
+        self.assertEqual(product.variants.get().sub_category_id, 'wood_screw')
+        self.assertIn('1 created, 0 updated, 0 skipped, 1 invalid', out.getvalue())
+        self.assertIn("invalid row ['wood_screw', 'nut']: not an object", err.getvalue())
+
+
+@override_settings(ROOT_URLCONF='medhistory.urls_async')
+class AsyncCatalogTest(TransactionTestCase):
+
+    def setUp(self):
+        cache.clear()
+        create_catalog()
+        self.client = AsyncClient()
+
+    def get(self, url):
+        async def request():
+            return await self.client.get(url)
+        return async_to_sync(request)()
+
+    def test_same_responses_as_sync_views(self):
+        for url in ['/cart/homepage/', '/cart/homepage/screw/', '/cart/homepage/screw/wood_screw/',
+                    '/cart/tree/?depth=3', '/cart/search/?q=polish']:
+            response = self.get(url)
+            self.assertEqual(response.status_code, 200)
+            with override_settings(ROOT_URLCONF='medhistory.urls'):
+                expected = Client().get(url)
+            self.assertEqual(response.content, expected.content, url)
+
+    def test_hit_is_served_without_queries(self):
+        self.assertEqual(self.get('/cart/homepage/screw/wood_screw/')['X-Cache'], 'MISS')
+        with self.assertNumQueries(0):
+            response = self.get('/cart/homepage/screw/wood_screw/')
+        self.assertEqual(response['X-Cache'], 'HIT')
+        self.assertEqual(response.json()['results'][0]['name'], 'polish_wood_screw')
+
+    def test_only_reads(self):
+        async def request():
+            return await self.client.post('/cart/homepage/')
+        self.assertEqual(async_to_sync(request)().status_code, 405)
+
+
+class RequestTimingTest(TransactionTestCase):
+    route = 'cart/homepage/<str:prod_cat>/<str:product>/'
+
+    def setUp(self):
+        cache.clear()
+        metrics.reset()
+        create_catalog()
+        self.url = '/cart/homepage/screw/wood_screw/'
+
+    def server_timing(self, response):
+        return dict(part.split(';', 1) for part in response['Server-Timing'].split(', '))
+
+    def test_server_timing_header(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = Client().get(self.url)
+        timing = self.server_timing(response)
+        self.assertEqual(set(timing), {'sql', 'view', 'render', 'total'})
+        self.assertIn('desc="%d queries"' % len(queries), timing['sql'])
+        self.assertIn('desc="0 queries"', self.server_timing(Client().get(self.url))['sql'])
+
+    def test_metrics_endpoint(self):
+        Client().get(self.url)
+        Client().get(self.url)
+        Client().get('/cart/nowhere/')
+        body = Client().get('/metrics').content.decode()
+
+        labels = 'route="%s",method="GET"' % self.route
+        self.assertIn('http_request_duration_seconds_bucket{%s,le="+Inf"} 2' % labels, body)
+        self.assertIn('http_request_duration_seconds_count{%s} 2' % labels, body)
+        self.assertIn('http_responses_total{%s,status="200"} 2' % labels, body)
+        self.assertIn('http_responses_total{route="unmatched",method="GET",status="404"} 1', body)
+        # the miss ran queries, the hit none
+        self.assertIn('http_sql_queries_bucket{route="%s",le="0"} 1' % self.route, body)
+        self.assertIn('# TYPE http_render_duration_seconds histogram', body)
+
+    @override_settings(METRICS_TOKEN='secret')
+    def test_metrics_token(self):
+        self.assertEqual(Client().get('/metrics').status_code, 403)
+        self.assertEqual(Client().get('/metrics', HTTP_AUTHORIZATION='Bearer secret').status_code, 200)
+
+    def test_async_views_count_queries_of_their_threads(self):
+        async def request():
+            return await AsyncClient().get(self.url)
+        timing = self.server_timing(async_to_sync(request)())
+        self.assertNotIn('desc="0 queries"', timing['sql'])
+        self.assertIn('view', timing)
+
+    @override_settings(METRICS_FLUSH_INTERVAL=60)
+    def test_requests_never_flush_to_the_cache(self):
+        # flushing is left to a thread, so an async view never blocks its event loop on the cache
+        with mock.patch.object(metrics, 'get_metrics_cache', side_effect=AssertionError('flushed inline')):
+            async def request():
+                return await AsyncClient().get(self.url)
+            for _ in range(3):
+                self.assertEqual(async_to_sync(request)().status_code, 200)
+        self.assertTrue(metrics._flusher.is_alive())
+        self.assertIn('http_responses_total{route="%s",method="GET",status="200"} 3' % self.route,
+                      Client().get('/metrics').content.decode())
+
+
+class ValuesSerializerTest(TransactionTestCase):
+    """
+    The .values() read path of the list views against the ModelSerializers it stands in for.
+    """
+
+    def setUp(self):
+        cache.clear()
+        cart_object, sub1, product = create_catalog()
+        CartObject.objects.create(name='hinge', image='cart_object/hinge.png')
+        Sub1.objects.create(name='brass door', link=cart_object, photo='sub_1/brass door.png')
+        for i in range(4):
+            other = FinalProduct.objects.create(name='bolt %d' % i, link=sub1, specification=['m%d' % i, '5 mm'],
+                                                photo='final_product/bolt %d_wood_screw.png' % i, model_no='BH-%d' % i)
+            for position, price in enumerate(['0.50', '100.00', '1234.56'][:i]):
+                ProductVariant.objects.create(product=other, name='v%d' % position, price=Decimal(price),
+                                              stock=position * 3, position=2 - position)
+        FinalProduct.objects.create(name='blank', link=sub1, specification=[], photo='')
+
+    def assertSameJson(self, view_class, url, **kwargs):
+        class Reference(view_class):
+            def list(self, request, *args, **kwargs):
+                return mixins.ListModelMixin.list(self, request, *args, **kwargs)
+
+        factory = APIRequestFactory()
+        expected = Reference.as_view()(factory.get(url), **kwargs).render().content
+        response = view_class.as_view()(factory.get(url), **kwargs).render()
+        self.assertEqual(response.content, expected)
+        return response
+
+    def test_same_json_as_model_serializers(self):
+        self.assertSameJson(HomePageView, '/cart/homepage/')
+        self.assertSameJson(Sub1View, '/cart/homepage/screw/', prod_cat='screw')
+        response = self.assertSameJson(FinalProductView, '/cart/homepage/screw/wood_screw/?page_size=3',
+                                       prod_cat='screw', product='wood_screw')
+        self.assertSameJson(FinalProductView, '/cart/homepage/screw/wood_screw/?max_price=200&in_stock=1',
+                            prod_cat='screw', product='wood_screw')
+        self.assertSameJson(ProductSearchView, '/cart/search/?q=bolt')
+
+        # and the next page
+        next_url = response.data['next']
+        self.assertSameJson(FinalProductView, next_url[next_url.index('/cart'):], prod_cat='screw',
+                            product='wood_screw')
+
+    def test_variants_of_a_page_in_one_query(self):
+        with self.assertNumQueries(2):
+            self.client.get('/cart/homepage/screw/wood_screw/')
+
+
+class RendererTest(TransactionTestCase):
+
+    def setUp(self):
+        cache.clear()
+        create_catalog()
+        self.url = '/cart/homepage/screw/wood_screw/'
+
+    def test_orjson_same_bytes_as_drf(self):
+        data = {'name': 'polish \u2028 \u2029 \u00e9 "quoted"', 'price': Decimal('20.50'), 'stock': [0, -1, 2 ** 40],
+                'created': datetime(2020, 5, 1, 10, 30, 15, 123456, tzinfo=timezone.utc), 'day': date(2020, 5, 1),
+                1: None, 'ratio': 0.25, 'nested': [{'empty': {}}, [], True]}
+        self.assertEqual(ORJSONRenderer().render(data), JSONRenderer().render(data))
+        # floats in exponent notation are written differently, but parse to the same numbers
+        self.assertEqual(ORJSONRenderer().render([1e16, 1e-7]), b'[1e16,1e-7]')
+        self.assertEqual(json.loads(ORJSONRenderer().render([1e16, 1e-7])), [1e16, 1e-7])
+        self.assertEqual(ORJSONRenderer().render(float('nan')), b'null')
+        self.assertEqual(ORJSONRenderer().render(2 ** 70), JSONRenderer().render(2 ** 70))
+        indented = ORJSONRenderer().render(data, 'application/json; indent=2')
+        self.assertEqual(indented, JSONRenderer().render(data, 'application/json; indent=2'))
+
+    @skipUnless(msgpack, 'msgpack is not installed')
+    def test_msgpack_by_accept(self):
+        expected = Client().get(self.url).json()
+        client = AsyncClient()
+
+        async def async_get(*args, **kwargs):
+            return await client.get(*args, **kwargs)
+        async_get = async_to_sync(async_get)
+        responses = [Client().get(self.url, HTTP_ACCEPT='application/msgpack') for _ in range(2)]
+        with override_settings(ROOT_URLCONF='medhistory.urls_async'):
+            # the AsyncClient of django 3.1 takes header names as they are, not HTTP_*
+            responses += [async_get(self.url, accept='application/msgpack') for _ in range(2)]
+        # the async hit is negotiated like the sync views
+        self.assertEqual(responses[-1]['X-Cache'], 'HIT')
+        for response in responses:
+            self.assertEqual(response['Content-Type'], 'application/msgpack')
+            self.assertEqual(msgpack.unpackb(response.content), expected)
+        self.assertEqual(Client().get(self.url, HTTP_ACCEPT='application/msgpack, application/json')['Content-Type'],
+                         'application/json')
+
+    @override_settings(COMPRESSION_MIN_SIZE=100)
+    def test_large_bodies_are_compressed(self):
+        plain = Client().get(self.url)
+        self.assertGreater(len(plain.content), 100)
+        self.assertFalse(plain.has_header('Content-Encoding'))
+
+        response = Client().get(self.url, HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(response.content), plain.content)
+        self.assertEqual(response['Content-Length'], str(len(response.content)))
+        self.assertIn('Accept-Encoding', response['Vary'])
+
+        response = Client().get(self.url, HTTP_ACCEPT_ENCODING='br;q=0, gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        if brotli is not None:
+            response = Client().get(self.url, HTTP_ACCEPT_ENCODING='gzip, br')
+            self.assertEqual(response['Content-Encoding'], 'br')
+            self.assertEqual(brotli.decompress(response.content), plain.content)
+
+    def test_small_bodies_are_not(self):
+        response = Client().get(self.url, HTTP_ACCEPT_ENCODING='gzip, br')
+        self.assertLess(len(response.content), settings.COMPRESSION_MIN_SIZE)
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertIn('Accept-Encoding', response['Vary'])
@@ -4,6 +4,10 @@ from django.urls import path
 app_name = 'cart'
 
 urlpatterns = [
+    path('search/', ProductSearchView.as_view(), name='search'),
+    path('tree/', CatalogTreeView.as_view(), name='tree'),
+    path('reservations/', ReserveView.as_view(), name='reserve'),
+    path('reservations/release/', ReleaseReservationView.as_view(), name='release'),
     path('homepage/', HomePageView.as_view(), name='homepage'),
     path('homepage/<str:prod_cat>/', Sub1View.as_view(), name='productcategory'),
     path('homepage/<str:prod_cat>/<str:product>/', FinalProductView.as_view(), name='individualproduct'),
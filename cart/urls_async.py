@@ -0,0 +1,16 @@
+from django.urls import path
+from . import async_views
+from .views import ReserveView, ReleaseReservationView
+
+app_name = 'cart'
+
+# cart/urls.py with the async catalog views, served by medhistory/asgi.py
+urlpatterns = [
+    path('search/', async_views.product_search, name='search'),
+    path('tree/', async_views.catalog_tree, name='tree'),
+    path('reservations/', ReserveView.as_view(), name='reserve'),
+    path('reservations/release/', ReleaseReservationView.as_view(), name='release'),
+    path('homepage/', async_views.homepage, name='homepage'),
+    path('homepage/<str:prod_cat>/', async_views.product_category, name='productcategory'),
+    path('homepage/<str:prod_cat>/<str:product>/', async_views.individual_product, name='individualproduct'),
+]
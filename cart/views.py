@@ -1,24 +1,179 @@
-from rest_framework import generics
-from .models import FinalProduct, CartObject, Sub1
-from .serializers import FinalProductSerializer, CartObjectSerializer, Sub1Serializer
+from decimal import Decimal, InvalidOperation
+from django.db.models import Prefetch
+from rest_framework import generics, status
+from rest_framework.exceptions import ValidationError
+from rest_framework.fields import BooleanField
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.views import APIView
+from .models import FinalProduct, CartObject, Sub1, ProductVariant
+from .serializers import FinalProductSerializer, CartObjectSerializer, Sub1Serializer, ReserveSerializer, \
+    ReleaseSerializer, StockReservationSerializer, TreeCartObjectSerializer, CartObjectValuesSerializer, \
+    Sub1ValuesSerializer, FinalProductValuesSerializer
+from . import reservations
+from .search import search_products
+from .cache import CachedListMixin, HOMEPAGE_SCOPE, TREE_SCOPE, category_scope, subcategory_scope
+from .pagination import CatalogCursorPagination
 
 
-class HomePageView(generics.ListAPIView):
+def parse_boolean(value):
+    # the spellings a BooleanField takes, None for anything else
+    if value in BooleanField.TRUE_VALUES:
+        return True
+    if value in BooleanField.FALSE_VALUES:
+        return False
+    return None
+
+
+class ValuesListMixin:
+    """
+    Lists through `values_serializer_class`, which gives the same json as `serializer_class`
+    from .values() rows. serializer_class is still what the browsable api and schemas use.
+    """
+    values_serializer_class = None
+
+    def list(self, request, *args, **kwargs):
+        serializer = self.values_serializer_class(context=self.get_serializer_context())
+        queryset = serializer.rows(self.filter_queryset(self.get_queryset()))
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(serializer.represent(page))
+        return Response(serializer.represent(queryset))
+
+
+class HomePageView(CachedListMixin, ValuesListMixin, generics.ListAPIView):
     queryset = CartObject.objects.all()
     serializer_class = CartObjectSerializer
+    values_serializer_class = CartObjectValuesSerializer
+    cache_scope = HOMEPAGE_SCOPE
+    pagination_class = CatalogCursorPagination
 
 
-class Sub1View(generics.ListAPIView):
+class Sub1View(CachedListMixin, ValuesListMixin, generics.ListAPIView):
     serializer_class = Sub1Serializer
+    values_serializer_class = Sub1ValuesSerializer
+    pagination_class = CatalogCursorPagination
+
+    def get_cache_scope(self):
+        return category_scope(self.kwargs['prod_cat'])
 
     def get_queryset(self):
         sub_category = self.kwargs['prod_cat']
         return Sub1.objects.filter(link=sub_category)
 
 
-class FinalProductView(generics.ListAPIView):
+class FinalProductView(CachedListMixin, ValuesListMixin, generics.ListAPIView):
     serializer_class = FinalProductSerializer
+    values_serializer_class = FinalProductValuesSerializer
+    pagination_class = CatalogCursorPagination
+    cache_query_params = CachedListMixin.cache_query_params + ('max_price', 'in_stock')
+
+    def get_cache_scope(self):
+        return subcategory_scope(self.kwargs['product'])
+
+    @classmethod
+    def get_cache_query(cls, request):
+        # ?in_stock=1 and ?in_stock=true share an entry, a value that is not a boolean is answered with a 400
+        return [(name, str(parse_boolean(value)) if name == 'in_stock' else value)
+                for name, value in super().get_cache_query(request)]
 
     def get_queryset(self):
         sub_cat = self.kwargs['product']
-        return FinalProduct.objects.filter(link=sub_cat)
+        queryset = FinalProduct.objects.filter(link=sub_cat).prefetch_related('variants')
+
+        # ?max_price=500&in_stock=1 , answered from the partial (sub_category, price) variant index
+        max_price = self.request.query_params.get('max_price')
+        in_stock = self.request.query_params.get('in_stock')
+        if in_stock is not None:
+            in_stock = parse_boolean(in_stock)
+            if in_stock is None:
+                raise ValidationError({'in_stock': 'Must be a valid boolean.'})
+        if max_price is not None or in_stock:
+            variants = ProductVariant.objects.filter(sub_category=sub_cat)
+            if max_price is not None:
+                try:
+                    max_price = Decimal(max_price)
+                except InvalidOperation:
+                    max_price = None
+                if max_price is None or not max_price.is_finite():
+                    raise ValidationError({'max_price': 'A valid number is required.'})
+                variants = variants.filter(price__lte=max_price)
+            if in_stock:
+                variants = variants.filter(stock__gt=0)
+            queryset = queryset.filter(pk__in=variants.values('product_id'))
+        return queryset
+
+
+# CartObject -> Sub1 -> FinalProduct in one response, ?depth=1..3 , one query per level
+class CatalogTreeView(CachedListMixin, generics.ListAPIView):
+    serializer_class = TreeCartObjectSerializer
+    cache_scope = TREE_SCOPE
+    cache_query_params = ('depth',)
+    max_depth = 3
+
+    def get_depth(self):
+        try:
+            depth = int(self.request.query_params.get('depth', self.max_depth))
+        except ValueError:
+            raise ValidationError({'depth': 'A valid integer is required.'})
+        return max(1, min(depth, self.max_depth))
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['depth'] = self.get_depth()
+        return context
+
+    def get_queryset(self):
+        depth = self.get_depth()
+        queryset = CartObject.objects.order_by('name')
+        if depth >= 2:
+            sub1s = Sub1.objects.order_by('name')
+            if depth >= 3:
+                products = FinalProduct.objects.only('id', 'name', 'model_no', 'photo', 'link').order_by('id')
+                sub1s = sub1s.prefetch_related(Prefetch('finalproduct_set', queryset=products,
+                                                        to_attr='tree_products'))
+            queryset = queryset.prefetch_related(Prefetch('sub1_set', queryset=sub1s,
+                                                          to_attr='tree_subcategories'))
+        return queryset
+
+
+class ProductSearchView(ValuesListMixin, generics.ListAPIView):
+    serializer_class = FinalProductSerializer
+    values_serializer_class = FinalProductValuesSerializer
+    # ranked results are cut at `limit` instead of being paged
+    default_limit = 20
+    max_limit = 50
+
+    def get_queryset(self):
+        text = self.request.query_params.get('q', '')
+        try:
+            limit = int(self.request.query_params.get('limit', self.default_limit))
+        except ValueError:
+            raise ValidationError({'limit': 'A valid integer is required.'})
+        limit = max(1, min(limit, self.max_limit))
+        return search_products(text).prefetch_related('variants')[:limit]
+
+
+class ReserveView(APIView):
+    permission_classes = (IsAuthenticated,)
+
+    def post(self, request):
+        serializer = ReserveSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        items = [(item['variant'], item['quantity']) for item in serializer.validated_data['items']]
+        try:
+            reserved = reservations.reserve(items, user=request.user)
+        except reservations.InsufficientStock as e:
+            return Response({'variant': e.variant_id, 'detail': 'not enough stock'},
+                            status=status.HTTP_409_CONFLICT)
+        return Response(StockReservationSerializer(reserved, many=True).data, status=status.HTTP_201_CREATED)
+
+
+class ReleaseReservationView(APIView):
+    permission_classes = (IsAuthenticated,)
+
+    def post(self, request):
+        serializer = ReleaseSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        released = reservations.release(serializer.validated_data['reservations'], user=request.user)
+        return Response({'released': released}, status=status.HTTP_200_OK)
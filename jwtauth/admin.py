@@ -1,3 +1,8 @@
 from django.contrib import admin
+from .models import RevokedToken
 
-# Register your models here.
+
+@admin.register(RevokedToken)
+class RevokedTokenAdmin(admin.ModelAdmin):
+    list_display = ("jti", "user_id", "revoked_at", "expires_at",)
+    search_fields = ("jti",)
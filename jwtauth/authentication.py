@@ -0,0 +1,57 @@
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.utils.translation import gettext_lazy as _
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from .tokens import TOKEN_VERSION_CLAIM, token_version
+
+
+def get_user_cache():
+    return caches[settings.JWT_USER_CACHE_ALIAS]
+
+
+def user_cache_key(user_id):
+    return 'jwtauth:user:%s' % user_id
+
+
+def forget_user(user_id):
+    # now for this process, and again after commit so a request that read the old row meanwhile
+    # can not leave it in the cache
+    key = user_cache_key(user_id)
+    get_user_cache().delete(key)
+    transaction.on_commit(lambda: get_user_cache().delete(key))
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication that keeps the resolved user in the cache for JWT_USER_CACHE_TIMEOUT
+    seconds, a request with a warm cache does not query the database.
+
+    The cached user is dropped whenever the row is saved or deleted (see jwtauth/models.py),
+    so a deactivation or password change is seen right away. Tokens carrying a version
+    claim are rejected once the user's password changed.
+    """
+
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_('Token contained no recognizable user identification'))
+
+        cache = get_user_cache()
+        key = user_cache_key(user_id)
+        user = cache.get(key)
+        if user is None:
+            # raises for unknown and inactive users, those are never cached
+            user = super().get_user(validated_token)
+            cache.set(key, user, timeout=settings.JWT_USER_CACHE_TIMEOUT)
+        elif not user.is_active:
+            raise AuthenticationFailed(_('User is inactive'), code='user_inactive')
+
+        version = validated_token.get(TOKEN_VERSION_CLAIM)
+        if version is not None and version != token_version(user):
+            raise AuthenticationFailed(_('Token is no longer valid'), code='token_not_valid')
+        return user
@@ -0,0 +1,54 @@
+import hashlib
+import math
+
+
+class BloomFilter:
+    """
+    Fixed size set of strings that can answer "maybe in it" or "certainly not".
+
+    Sized for `capacity` items at `error_rate` false positives, it takes
+    -capacity * ln(error_rate) / ln(2)^2 bits whatever the length of the items.
+    The k bit positions come from one blake2b digest split in two 64 bit halves
+    (Kirsch-Mitzenmacher double hashing).
+    """
+
+    def __init__(self, capacity, error_rate=0.001):
+        if capacity <= 0 or not 0 < error_rate < 1:
+            raise ValueError('capacity must be positive and error_rate between 0 and 1')
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.size = max(8, int(math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)))
+        self.hashes = max(1, int(round(self.size / capacity * math.log(2))))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, item):
+        digest = hashlib.blake2b(item.encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        size = self.size
+        return [(h1 + i * h2) % size for i in range(self.hashes)]
+
+    def add(self, item):
+        bits = self.bits
+        for position in self._positions(item):
+            bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, item):
+        bits = self.bits
+        for position in self._positions(item):
+            if not bits[position >> 3] & (1 << (position & 7)):
+                return False
+        return True
+
+    def __len__(self):
+        return self.count
+
+    @property
+    def nbytes(self):
+        return len(self.bits)
+
+    @property
+    def full(self):
+        return self.count >= self.capacity
@@ -0,0 +1,44 @@
+import time
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIRequestFactory
+from jwtauth.authentication import forget_user
+from jwtauth.tokens import VersionedRefreshToken
+from jwtauth.views import HelloView
+
+
+class Command(BaseCommand):
+    help = 'Queries and time per request of a jwt authenticated endpoint, with a cold and a warm user cache'
+
+    def add_arguments(self, parser):
+        parser.add_argument('username')
+        parser.add_argument('--requests', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['username'])
+        except User.DoesNotExist:
+            raise CommandError('no user %s' % options['username'])
+        header = 'Bearer ' + str(VersionedRefreshToken.for_user(user).access_token)
+        factory = APIRequestFactory()
+        view = HelloView.as_view()
+
+        # cold forgets the cached user before every request, warm runs after one request filled it
+        def run(cold):
+            with CaptureQueriesContext(connection) as queries:
+                start = time.perf_counter()
+                for _ in range(options['requests']):
+                    if cold:
+                        forget_user(user.pk)
+                    response = view(factory.get('/api/hello/', HTTP_AUTHORIZATION=header))
+                    if response.status_code != 200:
+                        raise CommandError('request failed with %s' % response.status_code)
+                elapsed = time.perf_counter() - start
+            self.stdout.write('%-5s %8.2f queries/request %10.0f requests/s' % (
+                'cold' if cold else 'warm', len(queries) / options['requests'], options['requests'] / elapsed))
+
+        run(cold=True)
+        view(factory.get('/api/hello/', HTTP_AUTHORIZATION=header))
+        run(cold=False)
@@ -0,0 +1,25 @@
+from django.contrib.auth.models import User
+from django.db import models
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from .authentication import forget_user
+
+
+class RevokedToken(models.Model):
+    """
+    A refresh token that may not be used anymore, checked through the Bloom filter in revocation.py.
+    Rows can go once the token expired, an expired token is refused anyway.
+    """
+    jti = models.CharField(max_length=255, unique=True)
+    # no foreign key, a token of a deleted user can still be revoked
+    user_id = models.PositiveIntegerField(null=True, blank=True, db_index=True)
+    revoked_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+
+# a password change or deactivation must not wait for the cached user to expire,
+# queryset.update() skips these signals, call forget_user after one
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def forget_cached_user(sender, instance, **kwargs):
+    forget_user(instance.pk)
@@ -0,0 +1,115 @@
+import threading
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.utils import timezone
+from rest_framework_simplejwt.settings import api_settings
+from .bloom import BloomFilter
+
+# rows committed out of order are still picked up by an incremental sync if they
+# were created less than this many seconds before the previous sync
+SYNC_MARGIN = 60
+
+
+def _cache():
+    return caches[settings.JWT_REVOCATION_CACHE_ALIAS]
+
+
+GENERATION_KEY = 'jwtauth:revocation:generation'
+
+
+def _generation():
+    cache = _cache()
+    generation = cache.get(GENERATION_KEY)
+    if generation is None:
+        # a lost key must still look like a change to every worker
+        cache.add(GENERATION_KEY, int(time.time() * 1000), timeout=None)
+        generation = cache.get(GENERATION_KEY)
+    return generation
+
+
+def _bump_generation():
+    try:
+        _cache().incr(GENERATION_KEY)
+    except ValueError:
+        _cache().set(GENERATION_KEY, int(time.time() * 1000), timeout=None)
+
+
+class RevocationFilter:
+    """
+    Per process Bloom filter of the revoked token ids that have not expired yet.
+
+    A check costs one cache read of the revocation generation, the database is only asked
+    when the generation moved (rows revoked since the last sync are added) or when the
+    filter says "maybe" for the jti. Full rebuilds happen on start and when the filter
+    is full, with room for twice the live revocations.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.bloom = None
+        self.generation = None
+        self.synced_at = None
+
+    def _rebuild(self):
+        from .models import RevokedToken
+        now = timezone.now()
+        live = RevokedToken.objects.filter(expires_at__gt=now)
+        capacity = max(settings.JWT_REVOCATION_CAPACITY, live.count() * 2)
+        bloom = BloomFilter(capacity, settings.JWT_REVOCATION_ERROR_RATE)
+        for jti in live.values_list('jti', flat=True).iterator():
+            bloom.add(jti)
+        self.bloom, self.synced_at = bloom, now
+
+    def _sync(self):
+        from .models import RevokedToken
+        now = timezone.now()
+        rows = RevokedToken.objects.filter(revoked_at__gte=self.synced_at - timedelta(seconds=SYNC_MARGIN),
+                                           expires_at__gt=now)
+        for jti in rows.values_list('jti', flat=True).iterator():
+            self.bloom.add(jti)
+        self.synced_at = now
+
+    def refresh(self):
+        generation = _generation()
+        if generation == self.generation and self.bloom is not None:
+            return
+        with self.lock:
+            if self.bloom is None or self.bloom.full:
+                self._rebuild()
+            elif generation != self.generation:
+                self._sync()
+            self.generation = generation
+
+    def might_contain(self, jti):
+        self.refresh()
+        return jti in self.bloom
+
+
+_filter = RevocationFilter()
+
+
+def is_revoked(jti):
+    from .models import RevokedToken
+    if not _filter.might_contain(jti):
+        return False
+    return RevokedToken.objects.filter(jti=jti).exists()
+
+
+def revoke(token):
+    """
+    Revoke a validated refresh token, the workers see it as soon as the transaction commits.
+    """
+    from .models import RevokedToken
+    exp = datetime.fromtimestamp(token['exp'], tz=dt_timezone.utc)
+    RevokedToken.objects.bulk_create([RevokedToken(jti=token['jti'], user_id=token.get(api_settings.USER_ID_CLAIM), expires_at=exp)],
+                                     ignore_conflicts=True)
+    transaction.on_commit(_bump_generation)
+
+
+def reset():
+    # forget the filter of this process, for tests
+    global _filter
+    _filter = RevocationFilter()
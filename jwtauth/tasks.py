@@ -0,0 +1,9 @@
+from celery import shared_task
+from django.utils import timezone
+from .models import RevokedToken
+
+
+@shared_task
+def purge_expired_revocations():
+    deleted, _ = RevokedToken.objects.filter(expires_at__lte=timezone.now()).delete()
+    return deleted
@@ -1,3 +1,122 @@
-from django.test import TestCase
+import uuid
+from io import StringIO
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import SimpleTestCase, TransactionTestCase
+from rest_framework.test import APIClient
+from . import revocation
+from .bloom import BloomFilter
+from .models import RevokedToken
 
-# Create your tests here.
+
+class CachedJWTAuthenticationTest(TransactionTestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='9999999999', password='secret')
+        self.client = APIClient()
+
+    def login(self, password='secret'):
+        response = self.client.post('/api/token/', {'username': '9999999999', 'password': password})
+        self.assertEqual(response.status_code, 200)
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + response.data['access'])
+        return response.data
+
+    def test_warm_cache_does_not_query(self):
+        self.login()
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get('/api/hello/').status_code, 200)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get('/api/hello/').status_code, 200)
+
+    def test_password_change_rejects_old_tokens(self):
+        self.login()
+        self.client.get('/api/hello/')
+        self.user.set_password('changed')
+        self.user.save()
+        self.assertEqual(self.client.get('/api/hello/').status_code, 401)
+
+        self.login('changed')
+        self.assertEqual(self.client.get('/api/hello/').status_code, 200)
+
+    def test_deactivation_is_seen_right_away(self):
+        self.login()
+        self.client.get('/api/hello/')
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.client.get('/api/hello/').status_code, 401)
+
+    def test_tokens_without_version_still_work(self):
+        from rest_framework_simplejwt.tokens import RefreshToken
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + str(RefreshToken.for_user(self.user).access_token))
+        self.assertEqual(self.client.get('/api/hello/').status_code, 200)
+
+    def test_benchmark_command(self):
+        out = StringIO()
+        call_command('bench_jwt_auth', '9999999999', '--requests', '20', stdout=out)
+        cold, warm = out.getvalue().splitlines()
+        self.assertIn(' 1.00 queries/request', cold)
+        self.assertIn(' 0.00 queries/request', warm)
+
+
+class RevocationTest(TransactionTestCase):
+
+    def setUp(self):
+        cache.clear()
+        revocation.reset()
+        self.addCleanup(revocation.reset)
+        User.objects.create_user(username='9999999999', password='secret')
+        self.client = APIClient()
+
+    def login(self):
+        return self.client.post('/api/token/', {'username': '9999999999', 'password': 'secret'}).data['refresh']
+
+    def refresh(self, token):
+        return self.client.post('/api/token/refresh/', {'refresh': token}).status_code
+
+    def test_revoked_token_can_not_refresh(self):
+        token, other = self.login(), self.login()
+        self.assertEqual(self.refresh(token), 200)
+        self.assertEqual(self.client.post('/api/token/revoke/', {'refresh': token}).status_code, 200)
+        self.assertEqual(self.refresh(token), 401)
+        self.assertEqual(self.refresh(other), 200)
+        self.assertEqual(RevokedToken.objects.count(), 1)
+
+        # a worker starting now builds its filter from the table
+        revocation.reset()
+        self.assertEqual(self.refresh(token), 401)
+
+    def test_not_revoked_refresh_does_not_query(self):
+        token = self.login()
+        self.client.post('/api/token/revoke/', {'refresh': self.login()})
+        self.assertEqual(self.refresh(token), 200)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.refresh(token), 200)
+
+    def test_other_workers_sync_incrementally(self):
+        token = self.login()
+        self.assertEqual(self.refresh(token), 200)
+        bloom = revocation._filter.bloom
+        self.client.post('/api/token/revoke/', {'refresh': token})
+        self.assertEqual(self.refresh(token), 401)
+        self.assertIs(revocation._filter.bloom, bloom)
+
+
+class BloomFilterTest(SimpleTestCase):
+
+    def test_million_revoked_tokens(self):
+        bloom = BloomFilter(1000000, 0.001)
+        revoked = [uuid.uuid4().hex for _ in range(1000000)]
+        for jti in revoked:
+            bloom.add(jti)
+
+        self.assertTrue(all(jti in bloom for jti in revoked[::1000]))
+        false_positives = sum(uuid.uuid4().hex in bloom for _ in range(100000))
+        self.assertLess(false_positives / 100000, 0.002)
+        # about 1.8MB of bits where a set of the same jtis takes well over 100MB
+        self.assertLess(bloom.nbytes, 2 * 1024 * 1024)
+
+    def test_size_follows_error_rate(self):
+        self.assertLess(BloomFilter(1000, 0.01).nbytes, BloomFilter(1000, 0.001).nbytes)
+        self.assertEqual(BloomFilter(1000, 0.01).hashes, 7)
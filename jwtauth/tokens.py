@@ -0,0 +1,52 @@
+from django.utils.crypto import salted_hmac
+from rest_framework import serializers
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer, TokenRefreshSerializer
+from rest_framework_simplejwt.tokens import RefreshToken
+from . import revocation
+
+TOKEN_VERSION_CLAIM = 'ver'
+
+
+def token_version(user):
+    # follows the password hash, tokens issued before a password change stop working
+    return salted_hmac('jwtauth.token_version', user.password).hexdigest()[:12]
+
+
+class VersionedRefreshToken(RefreshToken):
+    """
+    Refresh token carrying the user's token version, the access tokens made from it copy the claim.
+    """
+
+    @classmethod
+    def for_user(cls, user):
+        token = super().for_user(user)
+        token[TOKEN_VERSION_CLAIM] = token_version(user)
+        return token
+
+
+class VersionedTokenObtainPairSerializer(TokenObtainPairSerializer):
+    @classmethod
+    def get_token(cls, user):
+        return VersionedRefreshToken.for_user(user)
+
+
+def valid_refresh_token(raw):
+    token = RefreshToken(raw)
+    if revocation.is_revoked(token['jti']):
+        raise TokenError('Token is revoked')
+    return token
+
+
+class RevocationCheckingTokenRefreshSerializer(TokenRefreshSerializer):
+    def validate(self, attrs):
+        valid_refresh_token(attrs['refresh'])
+        return super().validate(attrs)
+
+
+class TokenRevokeSerializer(serializers.Serializer):
+    refresh = serializers.CharField()
+
+    def validate(self, attrs):
+        revocation.revoke(valid_refresh_token(attrs['refresh']))
+        return {}
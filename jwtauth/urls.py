@@ -5,8 +5,9 @@ from rest_framework_simplejwt import views as jwt_views
 app_name ='jwtauth'
 
 urlpatterns =[
-    path('token/', jwt_views.TokenObtainPairView.as_view(), name='token_obtain_pair'),
-    path('token/refresh/', jwt_views.TokenRefreshView.as_view(), name='token_refresh'),
+    path('token/', TokenObtainPairView.as_view(), name='token_obtain_pair'),
+    path('token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
+    path('token/revoke/', TokenRevokeView.as_view(), name='token_revoke'),
     path('hello/', HelloView.as_view(), name='hello'),
 
 
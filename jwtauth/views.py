@@ -1,8 +1,23 @@
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
+from rest_framework_simplejwt import views as jwt_views
+from .tokens import VersionedTokenObtainPairSerializer, RevocationCheckingTokenRefreshSerializer, \
+    TokenRevokeSerializer
 
 
+class TokenObtainPairView(jwt_views.TokenObtainPairView):
+    serializer_class = VersionedTokenObtainPairSerializer
+
+
+class TokenRefreshView(jwt_views.TokenRefreshView):
+    serializer_class = RevocationCheckingTokenRefreshSerializer
+
+
+# logout, the refresh token can not be used again
+class TokenRevokeView(jwt_views.TokenViewBase):
+    serializer_class = TokenRevokeSerializer
+
 
 class HelloView(APIView):
     permission_classes = (IsAuthenticated,)
@@ -12,5 +12,7 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'medhistory.settings')
+# async views for signup and the catalog, run with e.g. uvicorn medhistory.asgi:application
+os.environ.setdefault('MEDHISTORY_URLCONF', 'medhistory.urls_async')
 
 application = get_asgi_application()
@@ -0,0 +1,84 @@
+import asyncio
+import contextvars
+import functools
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.db import close_old_connections
+from django.http import HttpResponse
+from rest_framework.exceptions import NotAcceptable
+from rest_framework.negotiation import DefaultContentNegotiation
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+from .renderers import MessagePackRenderer, ORJSONRenderer
+
+# Django's ORM, the cache clients and the broker client block, async views hand that work to
+# a bounded pool of threads so a burst of requests can not open more than ASYNC_IO_THREADS
+# database connections. Password hashing gets its own pool, ASYNC_CPU_THREADS slow hashes
+# at a time never starve the I/O work.
+_executors = {}
+_executors_lock = threading.Lock()
+
+
+def _executor(name, size):
+    executor = _executors.get(name)
+    if executor is None:
+        with _executors_lock:
+            executor = _executors.get(name)
+            if executor is None:
+                executor = _executors[name] = ThreadPoolExecutor(max_workers=size, thread_name_prefix=name)
+    return executor
+
+
+def _with_connection(func, *args, **kwargs):
+    close_old_connections()
+    try:
+        return func(*args, **kwargs)
+    finally:
+        close_old_connections()
+
+
+async def run_blocking(func, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    # in the request's context, so its sql is counted by medhistory/middleware.py
+    call = functools.partial(contextvars.copy_context().run, _with_connection, func, *args, **kwargs)
+    return await loop.run_in_executor(_executor('async-io', settings.ASYNC_IO_THREADS), call)
+
+
+async def run_cpu(func, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor('async-cpu', settings.ASYNC_CPU_THREADS),
+                                      functools.partial(func, *args, **kwargs))
+
+
+def json_response(data, status=200):
+    # rendered like a DRF Response of the sync views
+    return HttpResponse(ORJSONRenderer().render(data), status=status, content_type='application/json')
+
+
+def negotiated_response(request, data, status=200):
+    """
+    `data` rendered in the format DRF would pick for the request, None when that is not json or
+    msgpack (the browsable api) or nothing fits, the sync view has to answer those.
+    """
+    renderers = [renderer() for renderer in api_settings.DEFAULT_RENDERER_CLASSES]
+    try:
+        renderer, media_type = DefaultContentNegotiation().select_renderer(Request(request), renderers)
+    except NotAcceptable:
+        return None
+    if not isinstance(renderer, (JSONRenderer, MessagePackRenderer)):
+        return None
+    response = HttpResponse(renderer.render(data, media_type, {}), status=status, content_type=renderer.media_type)
+    response['Vary'] = 'Accept'
+    return response
+
+
+def request_data(request):
+    if request.content_type == 'application/json':
+        try:
+            return json.loads(request.body or b'{}')
+        except ValueError:
+            return {}
+    return request.POST
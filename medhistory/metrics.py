@@ -0,0 +1,233 @@
+import hashlib
+import logging
+import threading
+import time
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse, HttpResponseForbidden
+from django.utils.crypto import constant_time_compare
+
+# Prometheus histograms and counters shared by every web and celery worker. Observations are
+# added up in the process and flushed to the cache every METRICS_FLUSH_INTERVAL seconds by a
+# thread of its own, so a request (or the event loop of an async view) only pays for a dict
+# update. /metrics renders what the cache holds in the text format.
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+REGISTRY = []
+
+_pending = {}
+_lock = threading.Lock()
+_flusher = None
+_flusher_lock = threading.Lock()
+
+
+def get_metrics_cache():
+    return caches[settings.METRICS_CACHE_ALIAS]
+
+
+def _digest(value):
+    return hashlib.md5(value.encode('utf-8')).hexdigest()
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{%s}' % ','.join('%s="%s"' % (name, _escape(value)) for name, value in pairs)
+
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    type = None
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        REGISTRY.append(self)
+
+    def key(self, labels, field):
+        return 'metrics:%s:%s:%s' % (self.name, _digest('\x00'.join(labels)), field)
+
+    def index_key(self):
+        return 'metrics:series:' + self.name
+
+    def fields(self):
+        raise NotImplementedError
+
+    def samples(self, labels, values):
+        raise NotImplementedError
+
+    def read(self):
+        """
+        {label values: {field: value}} of every series in the cache, flush() first to include this process.
+        """
+        cache = get_metrics_cache()
+        label_sets = sorted(cache.get(self.index_key()) or ())
+        values = cache.get_many([self.key(labels, field) for labels in label_sets for field in self.fields()])
+        return {labels: {field: values.get(self.key(labels, field), 0) for field in self.fields()}
+                for labels in label_sets}
+
+    def _add(self, labels, amounts):
+        labels = tuple(str(value) for value in labels)
+        with _lock:
+            series = _pending.setdefault((self, labels), {})
+            for field, amount in amounts.items():
+                series[field] = series.get(field, 0) + amount
+        _start_flusher()
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def inc(self, *labels, amount=1):
+        self._add(labels, {'value': amount})
+
+    def fields(self):
+        return ['value']
+
+    def samples(self, labels, values):
+        yield self.name + '_total' + _format_labels(self.labels, labels), values['value']
+
+
+class Histogram(Metric):
+    """
+    `scale` turns observations into the integers the cache can incr, the sum of a histogram
+    in seconds is kept in microseconds.
+    """
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labels=(), buckets=DEFAULT_BUCKETS, scale=1000000):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(buckets)
+        self.scale = scale
+
+    def observe(self, value, *labels):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                break
+        else:
+            i = len(self.buckets)
+        self._add(labels, {i: 1, 'sum': int(round(value * self.scale))})
+
+    def fields(self):
+        return list(range(len(self.buckets) + 1)) + ['sum']
+
+    def samples(self, labels, values):
+        seen = 0
+        for i, bound in enumerate(self.buckets + ('+Inf',)):
+            seen += values[i]
+            yield self.name + '_bucket' + _format_labels(self.labels, labels, [('le', bound)]), seen
+        yield self.name + '_sum' + _format_labels(self.labels, labels), values['sum'] / self.scale
+        yield self.name + '_count' + _format_labels(self.labels, labels), seen
+
+    def count(self, values):
+        return sum(values[i] for i in range(len(self.buckets) + 1))
+
+    def quantile(self, values, quantile):
+        # upper bound of the bucket holding the quantile, None if it is above the last bound
+        total = self.count(values)
+        seen = 0
+        for i, bound in enumerate(self.buckets):
+            seen += values[i]
+            if total and seen >= quantile * total:
+                return bound
+        return None
+
+
+def _start_flusher():
+    # also after a fork, the thread of the parent is not running in the child
+    global _flusher
+    if _flusher is not None and _flusher.is_alive():
+        return
+    with _flusher_lock:
+        if _flusher is None or not _flusher.is_alive():
+            _flusher = threading.Thread(target=_run_flusher, name='metrics-flush', daemon=True)
+            _flusher.start()
+
+
+def _run_flusher():
+    while True:
+        time.sleep(settings.METRICS_FLUSH_INTERVAL)
+        try:
+            flush()
+        except Exception:
+            logging.getLogger(__name__).exception('could not flush the metrics')
+
+
+def flush():
+    global _pending
+    with _lock:
+        pending, _pending = _pending, {}
+    if not pending:
+        return
+    cache = get_metrics_cache()
+    series = {}
+    for (metric, labels), fields in pending.items():
+        series.setdefault(metric, set()).add(labels)
+        for field, amount in fields.items():
+            if not amount:
+                continue
+            key = metric.key(labels, field)
+            cache.add(key, 0, timeout=None)
+            try:
+                cache.incr(key, amount)
+            except ValueError:
+                pass
+    # two workers adding series at once can lose one of them, it comes back with the next
+    # flush that has it pending
+    for metric, labels in series.items():
+        known = cache.get(metric.index_key()) or set()
+        if not labels <= known:
+            cache.set(metric.index_key(), known | labels, timeout=None)
+
+
+def exposition():
+    lines = []
+    for metric in REGISTRY:
+        series = metric.read()
+        if not series:
+            continue
+        lines.append('# HELP %s %s' % (metric.name, metric.documentation))
+        lines.append('# TYPE %s %s' % (metric.name, metric.type))
+        for labels, fields in series.items():
+            lines += ['%s %s' % (name, _format_value(value)) for name, value in metric.samples(labels, fields)]
+    return '\n'.join(lines) + '\n'
+
+
+def reset(metrics=None, where=None):
+    """
+    Drop the series of `metrics` (all by default), or only those whose labels, as a dict, pass `where`.
+    """
+    metrics = REGISTRY if metrics is None else metrics
+
+    def dropped(metric, labels):
+        return metric in metrics and (where is None or where(dict(zip(metric.labels, labels))))
+
+    with _lock:
+        for metric, labels in [key for key in _pending if dropped(*key)]:
+            del _pending[(metric, labels)]
+    cache = get_metrics_cache()
+    for metric in metrics:
+        label_sets = cache.get(metric.index_key()) or set()
+        drop = {labels for labels in label_sets if dropped(metric, labels)}
+        cache.delete_many([metric.key(labels, field) for labels in drop for field in metric.fields()])
+        if label_sets - drop:
+            cache.set(metric.index_key(), label_sets - drop, timeout=None)
+        else:
+            cache.delete(metric.index_key())
+
+
+def metrics_view(request):
+    if settings.METRICS_TOKEN and not constant_time_compare(request.META.get('HTTP_AUTHORIZATION', ''),
+                                                            'Bearer ' + settings.METRICS_TOKEN):
+        return HttpResponseForbidden()
+    flush()
+    return HttpResponse(exposition(), content_type='text/plain; version=0.0.4; charset=utf-8')
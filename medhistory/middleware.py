@@ -0,0 +1,237 @@
+import asyncio
+import gzip
+import re
+import time
+from contextvars import ContextVar
+from django.conf import settings
+from django.db import connection
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.utils.cache import patch_vary_headers
+from . import slow_queries
+from .metrics import Counter, Histogram
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+METHODS = {'GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS'}
+
+REQUEST_DURATION = Histogram('http_request_duration_seconds', 'Time spent in the middleware stack and the view.',
+                             ('route', 'method'))
+VIEW_DURATION = Histogram('http_view_duration_seconds', 'Time spent in the view, serializers included.', ('route',))
+RENDER_DURATION = Histogram('http_render_duration_seconds', 'Time spent rendering the response.', ('route',))
+SQL_DURATION = Histogram('http_sql_duration_seconds', 'Time spent in sql queries per request.', ('route',))
+SQL_QUERIES = Histogram('http_sql_queries', 'Sql queries per request.', ('route',), buckets=QUERY_BUCKETS, scale=1)
+RESPONSES = Counter('http_responses', 'Responses by status code.', ('route', 'method', 'status'))
+
+# timings of the request being handled, async views reach it from the threads they run the ORM in
+_current = ContextVar('request_timings', default=None)
+
+
+class RequestTimings:
+    __slots__ = ('start', 'route', 'view_start', 'view_end', 'render_end', 'queries', 'sql')
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.route = None
+        self.view_start = self.view_end = self.render_end = None
+        self.queries = 0
+        self.sql = 0.0
+
+
+def time_queries(execute, sql, params, many, context):
+    timings = _current.get()
+    threshold = settings.SLOW_QUERY_THRESHOLD
+    if timings is None and threshold is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        duration = time.perf_counter() - start
+        if timings is not None:
+            timings.sql += duration
+            timings.queries += 1
+        if threshold is not None and duration >= threshold:
+            slow_queries.sample(sql, params, many, duration, timings.route if timings is not None else None)
+
+
+def instrument(connection):
+    if time_queries not in connection.execute_wrappers:
+        connection.execute_wrappers.append(time_queries)
+
+
+@receiver(connection_created)
+def instrument_new_connection(sender, connection, **kwargs):
+    instrument(connection)
+
+
+class RequestTimingMiddleware:
+    """
+    Times every request (sql, view, render and total), sends the figures back in a Server-Timing
+    header and adds them to the per route histograms served on /metrics.
+    Goes first in MIDDLEWARE so the total covers the whole stack.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = asyncio.iscoroutinefunction(get_response)
+        if self.is_async:
+            # like django's MiddlewareMixin, plus async hooks so django does not run them in a thread
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+            self.process_view = self._process_view_async
+            self.process_template_response = self._process_template_response_async
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        instrument(connection)
+        timings = request._timings = RequestTimings()
+        token = _current.set(timings)
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, timings)
+
+    async def __acall__(self, request):
+        timings = request._timings = RequestTimings()
+        token = _current.set(timings)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, timings)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        timings = request._timings
+        timings.route = request.resolver_match.route
+        timings.view_start = time.perf_counter()
+
+    def process_template_response(self, request, response):
+        timings = request._timings
+        timings.view_end = time.perf_counter()
+
+        def rendered(response):
+            timings.render_end = time.perf_counter()
+        response.add_post_render_callback(rendered)
+        return response
+
+    async def _process_view_async(self, *args):
+        return RequestTimingMiddleware.process_view(self, *args)
+
+    async def _process_template_response_async(self, *args):
+        return RequestTimingMiddleware.process_template_response(self, *args)
+
+    def finish(self, request, response, timings):
+        end = time.perf_counter()
+        total = end - timings.start
+        view = render = None
+        if timings.view_start is not None:
+            view = (timings.view_end or end) - timings.view_start
+        if timings.render_end is not None:
+            render = timings.render_end - timings.view_end
+
+        route = timings.route or 'unmatched'
+        method = request.method if request.method in METHODS else 'other'
+        REQUEST_DURATION.observe(total, route, method)
+        SQL_DURATION.observe(timings.sql, route)
+        SQL_QUERIES.observe(timings.queries, route)
+        if view is not None:
+            VIEW_DURATION.observe(view, route)
+        if render is not None:
+            RENDER_DURATION.observe(render, route)
+        RESPONSES.inc(route, method, response.status_code)
+
+        if settings.SERVER_TIMING:
+            metrics = ['sql;dur=%.2f;desc="%d queries"' % (timings.sql * 1000, timings.queries)]
+            if view is not None:
+                metrics.append('view;dur=%.2f' % (view * 1000))
+            if render is not None:
+                metrics.append('render;dur=%.2f' % (render * 1000))
+            metrics.append('total;dur=%.2f' % (total * 1000))
+            response['Server-Timing'] = ', '.join(metrics)
+        return response
+
+
+# text, json and msgpack shrink, images and archives are compressed already
+COMPRESSIBLE_TYPES = re.compile(r'^(text/|application/(json|javascript|xml|msgpack)\b|application/[\w.+-]+\+(json|xml)\b)')
+
+
+def accepted_encodings(header):
+    """
+    Codings of an Accept-Encoding header a client takes, those with q=0 left out.
+    """
+    accepted = set()
+    for part in header.split(','):
+        coding, _, params = part.partition(';')
+        quality = re.search(r'q\s*=\s*([0-9.]+)', params)
+        try:
+            if quality and float(quality.group(1)) == 0:
+                continue
+        except ValueError:
+            continue
+        accepted.add(coding.strip().lower())
+    return accepted
+
+
+def compress(content, encodings):
+    """
+    (coding, compressed content) with brotli when it is installed and accepted, else gzip.
+    None when the client takes neither.
+    """
+    if brotli is not None and 'br' in encodings:
+        return 'br', brotli.compress(content, quality=settings.COMPRESSION_BROTLI_QUALITY)
+    if 'gzip' in encodings or '*' in encodings:
+        return 'gzip', gzip.compress(content, compresslevel=settings.COMPRESSION_GZIP_LEVEL, mtime=0)
+    return None
+
+
+class CompressionMiddleware:
+    """
+    Like django's GZipMiddleware, with brotli for the clients that take it and a minimum size:
+    bodies under COMPRESSION_MIN_SIZE bytes cost more to compress than they save on the wire.
+    Streamed responses (media files) are left as they are.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = asyncio.iscoroutinefunction(get_response)
+        if self.is_async:
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        return self.process_response(request, self.get_response(request))
+
+    async def __acall__(self, request):
+        return self.process_response(request, await self.get_response(request))
+
+    def process_response(self, request, response):
+        if response.streaming or response.has_header('Content-Encoding') or \
+                not COMPRESSIBLE_TYPES.match(response.get('Content-Type', '')):
+            return response
+        # a cache in front has to keep the compressed and the plain body apart
+        patch_vary_headers(response, ('Accept-Encoding',))
+        if len(response.content) < settings.COMPRESSION_MIN_SIZE:
+            return response
+
+        compressed = compress(response.content, accepted_encodings(request.META.get('HTTP_ACCEPT_ENCODING', '')))
+        if compressed is None or len(compressed[1]) >= len(response.content):
+            return response
+        coding, response.content = compressed
+        response['Content-Length'] = str(len(response.content))
+        response['Content-Encoding'] = coding
+        # the bytes changed, the entity did not
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response['ETag'] = 'W/' + etag
+        return response
@@ -0,0 +1,57 @@
+import orjson
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+_encoder = JSONEncoder()
+
+
+def _default(obj):
+    # whatever DRF's encoder turns into plain python values, datetimes included so they keep its "Z"
+    return _encoder.default(obj)
+
+
+class ORJSONRenderer(JSONRenderer):
+    """
+    DRF's compact JSONRenderer, encoded by orjson. Only floats (and decimals, which DRF encodes
+    as floats) can come out different: orjson writes 1e16 and 1e-7 where the stdlib writes 1e+16
+    and 1e-07, the same numbers to any parser, and writes NaN and infinity as null where DRF's
+    STRICT_JSON raises. The catalog serializers send no floats, so their responses are the same bytes.
+    An indent asked for in the Accept header or by the browsable api falls back to the stdlib encoder.
+    """
+    options = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if not self.compact or self.ensure_ascii or \
+                self.get_indent(accepted_media_type, renderer_context or {}) is not None:
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            ret = orjson.dumps(data, default=_default, option=self.options)
+        except orjson.JSONEncodeError:
+            # e.g. an integer over 64 bits
+            return super().render(data, accepted_media_type, renderer_context)
+        # like DRF, keep the output a strict javascript subset
+        if b'\xe2\x80\xa8' in ret or b'\xe2\x80\xa9' in ret:
+            ret = ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+        return ret
+
+
+class MessagePackRenderer(BaseRenderer):
+    """
+    application/msgpack for clients that ask for it, only offered when msgpack is installed.
+    """
+    media_type = 'application/msgpack'
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return msgpack.packb(data, default=_default, use_bin_type=True)
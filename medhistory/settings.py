@@ -10,10 +10,45 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/3.0/ref/settings/
 """
 from .secrets import ProjectSecretKey, DatabaseSecret
+import importlib.util
 import os
+import sys
 
 CELERY_BROKER_URL = 'amqp://localhost'
 
+# otp and verification messages get their own queue so they never wait behind a
+# bulk send, run a worker per queue: celery -A medhistory worker -Q otp
+CELERY_TASK_DEFAULT_QUEUE = 'default'
+CELERY_TASK_ROUTES = {
+    'braodcaster.tasks.send_parallel_mail': {'queue': 'otp'},
+    'braodcaster.tasks.send_sms': {'queue': 'otp'},
+    'braodcaster.tasks.send_bulk_mail': {'queue': 'bulk'},
+    'braodcaster.tasks.send_bulk_sms': {'queue': 'bulk'},
+    'braodcaster.tasks.start_campaign': {'queue': 'bulk'},
+    'braodcaster.tasks.send_campaign_chunk': {'queue': 'bulk'},
+}
+CELERY_WORKER_PREFETCH_MULTIPLIER = 1
+
+CELERY_BEAT_SCHEDULE = {
+    'release-expired-reservations': {
+        'task': 'cart.tasks.release_expired_reservations',
+        'schedule': 60.0,
+    },
+    'purge-expired-signups': {
+        'task': 'user_signup.tasks.purge_expired_signups',
+        'schedule': 60.0 * 15,
+    },
+    'purge-expired-revocations': {
+        'task': 'jwtauth.tasks.purge_expired_revocations',
+        'schedule': 60.0 * 60,
+    },
+}
+
+TESTING = 'test' in sys.argv
+
+# tests run tasks inline, no broker needed
+CELERY_TASK_ALWAYS_EAGER = TESTING
+
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
@@ -47,10 +82,13 @@ INSTALLED_APPS = [
     'cart',
     'user_signup',
     'braodcaster',
+    'benchmarks',
 
 ]
 
 MIDDLEWARE = [
+    'medhistory.middleware.RequestTimingMiddleware',
+    'medhistory.middleware.CompressionMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -60,7 +98,8 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
-ROOT_URLCONF = 'medhistory.urls'
+# medhistory/asgi.py switches to the async views
+ROOT_URLCONF = os.environ.get('MEDHISTORY_URLCONF', 'medhistory.urls')
 
 TEMPLATES = [
     {
@@ -124,10 +163,101 @@ USE_L10N = True
 
 USE_TZ = True
 
+# Cache
+# https://docs.djangoproject.com/en/3.0/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django_redis.cache.RedisCache',
+        'LOCATION': 'redis://127.0.0.1:6379/1',
+    },
+}
+
+if TESTING:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        },
+    }
+
+# cache used for the cart list endpoints, see cart/cache.py
+CATALOG_CACHE_ALIAS = 'default'
+CATALOG_CACHE_TIMEOUT = 60 * 60 * 6
+
+# seconds a basket keeps its stock before cart.tasks.release_expired_reservations gives it back
+STOCK_RESERVATION_TTL = 60 * 15
+
+# threads of the async views for blocking calls (orm, cache, broker) and for password hashing,
+# see medhistory/async_support.py
+ASYNC_IO_THREADS = 16
+ASYNC_CPU_THREADS = 4
+
+# per request timings sent in a Server-Timing header and served on /metrics, see medhistory/middleware.py.
+# Workers add up their figures and flush them to the cache every METRICS_FLUSH_INTERVAL seconds
+SERVER_TIMING = True
+METRICS_CACHE_ALIAS = 'default'
+METRICS_FLUSH_INTERVAL = 10
+# bearer token /metrics asks for, None leaves it open to whoever can reach it
+METRICS_TOKEN = None
+
+# responses of at least COMPRESSION_MIN_SIZE bytes are sent with brotli (when installed) or gzip,
+# see medhistory/middleware.py
+COMPRESSION_MIN_SIZE = 1024
+COMPRESSION_GZIP_LEVEL = 6
+COMPRESSION_BROTLI_QUALITY = 5
+
+# queries slower than SLOW_QUERY_THRESHOLD seconds are explained off the request path and logged
+# to a rotating jsonl file, see medhistory/slow_queries.py. None turns the sampler off
+SLOW_QUERY_THRESHOLD = None if TESTING else 0.2
+SLOW_QUERY_SAMPLE_RATE = 1.0
+# a fingerprint is explained at most once per interval, EXPLAIN ANALYZE runs the query again
+SLOW_QUERY_EXPLAIN_INTERVAL = 60 * 60
+SLOW_QUERY_EXPLAIN_TIMEOUT = 10
+SLOW_QUERY_LOG = os.path.join(BASE_DIR, 'slow_queries.jsonl')
+SLOW_QUERY_LOG_MAX_BYTES = 10 * 1024 * 1024
+SLOW_QUERY_LOG_BACKUPS = 3
+
+# users resolved from jwt tokens, see jwtauth/authentication.py
+JWT_USER_CACHE_ALIAS = 'default'
+JWT_USER_CACHE_TIMEOUT = 60
+# revoked refresh tokens, see jwtauth/revocation.py
+JWT_REVOCATION_CACHE_ALIAS = 'default'
+JWT_REVOCATION_CAPACITY = 100000
+JWT_REVOCATION_ERROR_RATE = 0.001
+
+# one time passwords live only in the cache, see user_signup/otp.py
+OTP_CACHE_ALIAS = 'default'
+OTP_LENGTH = 6
+OTP_TTL = 50
+# an account code logs in for this long, the password reset takes it only within OTP_TTL
+OTP_ACCOUNT_TTL = 5000
+OTP_MAX_ATTEMPTS = 5
+# a code can be resent after the cooldown, and only within the window after the first one
+OTP_RESEND_COOLDOWN = 20
+OTP_RESEND_WINDOW = 60 * 15
+# abandoned signups (TempUser rows) are deleted this many seconds after their last change
+SIGNUP_RETENTION = 60 * 60 * 24
+SIGNUP_PURGE_BATCH_SIZE = 1000
+
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'jwtauth.authentication.CachedJWTAuthentication',
     ],
+    # orjson for json, msgpack when installed and asked for in the Accept header, see medhistory/renderers.py
+    'DEFAULT_RENDERER_CLASSES': [
+        'medhistory.renderers.ORJSONRenderer',
+    ] + (['medhistory.renderers.MessagePackRenderer'] if importlib.util.find_spec('msgpack') else []) + [
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    # proxies in front of the app that append to X-Forwarded-For, the per ip throttles take the address
+    # the outermost one saw. 0 uses REMOTE_ADDR, DRF's default of None trusts whatever the client sends
+    'NUM_PROXIES': int(os.environ.get('MEDHISTORY_NUM_PROXIES', 0)),
+    # sliding windows in the shared cache, see user_signup/throttling.py
+    'DEFAULT_THROTTLE_RATES': {
+        'otp_ip': '30/hour',
+        'otp_phone': '5/hour',
+        'otp_email': '5/hour',
+    },
 }
 
 # Static files (CSS, JavaScript, Images)
@@ -137,3 +267,32 @@ STATIC_URL = '/static/'
 
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 MEDIA_URL = '/media/'
+
+# widths of the resized catalog images, see cart/images.py
+CATALOG_IMAGE_WIDTHS = (160, 320, 640)
+
+# notification backends, see braodcaster/backends.py. The LocMem ones keep the
+# messages in braodcaster.backends.mail_outbox / sms_outbox for tests
+MAIL_BACKEND = 'braodcaster.backends.LocMemEmailBackend' if TESTING else 'braodcaster.backends.SendGridEmailBackend'
+SMS_BACKEND = 'braodcaster.backends.LocMemSmsBackend' if TESTING else 'braodcaster.backends.TwilioSmsBackend'
+# used by the File backends
+NOTIFICATION_FILE_PATH = os.path.join(BASE_DIR, 'notifications.jsonl')
+NOTIFICATION_POOL_SIZE = 10
+NOTIFICATION_TIMEOUT = 10
+# provider: (calls per second, burst), shared by all workers through the cache
+NOTIFICATION_RATE_LIMITS = {
+    'sendgrid': (10, 50),
+    'twilio': (10, 20),
+}
+NOTIFICATION_RATE_LIMIT_CACHE_ALIAS = 'default'
+# tokens bulk sends must leave in the bucket, so otps still go out during a campaign
+NOTIFICATION_BULK_RESERVE = 5
+# exponential backoff of failed provider calls, in seconds
+NOTIFICATION_RETRY_BACKOFF = 2
+NOTIFICATION_RETRY_BACKOFF_MAX = 600
+# users per campaign chunk task, and how long a worker owns a chunk without saving progress
+CAMPAIGN_CHUNK_SIZE = 1000
+CAMPAIGN_CHUNK_LEASE = 120
+SENDGRID_API_HOST = 'https://api.sendgrid.com'
+# None keeps twilio's own api url
+TWILIO_API_BASE_URL = None
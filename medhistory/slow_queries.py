@@ -0,0 +1,184 @@
+import hashlib
+import json
+import logging
+import os
+import queue
+import random
+import re
+import threading
+import time
+from logging.handlers import RotatingFileHandler
+from django.conf import settings
+from django.core.cache import caches
+from django.db import close_old_connections, connection, transaction
+
+# Queries slower than SLOW_QUERY_THRESHOLD are handed to a thread that explains them and
+# appends one json line per sample to SLOW_QUERY_LOG. The request only pays for a put on a
+# bounded queue, samples are dropped when the thread can not keep up.
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+_LIST = re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)')
+_SPACE = re.compile(r'\s+')
+
+_queue = queue.Queue(maxsize=100)
+_thread = None
+_thread_lock = threading.Lock()
+_handler = None
+dropped = 0
+
+
+def normalize(sql):
+    # literals and placeholders become ?, so the same query with other values has one fingerprint
+    sql = _STRING.sub('?', sql.replace('%s', '?'))
+    sql = _NUMBER.sub('?', sql)
+    sql = _LIST.sub('(?)', sql)
+    return _SPACE.sub(' ', sql).strip()
+
+
+def fingerprint(normalized):
+    return hashlib.md5(normalized.encode('utf-8')).hexdigest()[:16]
+
+
+def sample(sql, params, many, duration, route=None):
+    global dropped
+    # the explains themselves are never sampled
+    if threading.current_thread() is _thread or random.random() >= settings.SLOW_QUERY_SAMPLE_RATE:
+        return
+    _start()
+    try:
+        _queue.put_nowait((sql, None if many else params, duration, route, time.time()))
+    except queue.Full:
+        dropped += 1
+
+
+def wait():
+    # blocks until every queued sample is written, for tests and management commands
+    _queue.join()
+
+
+def _start():
+    global _thread
+    if _thread is not None and _thread.is_alive():
+        return
+    with _thread_lock:
+        if _thread is None or not _thread.is_alive():
+            _thread = threading.Thread(target=_run, name='slow-queries', daemon=True)
+            _thread.start()
+
+
+def _run():
+    while True:
+        item = _queue.get()
+        try:
+            write(*item)
+        except Exception:
+            logging.getLogger(__name__).exception('could not write a slow query sample')
+        finally:
+            close_old_connections()
+            _queue.task_done()
+
+
+def get_handler():
+    # a logging handler only for its locking and size based rollover
+    global _handler
+    path = os.path.abspath(settings.SLOW_QUERY_LOG)
+    if _handler is None or _handler.baseFilename != path:
+        if _handler is not None:
+            _handler.close()
+        _handler = RotatingFileHandler(path, maxBytes=settings.SLOW_QUERY_LOG_MAX_BYTES,
+                                       backupCount=settings.SLOW_QUERY_LOG_BACKUPS)
+        _handler.setFormatter(logging.Formatter('%(message)s'))
+    return _handler
+
+
+def should_explain(fp):
+    # one explain per fingerprint and interval across all workers, ANALYZE runs the query again
+    return caches[settings.METRICS_CACHE_ALIAS].add('slow_query:explained:' + fp, 1,
+                                                    timeout=settings.SLOW_QUERY_EXPLAIN_INTERVAL)
+
+
+def explain(sql, params):
+    # only reads are analyzed, a write is planned but never executed
+    analyze = sql.lstrip()[:6].upper() == 'SELECT'
+    options = 'ANALYZE, BUFFERS, FORMAT JSON' if analyze else 'FORMAT JSON'
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute('SET LOCAL statement_timeout = %s', [int(settings.SLOW_QUERY_EXPLAIN_TIMEOUT * 1000)])
+        cursor.execute('EXPLAIN (%s) %s' % (options, sql), params)
+        plan = cursor.fetchone()[0]
+    return plan[0] if isinstance(plan, list) else json.loads(plan)[0]
+
+
+def write(sql, params, duration, route, at):
+    normalized = normalize(sql)
+    fp = fingerprint(normalized)
+    record = {'time': at, 'fingerprint': fp, 'sql': normalized, 'duration_ms': round(duration * 1000, 2),
+              'route': route, 'pid': os.getpid(), 'plan': None}
+    if params is not None and should_explain(fp):
+        try:
+            record['plan'] = explain(sql, params)
+        except Exception as e:
+            record['explain_error'] = str(e)
+    get_handler().handle(logging.makeLogRecord({'msg': json.dumps(record, default=str)}))
+
+
+# ----report----
+def log_files(path):
+    # oldest rotated file first, like they were written
+    files = ['%s.%d' % (path, i) for i in range(settings.SLOW_QUERY_LOG_BACKUPS, 0, -1)] + [path]
+    return [name for name in files if os.path.exists(name)]
+
+
+def read_samples(path, since=None):
+    for name in log_files(path):
+        with open(name) as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                if since is None or record['time'] >= since:
+                    yield record
+
+
+def plan_nodes(node):
+    yield node
+    for child in node.get('Plans', ()):
+        yield from plan_nodes(child)
+
+
+def plan_summary(plan):
+    root = plan['Plan']
+    nodes = list(plan_nodes(root))
+    return {
+        'node': root['Node Type'],
+        'execution_ms': plan.get('Execution Time'),
+        'rows': root.get('Actual Rows', root.get('Plan Rows')),
+        'shared_hit': root.get('Shared Hit Blocks'),
+        'shared_read': root.get('Shared Read Blocks'),
+        'seq_scans': sorted({node['Relation Name'] for node in nodes
+                             if node['Node Type'] == 'Seq Scan' and 'Relation Name' in node}),
+    }
+
+
+def top_offenders(samples, limit=10):
+    """
+    Samples grouped by fingerprint, the most total time first. Each group keeps the plan of its
+    latest explained sample.
+    """
+    groups = {}
+    for record in samples:
+        group = groups.setdefault(record['fingerprint'], {
+            'fingerprint': record['fingerprint'], 'sql': record['sql'], 'count': 0, 'total_ms': 0.0,
+            'max_ms': 0.0, 'routes': set(), 'last_seen': 0, 'plan': None})
+        group['count'] += 1
+        group['total_ms'] += record['duration_ms']
+        group['max_ms'] = max(group['max_ms'], record['duration_ms'])
+        group['last_seen'] = max(group['last_seen'], record['time'])
+        if record.get('route'):
+            group['routes'].add(record['route'])
+        if record.get('plan'):
+            group['plan'] = record['plan']
+    for group in groups.values():
+        group['mean_ms'] = group['total_ms'] / group['count']
+        group['routes'] = sorted(group['routes'])
+    return sorted(groups.values(), key=lambda group: group['total_ms'], reverse=True)[:limit]
@@ -2,12 +2,15 @@ from django.contrib import admin
 from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
+from .metrics import metrics_view
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/', include('jwtauth.urls')),
     path('cart/', include('cart.urls')),
     path('signup/', include('user_signup.urls')),
+    path('broadcast/', include('braodcaster.urls')),
+    path('metrics', metrics_view, name='metrics'),
     #path('login/', include('user_signup.urls')),
 ]
 
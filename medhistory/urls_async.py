@@ -0,0 +1,19 @@
+from django.contrib import admin
+from django.urls import path, include
+from django.conf import settings
+from django.conf.urls.static import static
+from .metrics import metrics_view
+
+# medhistory/urls.py with the async signup and catalog views, see medhistory/asgi.py
+urlpatterns = [
+    path('admin/', admin.site.urls),
+    path('api/', include('jwtauth.urls')),
+    path('cart/', include('cart.urls_async')),
+    path('signup/', include('user_signup.urls_async')),
+    path('broadcast/', include('braodcaster.urls')),
+    path('metrics', metrics_view, name='metrics'),
+]
+
+if settings.DEBUG:
+    urlpatterns += static(settings.STATIC_URL,document_root =settings.STATIC_ROOT)
+    urlpatterns += static(settings.MEDIA_URL,document_root =settings.MEDIA_ROOT)
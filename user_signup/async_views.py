@@ -0,0 +1,170 @@
+from types import SimpleNamespace
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.contrib.sites.shortcuts import get_current_site
+from django.http import HttpResponseNotAllowed
+from django.utils.encoding import force_bytes
+from django.utils.http import urlsafe_base64_encode
+from rest_framework import status
+from rest_framework.exceptions import Throttled
+from braodcaster.mail import MailVerification
+from braodcaster.tasks import send_parallel_mail, send_sms
+from medhistory.async_support import json_response, request_data, run_blocking, run_cpu
+from . import otp
+from .identity import get_user_by_identifier
+from .models import TempUser, otp_content
+from .throttling import OTP_THROTTLES
+from .token import account_activation_token, get_tokens_for_user
+from .views import temp_user_serializer
+
+# async twins of views.py and views2.py for the asgi urls (medhistory/urls_async.py), same
+# requests and responses. Everything that blocks goes through medhistory.async_support.
+
+
+def _throttle_waits(request, data, kwargs):
+    drf_request = SimpleNamespace(data=data, META=request.META)
+    view = SimpleNamespace(kwargs=kwargs)
+    throttles = [throttle() for throttle in OTP_THROTTLES]
+    return [throttle.wait() for throttle in throttles if not throttle.allow_request(drf_request, view)]
+
+
+async def _throttled(request, data, **kwargs):
+    waits = await run_blocking(_throttle_waits, request, data, kwargs)
+    if waits:
+        return json_response({'detail': Throttled(max(waits)).detail}, status=status.HTTP_429_TOO_MANY_REQUESTS)
+    return None
+
+
+def _save_temp_user(data):
+    serializer = temp_user_serializer(data)
+    if serializer.is_valid():
+        serializer.save()
+        return None
+    return serializer.errors
+
+
+def _resend(ph_no):
+    if not otp.can_resend(otp.SIGNUP, ph_no):
+        return 'unknown'
+    code = otp.issue(otp.SIGNUP, ph_no)
+    if code is None:
+        return 'wait'
+    send_sms.delay(ph_no, otp_content(code))
+    return 'resend'
+
+
+async def signup(request, ph_no=None):
+    if request.method == 'POST':
+        data = request_data(request)
+        response = await _throttled(request, data)
+        if response:
+            return response
+        errors = await run_blocking(_save_temp_user, data)
+        if errors:
+            return json_response(errors, status=status.HTTP_400_BAD_REQUEST)
+        return json_response("otp sent", status=status.HTTP_201_CREATED)
+
+    if request.method == 'GET' and ph_no is not None:
+        response = await _throttled(request, {}, ph_no=ph_no)
+        if response:
+            return response
+        result = await run_blocking(_resend, ph_no)
+        if result == 'unknown':
+            return json_response("no otp to resend, signup again", status=status.HTTP_404_NOT_FOUND)
+        if result == 'wait':
+            return json_response("wait", status=status.HTTP_200_OK)
+        return json_response("resend", status=status.HTTP_202_ACCEPTED)
+    return HttpResponseNotAllowed(['GET', 'POST'])
+
+
+def _create_user(temp_user, password_hash, request):
+    user = User(username=User.normalize_username(temp_user.phone_number),
+                email=User.objects.normalize_email(temp_user.email), password=password_hash,
+                first_name=temp_user.first_name, last_name=temp_user.last_name)
+    user.save()
+    if user.email:
+        MailVerification(user, get_current_site(request))
+    temp_user.delete()
+    return user
+
+
+async def verify_otp(request):
+    if request.method != 'POST':
+        return HttpResponseNotAllowed(['POST'])
+    data_receive = request_data(request)
+    result = await run_blocking(otp.check, otp.SIGNUP, data_receive['phone_number'], data_receive['otp'])
+    if result == otp.INVALID:
+        return json_response("OTP incorrect", status=status.HTTP_200_OK)
+    if result != otp.VALID:
+        return json_response("OTP expire", status=status.HTTP_200_OK)
+
+    temp_user = await run_blocking(TempUser.objects.get, phone_number=data_receive['phone_number'])
+    # the slow part of a signup, on its own pool so it never holds a database thread
+    password_hash = await run_cpu(make_password, temp_user.password)
+    user = await run_blocking(_create_user, temp_user, password_hash, request)
+    if user.email:
+        mail_otp = "please verify your mail also"
+    else:
+        mail_otp = "it will be better if you also provide us your email address"
+
+    x = get_tokens_for_user(user)
+    x["message"] = "phone number verified " + mail_otp
+    return json_response(x, status=status.HTTP_202_ACCEPTED)
+
+
+async def _check_account_otp(data, max_age=None):
+    try:
+        user = await run_blocking(get_user_by_identifier, data['username'])
+    except Exception:
+        return None
+    if await run_blocking(otp.check, otp.ACCOUNT, user.pk, data['otp'], max_age) != otp.VALID:
+        return None
+    return user
+
+
+async def otp_login(request):
+    if request.method != 'POST':
+        return HttpResponseNotAllowed(['POST'])
+    user = await _check_account_otp(request_data(request))
+    if user is None:
+        return json_response("either otp provided is wrong or it expires", status=status.HTTP_200_OK)
+    return json_response(get_tokens_for_user(user), status=status.HTTP_202_ACCEPTED)
+
+
+async def password_reset_otp_verify(request):
+    if request.method != 'POST':
+        return HttpResponseNotAllowed(['POST'])
+    user = await _check_account_otp(request_data(request), max_age=settings.OTP_TTL)
+    if user is None:
+        return json_response("either otp provided is wrong or it expires", status=status.HTTP_200_OK)
+    token = account_activation_token.make_token(user)
+    domain = (await run_blocking(get_current_site, request)).domain
+    uid = urlsafe_base64_encode(force_bytes(user.pk))
+    return json_response('http://' + domain + '/' + 'signup/new_password/' + uid + '/' + token + '/')
+
+
+def _send_account_otp(medium, username):
+    user = get_user_by_identifier(username)
+    code = otp.issue(otp.ACCOUNT, user.pk)
+    if code is None:
+        return
+    if medium == 'sms':
+        send_sms.delay(username, otp_content(code))
+    else:
+        send_parallel_mail.delay("Resset Your Account", "<p>" + otp_content(code) + "</p>", username)
+
+
+async def password_reset(request, medium):
+    if request.method != 'POST' or medium not in ('sms', 'email'):
+        return HttpResponseNotAllowed(['POST'])
+    data = request_data(request)
+    response = await _throttled(request, data, medium=medium)
+    if response:
+        return response
+    await run_blocking(_send_account_otp, medium, data['username'])
+    if medium == 'sms':
+        return json_response("otp send to your number ,if not receive please check mobile number entered",
+                             status=status.HTTP_200_OK)
+    return json_response("otp send to your email ,if not receive please check email entered",
+                         status=status.HTTP_200_OK)
@@ -0,0 +1,58 @@
+import time
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from medhistory import metrics
+from .models import TempUser
+
+# the purge job on /metrics, see medhistory/metrics.py
+DURATION_BUCKETS = (0.1, 0.5, 1, 5, 10, 30, 60, 300)
+
+PURGED = metrics.Counter('signup_purged_rows', 'Abandoned signups (TempUser rows) deleted by the purge.')
+BATCHES = metrics.Counter('signup_purge_batches', 'Delete transactions of the signup purge.')
+DURATION = metrics.Histogram('signup_purge_duration_seconds', 'Time a run of the signup purge took.',
+                             buckets=DURATION_BUCKETS)
+
+
+def purge_totals():
+    """
+    Rows purged, batches and runs over every worker, for the purge_expired_signups command.
+    """
+    metrics.flush()
+    purged, batches, duration = PURGED.read().get(()), BATCHES.read().get(()), DURATION.read().get(())
+    return {
+        'purged_total': purged['value'] if purged else 0,
+        'batches_total': batches['value'] if batches else 0,
+        'runs_total': DURATION.count(duration) if duration else 0,
+    }
+
+
+def purge_expired_signups(retention=None, batch_size=None):
+    """
+    Delete TempUser rows (abandoned signups) untouched for longer than SIGNUP_RETENTION seconds.
+
+    Each batch is its own short transaction: the oldest `batch_size` rows are picked through
+    the index on `date`, locked with SKIP LOCKED so overlapping purge runs never wait on each
+    other or delete the same rows, and deleted by primary key. The table is never locked as a
+    whole. The verify views do not lock the row, a signup verified while its row is purged
+    fails like one whose row is already gone.
+    """
+    retention = settings.SIGNUP_RETENTION if retention is None else retention
+    batch_size = batch_size or settings.SIGNUP_PURGE_BATCH_SIZE
+    cutoff = timezone.now() - timedelta(seconds=retention)
+    start = time.monotonic()
+    purged = batches = 0
+    while True:
+        with transaction.atomic():
+            ids = list(TempUser.objects.filter(date__lt=cutoff).order_by('date')
+                       .select_for_update(skip_locked=True).values_list('pk', flat=True)[:batch_size])
+            if ids:
+                purged += TempUser.objects.filter(pk__in=ids).delete()[0]
+                batches += 1
+        if len(ids) < batch_size:
+            break
+    PURGED.inc(amount=purged)
+    BATCHES.inc(amount=batches)
+    DURATION.observe(time.monotonic() - start)
+    return purged
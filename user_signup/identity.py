@@ -0,0 +1,41 @@
+from django.contrib.auth.models import User
+from django.db import transaction
+
+
+def normalize_identifier(value):
+    # emails are matched case-insensitively, usernames (phone numbers for phone signups) as they are
+    value = str(value or '').strip()
+    return value.lower() if '@' in value else value
+
+
+def user_identifiers(user):
+    from .models import LoginIdentifier
+    identifiers = {normalize_identifier(user.username): LoginIdentifier.USERNAME}
+    if user.email:
+        identifiers.setdefault(normalize_identifier(user.email), LoginIdentifier.EMAIL)
+    return identifiers
+
+
+def sync_identifiers(user):
+    """
+    Make the user's LoginIdentifier rows match its username and email, a value already
+    owned by another user stays with that user.
+    """
+    from .models import LoginIdentifier
+    wanted = user_identifiers(user)
+    existing = set(LoginIdentifier.objects.filter(user=user).values_list('value', flat=True))
+    if existing == set(wanted):
+        return
+    with transaction.atomic():
+        LoginIdentifier.objects.filter(user=user).exclude(value__in=list(wanted)).delete()
+        LoginIdentifier.objects.bulk_create([LoginIdentifier(value=value, kind=kind, user=user)
+                                             for value, kind in wanted.items() if value not in existing],
+                                            ignore_conflicts=True)
+
+
+def get_user_by_identifier(value):
+    """
+    The user whose username or email is `value`, one probe of the unique identifier index.
+    Raises User.DoesNotExist like User.objects.get.
+    """
+    return User.objects.get(login_identifiers__value=normalize_identifier(value))
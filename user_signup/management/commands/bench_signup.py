@@ -0,0 +1,86 @@
+import asyncio
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import AsyncClient, Client
+from django.test.utils import override_settings
+from braodcaster import tasks
+from user_signup import otp
+from user_signup.models import TempUser
+
+
+class Command(BaseCommand):
+    help = ('Concurrent otp verifications (password hashing, user insert and a slow provider call) '
+            'through the wsgi views with a fixed number of workers and through the async views')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--signups', type=int, default=200)
+        parser.add_argument('--concurrency', type=int, default=100)
+        parser.add_argument('--workers', type=int, default=4, help='wsgi worker threads, like gunicorn --workers')
+        parser.add_argument('--provider-latency', type=float, default=0.2,
+                            help='seconds each broker/provider call is made to take')
+
+    def handle(self, *args, **options):
+        # a throwaway database, the benchmark creates users
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        slow = mock.MagicMock(side_effect=lambda *args, **kwargs: time.sleep(options['provider_latency']))
+        try:
+            with mock.patch.object(tasks.send_parallel_mail, 'delay', slow), \
+                    mock.patch.object(tasks.send_sms, 'delay', slow), \
+                    override_settings(ALLOWED_HOSTS=['testserver']):
+                self.report('wsgi', self.run_wsgi(self.prepare('7', options['signups']), options), options)
+                self.report('asgi', self.run_asgi(self.prepare('8', options['signups']), options), options)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    def prepare(self, prefix, count):
+        phone_numbers = [prefix + str(i).zfill(9) for i in range(count)]
+        TempUser.objects.bulk_create([TempUser(first_name='bench', last_name='user', phone_number=phone_number,
+                                               email=phone_number + '@example.com', password='secret')
+                                      for phone_number in phone_numbers])
+        return [{'phone_number': phone_number, 'otp': otp.issue(otp.SIGNUP, phone_number)}
+                for phone_number in phone_numbers]
+
+    def run_wsgi(self, payloads, options):
+        def verify(data):
+            start = time.perf_counter()
+            response = Client().post('/signup/phone_number/verify/', data, content_type='application/json')
+            connection.close()
+            return response.status_code, time.perf_counter() - start
+
+        with override_settings(ROOT_URLCONF='medhistory.urls'):
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=options['workers']) as executor:
+                results = list(executor.map(verify, payloads))
+            return results, time.perf_counter() - start
+
+    def run_asgi(self, payloads, options):
+        async def run():
+            semaphore = asyncio.Semaphore(options['concurrency'])
+            client = AsyncClient()
+
+            async def verify(data):
+                async with semaphore:
+                    start = time.perf_counter()
+                    response = await client.post('/signup/phone_number/verify/', data,
+                                                 content_type='application/json')
+                    return response.status_code, time.perf_counter() - start
+
+            start = time.perf_counter()
+            results = await asyncio.gather(*[verify(data) for data in payloads])
+            return results, time.perf_counter() - start
+
+        with override_settings(ROOT_URLCONF='medhistory.urls_async'):
+            return asyncio.run(run())
+
+    def report(self, name, outcome, options):
+        results, elapsed = outcome
+        failed = sum(1 for status, _ in results if status != 202)
+        latencies = sorted(seconds for _, seconds in results)
+        quantiles = statistics.quantiles(latencies, n=100) if len(latencies) > 1 else latencies * 99
+        self.stdout.write('%s: %d signups in %.2fs, %.1f/s, p50 %.0fms p95 %.0fms p99 %.0fms, %d failed' % (
+            name, len(results), elapsed, len(results) / elapsed,
+            quantiles[49] * 1000, quantiles[94] * 1000, quantiles[98] * 1000, failed))
@@ -0,0 +1,18 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from user_signup.cleanup import purge_expired_signups, purge_totals
+
+
+class Command(BaseCommand):
+    help = 'Delete abandoned signups now (beat runs this every 15 minutes) and print the purge metrics'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--retention', type=int, default=settings.SIGNUP_RETENTION,
+                            help='seconds since the last change of a signup')
+        parser.add_argument('--batch-size', type=int, default=settings.SIGNUP_PURGE_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        purged = purge_expired_signups(options['retention'], options['batch_size'])
+        self.stdout.write('purged %d signups' % purged)
+        for name, value in purge_totals().items():
+            self.stdout.write('%s %s' % (name, value))
@@ -0,0 +1,21 @@
+# Generated by Django 3.1.14 on 2026-10-18 11:23
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('user_signup', '0013_auto_20200623_1638'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='profile',
+            name='otp',
+        ),
+        migrations.RemoveField(
+            model_name='tempuser',
+            name='otp',
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 3.1.14 on 2026-10-18 11:33
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('user_signup', '0014_remove_otp_fields'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LoginIdentifier',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('value', models.CharField(max_length=254, unique=True)),
+                ('kind', models.CharField(choices=[('username', 'username'), ('email', 'email')], max_length=10)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='login_identifiers', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
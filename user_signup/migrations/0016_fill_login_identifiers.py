@@ -0,0 +1,34 @@
+from django.conf import settings
+from django.db import migrations
+
+
+def normalize(value):
+    value = (value or '').strip()
+    return value.lower() if '@' in value else value
+
+
+def fill_login_identifiers(apps, schema_editor):
+    User = apps.get_model(*settings.AUTH_USER_MODEL.split('.'))
+    LoginIdentifier = apps.get_model('user_signup', 'LoginIdentifier')
+
+    # oldest user first, a shared email stays with the account that had it first
+    batch = []
+    for pk, username, email in User.objects.order_by('pk').values_list('pk', 'username', 'email').iterator():
+        batch.append(LoginIdentifier(value=normalize(username), kind='username', user_id=pk))
+        if email and normalize(email) != normalize(username):
+            batch.append(LoginIdentifier(value=normalize(email), kind='email', user_id=pk))
+        if len(batch) >= 1000:
+            LoginIdentifier.objects.bulk_create(batch, ignore_conflicts=True)
+            batch = []
+    LoginIdentifier.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('user_signup', '0015_loginidentifier'),
+    ]
+
+    operations = [
+        migrations.RunPython(fill_login_identifiers, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY keeps signups writable while the index is built
+    atomic = False
+
+    dependencies = [
+        ('user_signup', '0016_fill_login_identifiers'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='tempuser',
+            index=models.Index(fields=['date'], name='tempuser_date_idx'),
+        ),
+    ]
@@ -1,15 +1,15 @@
-from django.db import models
-from django.db.models.signals import pre_save
+from django.db import models, transaction
+from django.db.models.signals import post_save
 from django.dispatch import receiver
-import random
-from braodcaster.sms import PrepareSms
+from braodcaster.tasks import send_sms
+from . import otp
+from .identity import sync_identifiers
 from django.contrib.auth.models import User
 
 
 class Profile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE)
     email_verified = models.BooleanField(default=False)
-    otp = models.CharField(max_length=15, blank=True)
     date = models.DateTimeField(auto_now=True)
 
 
@@ -20,12 +20,50 @@ class TempUser(models.Model):
     phone_number = models.CharField(max_length=13, unique=True)
     date = models.DateTimeField(auto_now=True)
     password = models.CharField(max_length=256)
-    otp = models.CharField(max_length=8, blank=True)
 
+    class Meta:
+        # the purge job picks rows by their last change, see cleanup.py
+        indexes = [
+            models.Index(fields=['date'], name='tempuser_date_idx'),
+        ]
 
-@receiver(pre_save, sender=TempUser)
-def create_sub1(sender, instance, **kwargs):
-    instance.otp = random.randrange(10101, 909090)
-    content = "verification code is: " + str(instance.otp) + "\nthis code will valid for only 45 secs"
-    PrepareSms(instance.phone_number, content)
 
+class LoginIdentifier(models.Model):
+    """
+    Every username and lower-cased email a user can sign in with, so a lookup is one
+    probe of the unique index instead of an OR over auth_user, whose email has no index.
+    """
+    USERNAME = 'username'
+    EMAIL = 'email'
+    KIND_CHOICES = (
+        (USERNAME, 'username'),
+        (EMAIL, 'email'),
+    )
+
+    value = models.CharField(max_length=254, unique=True)
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='login_identifiers')
+
+
+def otp_content(code):
+    return "verification code is: " + code + "\nthis code will valid for only 45 secs"
+
+
+# the otp lives in the cache (see otp.py), the sms goes out from a worker once the signup data is committed
+@receiver(post_save, sender=TempUser)
+def send_otp_sms(sender, instance, **kwargs):
+    phone_number = instance.phone_number
+
+    def send():
+        code = otp.issue(otp.SIGNUP, phone_number)
+        if code is not None:
+            send_sms.delay(phone_number, otp_content(code))
+    transaction.on_commit(send)
+
+
+@receiver(post_save, sender=User)
+def update_login_identifiers(sender, instance, update_fields=None, raw=False, **kwargs):
+    # saves like update_last_login do not touch the identifiers
+    if raw or (update_fields is not None and not {'username', 'email'} & set(update_fields)):
+        return
+    sync_identifiers(instance)
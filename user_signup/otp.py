@@ -0,0 +1,93 @@
+import hashlib
+import hmac
+import secrets
+import time
+from django.conf import settings
+from django.core.cache import caches
+
+# what an otp was issued for, a code of one purpose is never accepted for another
+SIGNUP = 'signup'
+# password reset and otp login, both answered by the code PasswordResetView sends, see OTP_ACCOUNT_TTL
+ACCOUNT = 'account'
+
+VALID = 'valid'
+INVALID = 'invalid'
+EXPIRED = 'expired'
+
+
+def get_otp_cache():
+    return caches[settings.OTP_CACHE_ALIAS]
+
+
+def _key(purpose, identifier, suffix=''):
+    return 'otp:%s:%s%s' % (purpose, identifier, suffix)
+
+
+def _digest(purpose, identifier, code):
+    # only a keyed hash is stored, a dump of the cache does not give away live codes
+    message = ('%s:%s:%s' % (purpose, identifier, code)).encode('utf-8')
+    return hmac.new(settings.SECRET_KEY.encode('utf-8'), message, hashlib.sha256).hexdigest()
+
+
+def _ttl(purpose):
+    return settings.OTP_ACCOUNT_TTL if purpose == ACCOUNT else settings.OTP_TTL
+
+
+def _generate():
+    return str(secrets.randbelow(10 ** settings.OTP_LENGTH)).zfill(settings.OTP_LENGTH)
+
+
+def issue(purpose, identifier):
+    """
+    Create a new code for `identifier`, replacing the previous one and its attempts.
+
+    Returns the code, it is not kept anywhere in clear. Returns None when a code was issued
+    less than OTP_RESEND_COOLDOWN ago: repeated requests are coalesced into the message
+    already on its way instead of paying for another one.
+    """
+    cache = get_otp_cache()
+    if not cache.add(_key(purpose, identifier, ':cooldown'), 1, timeout=settings.OTP_RESEND_COOLDOWN):
+        return None
+    code = _generate()
+    cache.set(_key(purpose, identifier), (_digest(purpose, identifier, code), time.time()), timeout=_ttl(purpose))
+    cache.delete_many([_key(purpose, identifier, ':attempts'), _key(purpose, identifier, ':used')])
+    cache.set(_key(purpose, identifier, ':issued'), 1, timeout=settings.OTP_RESEND_WINDOW)
+    return code
+
+
+def can_resend(purpose, identifier):
+    return get_otp_cache().get(_key(purpose, identifier, ':issued')) is not None
+
+
+def check(purpose, identifier, code, max_age=None):
+    """
+    Returns VALID once for the right code, INVALID for a wrong one and EXPIRED when there is
+    no code (anymore) or it was issued more than `max_age` seconds ago. After OTP_MAX_ATTEMPTS
+    wrong guesses the code is burnt.
+    """
+    cache = get_otp_cache()
+    key = _key(purpose, identifier)
+    stored = cache.get(key)
+    if stored is None:
+        return EXPIRED
+    digest, issued = stored
+    if max_age is not None and time.time() - issued > max_age:
+        return EXPIRED
+
+    attempts_key = _key(purpose, identifier, ':attempts')
+    cache.add(attempts_key, 0, timeout=_ttl(purpose))
+    try:
+        attempts = cache.incr(attempts_key)
+    except ValueError:
+        attempts = 1
+    if attempts > settings.OTP_MAX_ATTEMPTS:
+        cache.delete(key)
+        return EXPIRED
+
+    if not hmac.compare_digest(digest, _digest(purpose, identifier, str(code).strip())):
+        return INVALID
+    # add is atomic, of two requests with the right code only one gets it accepted
+    if not cache.add(_key(purpose, identifier, ':used'), 1, timeout=_ttl(purpose)):
+        return EXPIRED
+    cache.delete_many([key, attempts_key])
+    return VALID
@@ -0,0 +1,282 @@
+import re
+import time
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.utils import timezone
+from asgiref.sync import async_to_sync
+from django.test import AsyncClient, TransactionTestCase, override_settings
+from rest_framework.parsers import JSONParser
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
+from rest_framework.views import APIView
+from braodcaster import backends
+from medhistory import metrics
+from . import otp
+from .cleanup import purge_expired_signups, purge_totals
+from .identity import get_user_by_identifier
+from .models import LoginIdentifier, TempUser
+from .throttling import OtpIpThrottle, OtpPhoneThrottle
+
+
+class OtpStoreTest(TransactionTestCase):
+
+    def setUp(self):
+        backends.sms_outbox.clear()
+        backends.mail_outbox.clear()
+        cache.clear()
+        self.client = APIClient()
+
+    def last_code(self):
+        return re.search(r'\d{6}', backends.sms_outbox[-1]['content']).group()
+
+    def test_code_is_single_use(self):
+        code = otp.issue(otp.SIGNUP, '9999999999')
+        self.assertEqual(otp.check(otp.ACCOUNT, '9999999999', code), otp.EXPIRED)
+        self.assertEqual(otp.check(otp.SIGNUP, '9999999999', code), otp.VALID)
+        self.assertEqual(otp.check(otp.SIGNUP, '9999999999', code), otp.EXPIRED)
+
+    def test_code_is_burnt_after_max_attempts(self):
+        code = otp.issue(otp.SIGNUP, '9999999999')
+        wrong = str((int(code) + 1) % 10 ** 6).zfill(6)
+        with self.settings(OTP_MAX_ATTEMPTS=3):
+            self.assertEqual([otp.check(otp.SIGNUP, '9999999999', wrong) for _ in range(3)], [otp.INVALID] * 3)
+            self.assertEqual(otp.check(otp.SIGNUP, '9999999999', code), otp.EXPIRED)
+
+    def test_code_expires(self):
+        with self.settings(OTP_TTL=1):
+            code = otp.issue(otp.SIGNUP, '9999999999')
+        with mock.patch('time.time', return_value=time.time() + 2):
+            self.assertEqual(otp.check(otp.SIGNUP, '9999999999', code), otp.EXPIRED)
+
+    def test_code_is_not_stored_in_clear(self):
+        code = otp.issue(otp.SIGNUP, '9999999999')
+        self.assertNotIn(code, str(cache.get('otp:signup:9999999999')))
+
+    def test_signup_verify_and_resend(self):
+        TempUser.objects.create(first_name='a', last_name='b', phone_number='9999999999', password='x')
+        first = self.last_code()
+
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get('/signup/9999999999/resend/').data, 'wait')
+        with mock.patch('time.time', return_value=time.time() + 21):
+            with self.assertNumQueries(0):
+                self.assertEqual(self.client.get('/signup/9999999999/resend/').status_code, 202)
+        self.assertEqual(len(backends.sms_outbox), 2)
+        self.assertEqual(self.client.get('/signup/8888888888/resend/').status_code, 404)
+
+        with self.assertNumQueries(0):
+            response = self.client.post('/signup/phone_number/verify/', {'phone_number': '9999999999', 'otp': first})
+        self.assertEqual(response.data, 'OTP incorrect')
+        response = self.client.post('/signup/phone_number/verify/',
+                                    {'phone_number': '9999999999', 'otp': self.last_code()})
+        self.assertEqual(response.status_code, 202)
+        self.assertTrue(User.objects.filter(username='9999999999').exists())
+        self.assertFalse(TempUser.objects.exists())
+
+    def test_password_reset_and_login(self):
+        User.objects.create_user(username='9999999999', email='a@example.com', password='x')
+        self.client.post('/signup/password_reset/sms/', {'username': '9999999999'})
+        code = self.last_code()
+        response = self.client.post('/signup/password_reset/otp/verify/', {'username': '9999999999', 'otp': code})
+        self.assertIn('/signup/new_password/', response.data)
+        response = self.client.post('/signup/otp/login/', {'username': '9999999999', 'otp': code})
+        self.assertEqual(response.data, 'either otp provided is wrong or it expires')
+
+        self.client.post('/signup/password_reset/sms/', {'username': '9999999999'})
+        self.assertEqual(len(backends.sms_outbox), 1)
+
+        with mock.patch('time.time', return_value=time.time() + 21):
+            self.client.post('/signup/password_reset/email/', {'username': 'a@example.com'})
+        code = re.search(r'\d{6}', backends.mail_outbox[-1]['content']).group()
+        response = self.client.post('/signup/otp/login/', {'username': 'a@example.com', 'otp': code})
+        self.assertEqual(response.status_code, 202)
+        self.assertIn('access', response.data)
+
+    def test_account_code_logs_in_longer_than_it_resets(self):
+        User.objects.create_user(username='9999999999', password='x')
+        self.client.post('/signup/password_reset/sms/', {'username': '9999999999'})
+        code = self.last_code()
+        with mock.patch('time.time', return_value=time.time() + settings.OTP_TTL + 1):
+            response = self.client.post('/signup/password_reset/otp/verify/', {'username': '9999999999', 'otp': code})
+            self.assertEqual(response.data, 'either otp provided is wrong or it expires')
+            response = self.client.post('/signup/otp/login/', {'username': '9999999999', 'otp': code})
+        self.assertEqual(response.status_code, 202)
+
+
+class OtpThrottleTest(TransactionTestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.view = APIView()
+        self.view.kwargs = {}
+
+    def take(self, throttle, request, at):
+        with mock.patch.object(throttle, 'timer', return_value=at):
+            return throttle.allow_request(request, self.view)
+
+    def test_window_slides(self):
+        request = APIRequestFactory().post('/', {'phone_number': '+91 99999 99999'}, format='json')
+        request = Request(request, parsers=[JSONParser()])
+        throttle = OtpPhoneThrottle()
+        self.assertEqual((throttle.num_requests, throttle.duration), (5, 3600))
+        start = 3600 * 1000
+
+        self.assertEqual([self.take(throttle, request, start + 3000 + i) for i in range(6)], [True] * 5 + [False])
+        self.assertGreater(throttle.wait(), 0)
+        self.assertFalse(self.take(throttle, request, start + 3601))
+        # half of the previous window still counts, 2.5 + 2 requests fit
+        halfway = start + 3600 + 1800
+        self.assertEqual([self.take(throttle, request, halfway) for _ in range(3)], [True, True, False])
+
+    def test_ip_limit_ignores_spoofed_forwarded_for(self):
+        factory = APIRequestFactory()
+        throttle = OtpIpThrottle()
+        allowed = [self.take(throttle, factory.post('/', REMOTE_ADDR='10.0.0.1', HTTP_X_FORWARDED_FOR='1.2.3.%d' % i),
+                             1000) for i in range(31)]
+        self.assertEqual(allowed, [True] * 30 + [False])
+
+    def test_ip_behind_proxies(self):
+        factory = APIRequestFactory()
+        throttle = OtpIpThrottle()
+        with self.settings(REST_FRAMEWORK=dict(settings.REST_FRAMEWORK, NUM_PROXIES=1)):
+            # the proxy appends the address it saw, whatever the client put before it does not count
+            allowed = [self.take(throttle, factory.post('/', REMOTE_ADDR='10.0.0.1',
+                                                        HTTP_X_FORWARDED_FOR='1.2.3.%d, 5.6.7.8' % i), 1000)
+                       for i in range(31)]
+            self.assertEqual(allowed, [True] * 30 + [False])
+            self.assertTrue(self.take(throttle, factory.post('/', REMOTE_ADDR='10.0.0.1',
+                                                             HTTP_X_FORWARDED_FOR='5.6.7.9'), 1000))
+
+    def test_resend_is_limited_per_phone_number(self):
+        responses = [self.client.get('/signup/9999999999/resend/').status_code for _ in range(6)]
+        self.assertEqual(responses, [404] * 5 + [429])
+        self.assertEqual(self.client.get('/signup/8888888888/resend/').status_code, 404)
+
+    def test_limits_are_shared_by_phone_and_email_variants(self):
+        User.objects.create_user(username='9999999999', email='a@example.com', password='x')
+        # the variants are not usernames, the view fails on them after the throttle counted them
+        self.client.raise_request_exception = False
+        for username in ['9999999999', '+919999999999', '99999 99999', '9999999999', '9999999999']:
+            self.client.post('/signup/password_reset/sms/', {'username': username})
+        self.assertEqual(self.client.post('/signup/password_reset/sms/', {'username': '9999999999'}).status_code, 429)
+        for username in ['a@example.com', 'A@example.com'] * 2 + ['a@example.com']:
+            self.client.post('/signup/password_reset/email/', {'username': username})
+        self.assertEqual(self.client.post('/signup/password_reset/email/',
+                                          {'username': 'a@example.com'}).status_code, 429)
+
+
+@override_settings(ROOT_URLCONF='medhistory.urls_async')
+class AsyncSignupTest(TransactionTestCase):
+
+    def setUp(self):
+        backends.sms_outbox.clear()
+        cache.clear()
+        self.client = AsyncClient()
+
+    def request(self, method, url, data=None):
+        async def request():
+            return await getattr(self.client, method)(url, data, content_type='application/json')
+        return async_to_sync(request)()
+
+    def post(self, url, data):
+        return self.request('post', url, data)
+
+    def get(self, url):
+        return self.request('get', url)
+
+    def test_signup_and_verify(self):
+        response = self.post('/signup/signup/', {'first_name': 'a', 'last_name': 'b', 'phone_number': '9999999999',
+                                                  'email': 'a@example.com', 'password': 'secret'})
+        self.assertEqual((response.status_code, response.json()), (201, 'otp sent'))
+        code = re.search(r'\d{6}', backends.sms_outbox[-1]['content']).group()
+        self.assertEqual(self.get('/signup/9999999999/resend/').json(), 'wait')
+
+        response = self.post('/signup/phone_number/verify/', {'phone_number': '9999999999', 'otp': code})
+        self.assertEqual(response.status_code, 202)
+        self.assertIn('access', response.json())
+        user = User.objects.get(username='9999999999')
+        self.assertTrue(user.check_password('secret'))
+        self.assertFalse(TempUser.objects.exists())
+
+        self.post('/signup/password_reset/sms/', {'username': '9999999999'})
+        code = re.search(r'\d{6}', backends.sms_outbox[-1]['content']).group()
+        response = self.post('/signup/otp/login/', {'username': '9999999999', 'otp': code})
+        self.assertEqual(response.status_code, 202)
+        response = self.post('/signup/otp/login/', {'username': '9999999999', 'otp': code})
+        self.assertEqual(response.json(), 'either otp provided is wrong or it expires')
+
+    def test_throttled(self):
+        statuses = [self.get('/signup/9999999999/resend/').status_code for _ in range(6)]
+        self.assertEqual(statuses, [404] * 5 + [429])
+
+
+class LoginIdentifierTest(TransactionTestCase):
+
+    def test_lookup_is_one_query(self):
+        user = User.objects.create_user(username='9999999999', email='Someone@Example.com')
+        with self.assertNumQueries(1):
+            self.assertEqual(get_user_by_identifier('9999999999'), user)
+        with self.assertNumQueries(1):
+            self.assertEqual(get_user_by_identifier(' someone@example.COM'), user)
+        with self.assertRaises(User.DoesNotExist):
+            get_user_by_identifier('nobody@example.com')
+
+    def test_identifiers_follow_the_user(self):
+        user = User.objects.create_user(username='9999999999', email='a@example.com')
+        user.email = 'b@example.com'
+        user.save()
+        self.assertEqual(set(user.login_identifiers.values_list('value', flat=True)), {'9999999999', 'b@example.com'})
+        with self.assertNumQueries(1):
+            user.save(update_fields=['last_login'])
+
+    def test_shared_email_stays_with_first_user(self):
+        first = User.objects.create_user(username='9999999999', email='a@example.com')
+        User.objects.create_user(username='8888888888', email='A@example.com')
+        self.assertEqual(get_user_by_identifier('a@example.com'), first)
+        self.assertEqual(LoginIdentifier.objects.count(), 3)
+
+    def test_explain_uses_the_unique_index(self):
+        User.objects.create_user(username='9999999999', email='a@example.com')
+        plan = User.objects.filter(login_identifiers__value='a@example.com').explain()
+        self.assertNotIn('Seq Scan on auth_user', plan)
+        self.assertNotIn('Seq Scan on user_signup_loginidentifier', plan)
+
+
+class PurgeSignupsTest(TransactionTestCase):
+
+    def setUp(self):
+        cache.clear()
+        metrics.reset()
+
+    def create(self, count, age):
+        TempUser.objects.bulk_create([TempUser(first_name='a', last_name='b', phone_number='9%09d' % (age * 100 + i),
+                                               email='%d-%d@example.com' % (age, i), password='x')
+                                      for i in range(count)])
+        TempUser.objects.filter(email__startswith='%d-' % age) \
+            .update(date=timezone.now() - timedelta(seconds=age))
+
+    def test_only_expired_rows_go_in_batches(self):
+        self.create(25, age=7200)
+        self.create(5, age=60)
+        # a select and a delete per batch
+        with self.assertNumQueries(6):
+            purged = purge_expired_signups(retention=3600, batch_size=10)
+        self.assertEqual(purged, 25)
+        self.assertEqual(TempUser.objects.count(), 5)
+
+        self.assertEqual(purge_totals(), {'purged_total': 25, 'batches_total': 3, 'runs_total': 1})
+        purge_expired_signups(retention=3600, batch_size=10)
+        self.assertEqual(purge_totals()['runs_total'], 2)
+        self.assertIn('signup_purged_rows_total 25\n', metrics.exposition())
+
+    def test_command(self):
+        self.create(3, age=10 ** 6)
+        out = StringIO()
+        call_command('purge_expired_signups', stdout=out)
+        self.assertIn('purged 3 signups', out.getvalue())
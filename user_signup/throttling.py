@@ -0,0 +1,109 @@
+import re
+from django.core.cache import cache as default_cache
+from rest_framework.throttling import SimpleRateThrottle
+
+
+class SlidingWindowThrottle(SimpleRateThrottle):
+    """
+    Sliding window counter kept in the shared cache, so a limit holds across every worker.
+
+    DRF's SimpleRateThrottle keeps a list of timestamps with get/set, two workers can both
+    read the old list and both let a request through. Here each fixed window is one counter
+    changed with incr only, and the previous window is weighted by how much of it still
+    overlaps the sliding window. Rejected requests are not counted.
+    """
+    cache = default_cache
+
+    def get_ident_value(self, request, view):
+        raise NotImplementedError
+
+    def get_cache_key(self, request, view):
+        ident = self.get_ident_value(request, view)
+        if not ident:
+            return None
+        return 'throttle:%s:%s' % (self.scope, ident)
+
+    def allow_request(self, request, view):
+        if self.rate is None:
+            return True
+        self.key = self.get_cache_key(request, view)
+        if self.key is None:
+            return True
+
+        self.now = self.timer()
+        window = int(self.now // self.duration)
+        current_key, previous_key = '%s:%d' % (self.key, window), '%s:%d' % (self.key, window - 1)
+        self.cache.add(current_key, 0, timeout=self.duration * 2)
+        try:
+            current = self.cache.incr(current_key)
+        except ValueError:
+            current = 1
+        previous = self.cache.get(previous_key) or 0
+        self.overlap = 1 - (self.now % self.duration) / self.duration
+
+        if previous * self.overlap + current > self.num_requests:
+            self.cache.decr(current_key)
+            self.previous, self.current = previous, current - 1
+            return self.throttle_failure()
+        return self.throttle_success()
+
+    def throttle_success(self):
+        return True
+
+    def wait(self):
+        # the previous window weighs less every second, wait until one more request fits
+        remaining = self.duration - self.now % self.duration
+        if self.current + 1 > self.num_requests or not self.previous:
+            return remaining
+        fits_at = (self.num_requests - self.current - 1) / self.previous
+        return max((self.overlap - fits_at) * self.duration, 0)
+
+
+def _phone_number(value):
+    value = re.sub(r'[^0-9]', '', str(value or ''))
+    return value[-10:] if value else None
+
+
+def _email(value):
+    value = str(value or '').strip().lower()
+    return value if '@' in value else None
+
+
+def _request_value(request, view, *names):
+    for name in names:
+        value = view.kwargs.get(name) if getattr(view, 'kwargs', None) else None
+        if value is None and hasattr(request, 'data'):
+            try:
+                value = request.data.get(name)
+            except AttributeError:
+                value = None
+        if value:
+            return value
+    return None
+
+
+class OtpIpThrottle(SlidingWindowThrottle):
+    # the client address as the trusted proxies saw it, see NUM_PROXIES in settings
+    scope = 'otp_ip'
+
+    def get_ident_value(self, request, view):
+        return self.get_ident(request)
+
+
+class OtpPhoneThrottle(SlidingWindowThrottle):
+    # the resend url carries the number, signup posts it and password reset posts it as username
+    scope = 'otp_phone'
+
+    def get_ident_value(self, request, view):
+        value = _request_value(request, view, 'ph_no', 'phone_number', 'username')
+        return None if _email(value) else _phone_number(value)
+
+
+class OtpEmailThrottle(SlidingWindowThrottle):
+    scope = 'otp_email'
+
+    def get_ident_value(self, request, view):
+        return _email(_request_value(request, view, 'email', 'username'))
+
+
+OTP_THROTTLES = (OtpIpThrottle, OtpPhoneThrottle, OtpEmailThrottle)
@@ -1,6 +1,6 @@
 from django.contrib.auth.tokens import PasswordResetTokenGenerator
 from six import text_type
-from rest_framework_simplejwt.tokens import RefreshToken
+from jwtauth.tokens import VersionedRefreshToken
 
 
 class TokenGenerator(PasswordResetTokenGenerator):
@@ -14,7 +14,7 @@ account_activation_token = TokenGenerator()
 
 
 def get_tokens_for_user(user):
-    refresh = RefreshToken.for_user(user)
+    refresh = VersionedRefreshToken.for_user(user)
     return {
         'refresh': str(refresh),
         'access': str(refresh.access_token),
@@ -0,0 +1,19 @@
+from django.conf.urls import url
+from django.urls import path
+from . import async_views
+from . import views
+from . import views2
+
+# user_signup/urls.py with the async views, served by medhistory/asgi.py
+urlpatterns = [
+    path('signup/', async_views.signup, name='signup'),
+    path('<str:ph_no>/resend/', async_views.signup, name='resend'),
+    path('phone_number/verify/', async_views.verify_otp, name='verify'),
+    path('password_reset/<str:medium>/', async_views.password_reset),
+    path('otp/login/', async_views.otp_login, name='otplogin'),
+    path('password_reset/otp/verify/', async_views.password_reset_otp_verify, name='otpverify'),
+    url(r'^verify_email/(?P<uidb64>[0-9A-Za-z_\-]+)/(?P<token>[0-9A-Za-z]{1,13}-[0-9A-Za-z]{1,20})/$',
+        views.activate_account, name='activate'),
+    url(r'^new_password/(?P<uidb64>[0-9A-Za-z_\-]+)/(?P<token>[0-9A-Za-z]{1,13}-[0-9A-Za-z]{1,20})/$',
+        views2.reset_password, name='newpassword'),
+]
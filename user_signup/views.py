@@ -2,8 +2,7 @@ from .serializers import TempUserSerializer
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework import status
-from .models import TempUser, Profile
-from datetime import datetime, timezone
+from .models import TempUser, Profile, otp_content
 from .token import get_tokens_for_user
 from django.http import HttpResponse
 from django.contrib.sites.shortcuts import get_current_site
@@ -12,66 +11,70 @@ from django.utils.http import urlsafe_base64_decode
 from .token import account_activation_token
 from django.contrib.auth.models import User
 from .tasks import send_parallel_mail
+from braodcaster.tasks import send_sms
+from . import otp
+from .throttling import OTP_THROTTLES
 from django.utils.http import urlsafe_base64_encode
 from braodcaster.mail import MailVerification
 
+def temp_user_serializer(data):
+    try:
+        t = TempUser.objects.get(data['phone_number'])
+        return TempUserSerializer(t, data=data)
+    except Exception:
+        return TempUserSerializer(data=data)
+
+
 #temperory user model till phone number verified
 class TempUserView(APIView):
+    throttle_classes = OTP_THROTTLES
 
     def post(self, request):
-        data = request.data
-        try:
-            t = TempUser.objects.get(data['phone_number'])
-            serializer = TempUserSerializer(t, data=data)
-
-        except Exception:
-            serializer = TempUserSerializer(data=data)
-
+        serializer = temp_user_serializer(request.data)
         if serializer.is_valid():
             serializer.save()
             return Response("otp sent", status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
     def get(self, request, ph_no):
-        data = TempUser.objects.get(phone_number=ph_no)
-        diff = datetime.now(timezone.utc) - data.date
-        if diff.seconds > 20:
-            data.otp = "1234"  # just a type of signal
-            data.save()
-            return Response("resend", status=status.HTTP_202_ACCEPTED)
-        else:
+        if not otp.can_resend(otp.SIGNUP, ph_no):
+            return Response("no otp to resend, signup again", status=status.HTTP_404_NOT_FOUND)
+        code = otp.issue(otp.SIGNUP, ph_no)
+        if code is None:
             return Response("wait", status=status.HTTP_200_OK)
+        send_sms.delay(ph_no, otp_content(code))
+        return Response("resend", status=status.HTTP_202_ACCEPTED)
 
 
 # otp verify and tranfers user data,email verification if provided
 class VerifyOtpView(APIView):
     def post(self, request):
         data_receive = request.data
-        data = TempUser.objects.get(phone_number=data_receive['phone_number'])
-        diff = datetime.now(timezone.utc) - data.date
-        if diff.seconds < 50:
-            if data_receive["otp"] == data.otp:
-                user = User.objects.create_user(username=data.phone_number, email=data.email,
-                                                password=data.password, first_name=data.first_name,
-                                                last_name=data.last_name)
-                user.save()
-                if user.email:
-                    current_site = get_current_site(request)
-                    MailVerification(user, current_site)
+        result = otp.check(otp.SIGNUP, data_receive['phone_number'], data_receive['otp'])
+        if result == otp.VALID:
+            data = TempUser.objects.get(phone_number=data_receive['phone_number'])
+            user = User.objects.create_user(username=data.phone_number, email=data.email,
+                                            password=data.password, first_name=data.first_name,
+                                            last_name=data.last_name)
+            user.save()
+            if user.email:
+                current_site = get_current_site(request)
+                MailVerification(user, current_site)
 
-                    #MailVerification(subject, html_content, receiver_email)
+                #MailVerification(subject, html_content, receiver_email)
 
-                    mail_otp = "please verify your mail also"
-                else:
-                    mail_otp = "it will be better if you also provide us your email address"
+                mail_otp = "please verify your mail also"
+            else:
+                mail_otp = "it will be better if you also provide us your email address"
 
-                x = get_tokens_for_user(user)
-                msg = "phone number verified " + mail_otp
-                x["message"] = msg
+            x = get_tokens_for_user(user)
+            msg = "phone number verified " + mail_otp
+            x["message"] = msg
 
-                data.delete()
+            data.delete()
 
-                return Response(x, status=status.HTTP_202_ACCEPTED)
+            return Response(x, status=status.HTTP_202_ACCEPTED)
+        if result == otp.INVALID:
             return Response("OTP incorrect", status=status.HTTP_200_OK)
         return Response("OTP expire", status=status.HTTP_200_OK)
 
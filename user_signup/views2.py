@@ -1,30 +1,29 @@
+from django.conf import settings
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework import status
-from .models import Profile
-from datetime import datetime, timezone
+from .models import otp_content
 from django.http import HttpResponse
 from django.contrib.sites.shortcuts import get_current_site
 from django.utils.encoding import force_bytes
 from django.utils.http import urlsafe_base64_decode
 from .token import account_activation_token
 from django.contrib.auth.models import User
-from braodcaster.sms import PrepareSms
 from django.core.exceptions import ObjectDoesNotExist
-import random
-from django.db.models import Q
 from django.utils.http import urlsafe_base64_encode
 from rest_framework.decorators import api_view
 from .token import get_tokens_for_user
-from braodcaster.tasks import send_parallel_mail
+from braodcaster.tasks import send_parallel_mail, send_sms
+from . import otp
+from .identity import get_user_by_identifier
+from .throttling import OTP_THROTTLES
 
 @api_view(['POST'])
 def otp_login_view(request):
     data = request.data
     try:
-        t = User.objects.get(Q(username=data['username']) | Q(email=data['username']))
-        diff = datetime.now(timezone.utc) - t.profile.date
-        if data['otp'] == t.profile.otp and diff.seconds < 5000:
+        t = get_user_by_identifier(data['username'])
+        if otp.check(otp.ACCOUNT, t.pk, data['otp']) == otp.VALID:
             x = get_tokens_for_user(t)
             return Response(x, status=status.HTTP_202_ACCEPTED)
         else:
@@ -58,9 +57,8 @@ class PasswordResetOtpVerifyView(APIView):
     def post(self, request):
         data = request.data
         try:
-            t = User.objects.get(Q(username=data['username']) | Q(email=data['username']))
-            diff = datetime.now(timezone.utc) - t.profile.date
-            if data['otp'] == t.profile.otp and diff.seconds < 50:
+            t = get_user_by_identifier(data['username'])
+            if otp.check(otp.ACCOUNT, t.pk, data['otp'], max_age=settings.OTP_TTL) == otp.VALID:
                 token = account_activation_token.make_token(t)
                 domain = get_current_site(request).domain
                 uid = urlsafe_base64_encode(force_bytes(t.pk))
@@ -77,31 +75,21 @@ class PasswordResetOtpVerifyView(APIView):
 
 # password reset ---------->
 class PasswordResetView(APIView):
-
-    def __init__(self, **kwargs):
-        super().__init__(**kwargs)
-        self.otp = random.randrange(10101, 909090)
+    throttle_classes = OTP_THROTTLES
 
     def post(self, request, medium):
         data = request.data
-        t = User.objects.get(Q(username=data['username']) | Q(email=data['username']))
+        t = get_user_by_identifier(data['username'])
         if medium == 'sms':
-            content = "verification code is: " + str(self.otp) + "\nthis code will valid for only 45 secs"
-            try:
-                PrepareSms(data['username'], content)
-                Profile.objects.update_or_create(user=t, defaults={'user': t, 'otp': self.otp})
-            except ObjectDoesNotExist:
-                pass
+            code = otp.issue(otp.ACCOUNT, t.pk)
+            if code is not None:
+                send_sms.delay(data['username'], otp_content(code))
             return Response("otp send to your number ,if not receive please check mobile number entered",
                             status=status.HTTP_200_OK)
 
         elif medium == 'email':
-            try:
-                content = str(
-                    "<p>verification code is: " + str(self.otp) + "\nthis code will valid for only 45 secs</p>")
-                send_parallel_mail.delay("Resset Your Account", content, data['username'])
-                Profile.objects.update_or_create(user=t, defaults={'user': t, 'otp': self.otp})
-            except ObjectDoesNotExist:
-                pass
+            code = otp.issue(otp.ACCOUNT, t.pk)
+            if code is not None:
+                send_parallel_mail.delay("Resset Your Account", "<p>" + otp_content(code) + "</p>", data['username'])
             return Response("otp send to your email ,if not receive please check email entered",
                             status=status.HTTP_200_OK)